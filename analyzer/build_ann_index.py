@@ -0,0 +1,279 @@
+"""
+build_ann_index.py
+------------------
+오프라인 ANN 인덱스 빌더 + recall/지연시간 벤치마크 CLI
+- 기존 Flat 인덱스({base_name}.faiss)에서 임베딩을 복원해 IVF-Flat / IVF-PQ / HNSW / SQ8 변형을 빌드
+- 실제 RAG 쿼리(build_dual_queries) 기준으로 exact 검색 대비 recall@k, 단건 검색 p50/p99 측정
+- 선택된 인덱스는 {base_name}.ann.faiss 로 기존 파일 옆에 저장 → 레지스트리가 자동으로 우선 로드
+
+사용 예:
+    python -m analyzer.build_ann_index --folder analyzer/vector_dbs/shared --base-name marketing_segments
+    python -m analyzer.build_ann_index --folder analyzer/vector_dbs/v3 --base-name marketing_reports \\
+        --variants hnsw,sq8 --min-recall 0.97 --write
+"""
+
+import os
+import json
+import time
+import math
+import argparse
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import faiss
+
+from analyzer.metadata_store import load_metadata_eager
+from analyzer.vector_registry import vector_db_paths, ann_index_path, ann_stale_path
+
+VARIANTS = ("ivf_flat", "ivf_pq", "hnsw", "sq8")
+NPROBE_GRID = (1, 2, 4, 8, 16, 32, 64, 128)
+EF_SEARCH_GRID = (16, 32, 64, 128, 256)
+
+
+# ------------------------------------------------
+# 원본 벡터 / 쿼리 준비
+# ------------------------------------------------
+def load_flat_vectors(index_path: str) -> Tuple[np.ndarray, int, Optional[np.ndarray]]:
+    """(벡터, metric, id 배열) — vector_store.py 로 증분 갱신된 ID 매핑 인덱스면 id 도 반환 (아니면 None)"""
+    outer = faiss.read_index(index_path)  # 내부 인덱스는 outer 가 소유 → 끝까지 참조 유지
+    index, ids = outer, None
+    if isinstance(outer, faiss.IndexIDMap):
+        ids = faiss.vector_to_array(outer.id_map).astype(np.int64)
+        index = faiss.downcast_index(outer.index)
+    if not isinstance(index, faiss.IndexFlat):
+        raise ValueError(f"exact 기준이 될 Flat 인덱스가 아닙니다: {type(index).__name__}")
+    return index.reconstruct_n(0, index.ntotal), index.metric_type, ids
+
+
+def rag_query_vectors(meta_path: str, mode: str, n_queries: int, seed: int = 0) -> np.ndarray:
+    """메타데이터의 store_code 로 실제 RAG 쿼리를 만들어 엔진과 같은 임베더로 인코딩 (쿼리 캐시는 거치지 않음)"""
+    from analyzer import rag_engine
+
+    model = rag_engine.wait_for_embedder(timeout=None)
+    if model is None:
+        raise RuntimeError(f"임베더 로드 실패: {rag_engine.get_embedder_status()['error']} (--synthetic 사용 가능)")
+
+    rng = np.random.default_rng(seed)
+    codes = sorted({str(r["store_code"]) for r in load_metadata_eager(meta_path) if r.get("store_code")})
+    if not codes:
+        codes = ["UNKNOWN"]
+    picked = rng.choice(codes, size=min(n_queries, len(codes)), replace=False)
+    queries = []
+    for code in picked:
+        queries.extend(rag_engine.build_dual_queries(str(code), mode))
+    queries = list(dict.fromkeys(queries))[:max(n_queries, 1)]
+    # 벤치마크 쿼리는 서비스 쿼리 임베딩 캐시에 남기지 않도록 모델로 직접 인코딩
+    return np.asarray(model.encode(queries, normalize_embeddings=True, batch_size=32), dtype=np.float32)
+
+
+def synthetic_query_vectors(xb: np.ndarray, n_queries: int, seed: int = 0) -> np.ndarray:
+    """임베더 없이 돌릴 때: 코퍼스 벡터에 노이즈를 섞어 정규화한 근사 쿼리"""
+    rng = np.random.default_rng(seed)
+    picked = xb[rng.choice(len(xb), size=min(n_queries, len(xb)), replace=False)]
+    noisy = picked + rng.normal(scale=0.05, size=picked.shape).astype(np.float32)
+    faiss.normalize_L2(noisy)
+    return noisy
+
+
+# ------------------------------------------------
+# 변형 인덱스 빌드
+# ------------------------------------------------
+def _nlist_for(n: int) -> int:
+    # 클러스터당 최소 39개 학습 샘플 (faiss 권장) 을 만족하는 범위에서 4·sqrt(n)
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_params(d: int, n: int) -> Tuple[int, int]:
+    m = next(m for m in (64, 32, 16, 8, 4, 2, 1) if d % m == 0)
+    nbits = 8 if n >= 256 * 39 else max(4, min(8, int(math.log2(max(n // 39, 16)))))
+    return m, nbits
+
+
+def build_variant(name: str, xb: np.ndarray, metric: int, ids: Optional[np.ndarray] = None):
+    """ids 가 있으면 IndexIDMap2 로 감싸 같은 id 로 추가 (증분 갱신된 벡터DB 용)"""
+    n, d = xb.shape
+    if name == "ivf_flat":
+        quantizer = faiss.IndexFlat(d, metric)
+        index = faiss.IndexIVFFlat(quantizer, d, _nlist_for(n), metric)
+    elif name == "ivf_pq":
+        m, nbits = _pq_params(d, n)
+        quantizer = faiss.IndexFlat(d, metric)
+        index = faiss.IndexIVFPQ(quantizer, d, _nlist_for(n), m, nbits, metric)
+    elif name == "hnsw":
+        index = faiss.IndexHNSWFlat(d, 32, metric)
+        index.hnsw.efConstruction = 80
+    elif name == "sq8":
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, metric)
+    else:
+        raise ValueError(f"지원하지 않는 변형: {name}")
+    if not index.is_trained:
+        index.train(xb)
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(xb, ids)
+        return index
+    index.add(xb)
+    return index
+
+
+def _search_params(index) -> Tuple[Optional[str], Tuple[int, ...], Callable]:
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexIVF):
+        def set_nprobe(v):
+            index.nprobe = min(v, index.nlist)
+        return "nprobe", tuple(v for v in NPROBE_GRID if v <= index.nlist), set_nprobe
+    if isinstance(index, faiss.IndexHNSW):
+        def set_ef(v):
+            index.hnsw.efSearch = v
+        return "efSearch", EF_SEARCH_GRID, set_ef
+    return None, (0,), lambda v: None
+
+
+# ------------------------------------------------
+# 벤치마크
+# ------------------------------------------------
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray, k: int) -> float:
+    hits = sum(len(set(a[:k]) & set(e[:k])) for a, e in zip(approx_ids, exact_ids))
+    return hits / float(k * len(exact_ids))
+
+
+def latency_ms(index, xq: np.ndarray, k: int) -> Tuple[float, float]:
+    """실서비스처럼 nq=1 단건 검색을 반복해 p50/p99 (ms)"""
+    samples = []
+    for i in range(len(xq)):
+        t0 = time.perf_counter()
+        index.search(xq[i:i + 1], k)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return float(np.percentile(samples, 50)), float(np.percentile(samples, 99))
+
+
+def benchmark_variant(name: str, xb: np.ndarray, metric: int, xq: np.ndarray,
+                      exact_ids: np.ndarray, k: int, min_recall: float,
+                      ids: Optional[np.ndarray] = None) -> Dict:
+    t0 = time.time()
+    index = build_variant(name, xb, metric, ids)
+    build_s = time.time() - t0
+    param, grid, setter = _search_params(index)
+
+    # 목표 recall 을 만족하는 가장 작은 탐색 파라미터 선택 (못 맞추면 최대값)
+    chosen, recall = grid[-1], 0.0
+    for v in grid:
+        setter(v)
+        _, I = index.search(xq, k)
+        recall = recall_at_k(I, exact_ids, k)
+        chosen = v
+        if recall >= min_recall:
+            break
+    setter(chosen)
+    p50, p99 = latency_ms(index, xq, k)
+    return {
+        "variant": name,
+        "index": index,
+        "param": param,
+        "param_value": chosen if param else None,
+        "recall": round(recall, 4),
+        "p50_ms": round(p50, 3),
+        "p99_ms": round(p99, 3),
+        "build_s": round(build_s, 2),
+        "bytes": int(faiss.serialize_index(index).nbytes),
+    }
+
+
+def choose_variant(results: List[Dict], min_recall: float) -> Optional[Dict]:
+    ok = [r for r in results if r["recall"] >= min_recall]
+    if not ok:
+        return None
+    return min(ok, key=lambda r: (r["p99_ms"], r["bytes"]))
+
+
+def print_table(rows: List[Dict]) -> None:
+    print(f"{'variant':<10} {'param':<14} {'recall':>7} {'p50(ms)':>9} {'p99(ms)':>9} {'size(MB)':>9} {'build(s)':>9}")
+    for r in rows:
+        param = f"{r['param']}={r['param_value']}" if r.get("param") else "-"
+        print(
+            f"{r['variant']:<10} {param:<14} {r['recall']:>7.3f} {r['p50_ms']:>9.3f} "
+            f"{r['p99_ms']:>9.3f} {r['bytes'] / 1024 ** 2:>9.2f} {r['build_s']:>9.2f}"
+        )
+
+
+# ------------------------------------------------
+# CLI
+# ------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Flat 벡터DB 로부터 ANN 인덱스를 빌드하고 recall/지연시간을 비교합니다.")
+    parser.add_argument("--folder", required=True, help="벡터DB 폴더 (예: analyzer/vector_dbs/v3)")
+    parser.add_argument("--base-name", required=True, help="marketing_reports / marketing_segments")
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="쉼표 구분: " + ",".join(VARIANTS))
+    parser.add_argument("--k", type=int, default=10, help="recall@k 의 k")
+    parser.add_argument("--queries", type=int, default=200, help="벤치마크 쿼리 수")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="채택 최소 recall@k")
+    parser.add_argument("--select", default="auto", help="auto 또는 변형 이름")
+    parser.add_argument("--synthetic", action="store_true", help="임베더 없이 코퍼스 기반 근사 쿼리 사용")
+    parser.add_argument("--write", action="store_true", help="선택된 인덱스를 {base_name}.ann.faiss 로 저장")
+    args = parser.parse_args()
+
+    folder = os.path.abspath(args.folder)
+    index_path, meta_path = vector_db_paths(folder, args.base_name, prefer_ann=False)
+    xb, metric, ids = load_flat_vectors(index_path)
+    print(f"📦 원본: {os.path.basename(index_path)} ntotal={len(xb)} d={xb.shape[1]}")
+
+    if args.synthetic:
+        xq = synthetic_query_vectors(xb, args.queries)
+    else:
+        mode = os.path.basename(folder) if os.path.basename(folder) in ("v1", "v2", "v3") else "v1"
+        xq = rag_query_vectors(meta_path, mode, args.queries)
+    xq = np.ascontiguousarray(xq, dtype=np.float32)
+
+    exact = faiss.IndexFlat(xb.shape[1], metric)
+    exact.add(xb)
+    k = min(args.k, len(xb))
+    _, exact_ids = exact.search(xq, k)
+    if ids is not None:
+        exact_ids = ids[exact_ids]
+    ep50, ep99 = latency_ms(exact, xq, k)
+    rows = [{
+        "variant": "flat", "param": None, "param_value": None, "recall": 1.0,
+        "p50_ms": round(ep50, 3), "p99_ms": round(ep99, 3), "build_s": 0.0,
+        "bytes": int(xb.nbytes),
+    }]
+
+    results = []
+    for name in [v.strip() for v in args.variants.split(",") if v.strip()]:
+        try:
+            results.append(benchmark_variant(name, xb, metric, xq, exact_ids, k, args.min_recall, ids))
+        except (RuntimeError, ValueError) as e:
+            print(f"⚠️ {name} 빌드 실패: {e}")
+    print_table(rows + results)
+
+    if args.select == "auto":
+        chosen = choose_variant(results, args.min_recall)
+    else:
+        chosen = next((r for r in results if r["variant"] == args.select), None)
+    if chosen is None:
+        print(f"❌ recall≥{args.min_recall} 을 만족하는 변형이 없습니다. Flat 인덱스를 유지합니다.")
+        return
+    print(f"🏆 선택: {chosen['variant']} (recall={chosen['recall']}, p99={chosen['p99_ms']}ms)")
+
+    if args.write:
+        out_path = ann_index_path(folder, args.base_name)
+        faiss.write_index(chosen["index"], out_path)
+        stale = ann_stale_path(folder, args.base_name)
+        if os.path.exists(stale):
+            os.remove(stale)
+        report = {
+            "source": os.path.basename(index_path),
+            "k": k,
+            "queries": len(xq),
+            "min_recall": args.min_recall,
+            "chosen": chosen["variant"],
+            "results": [{key: v for key, v in r.items() if key != "index"} for r in rows + results],
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with open(f"{os.path.splitext(out_path)[0]}.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 저장 완료: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+build_columnar_metadata.py
+--------------------------
+벡터DB 메타데이터 JSONL → 컬럼형(*_metadata.columns.bin) 변환 + 로드 시간/메모리 벤치마크 CLI
+- 변환: vector_dbs 아래 *_metadata.jsonl 전체(또는 --folder 지정 폴더)를 컬럼형 파일로 저장
+  (JSONL 은 그대로 원본으로 유지 — 컬럼형 파일은 JSONL 지문(size, mtime)을 기록해 오래되면 자동 무시)
+- 벤치마크: 형식별로 새 프로세스에서 로드해 비교
+  · jsonl    : 전체 파싱 list[dict] (기존 기본값)
+  · offsets  : 오프셋 사이드카 + mmap 지연 파싱 (RAG_VECTOR_MMAP=1)
+  · columnar : 컬럼형 mmap (RAG_METADATA_FORMAT=columnar)
+  측정 항목: 로드 시간, 전용 메모리(RssAnon) / 파일 매핑 메모리(RssFile) 증가량,
+            store_code 역색인 구축 시간, 임의 행 1건 materialize p50/p99(µs)
+- 서비스에서 사용: RAG_METADATA_FORMAT=columnar (파일이 없으면 레지스트리가 로드 시 자동 변환)
+
+사용 예:
+    python -m analyzer.build_columnar_metadata
+    python -m analyzer.build_columnar_metadata --folder analyzer/vector_dbs/v3 --bench
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import subprocess
+from typing import Any, Dict, List
+
+import numpy as np
+
+from analyzer.metadata_store import (
+    ColumnarMetadata,
+    JsonlOffsetMetadata,
+    columnar_path_for,
+    load_metadata_eager,
+    write_columnar,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VECTOR_DB_DIR = os.path.join(ROOT, "analyzer", "vector_dbs")
+FORMATS = ("jsonl", "offsets", "columnar")
+
+
+def find_metadata_files(folder: str = VECTOR_DB_DIR) -> List[str]:
+    return sorted(glob.glob(os.path.join(folder, "**", "*_metadata.jsonl"), recursive=True))
+
+
+def convert(meta_path: str) -> Dict[str, Any]:
+    t0 = time.time()
+    out = write_columnar(meta_path)
+    return {
+        "source": os.path.relpath(meta_path, ROOT),
+        "jsonl_mb": round(os.path.getsize(meta_path) / 1024 ** 2, 2),
+        "columnar_mb": round(os.path.getsize(out) / 1024 ** 2, 2),
+        "seconds": round(time.time() - t0, 2),
+    }
+
+
+# ------------------------------------------------
+# 벤치마크 (형식별 별도 프로세스 — 앞선 로드가 메모리 측정에 섞이지 않도록)
+# ------------------------------------------------
+def _rss_kb() -> Dict[str, int]:
+    """/proc/self/status 의 RssAnon(전용) / RssFile(파일 매핑) (kB). 리눅스 외 환경은 0"""
+    out = {"RssAnon": 0, "RssFile": 0}
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                key = line.split(":", 1)[0]
+                if key in out:
+                    out[key] = int(line.split()[1])
+    except OSError:
+        pass
+    return out
+
+
+def bench_one(fmt: str, meta_path: str, samples: int = 1000) -> Dict[str, Any]:
+    from analyzer.vector_registry import _build_store_rows
+
+    before = _rss_kb()
+    t0 = time.perf_counter()
+    if fmt == "jsonl":
+        metadata = load_metadata_eager(meta_path)
+    elif fmt == "offsets":
+        metadata = JsonlOffsetMetadata(meta_path)
+    elif fmt == "columnar":
+        metadata = ColumnarMetadata(columnar_path_for(meta_path))
+    else:
+        raise ValueError(f"지원하지 않는 형식: {fmt}")
+    load_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    store_rows = _build_store_rows(metadata)
+    index_s = time.perf_counter() - t0
+    after = _rss_kb()
+
+    rng = np.random.default_rng(0)
+    picks = rng.integers(0, len(metadata), size=min(samples, len(metadata))) if len(metadata) else []
+    lat = []
+    for i in picks:
+        t0 = time.perf_counter()
+        row = metadata[int(i)]
+        _ = row.get("text")
+        lat.append((time.perf_counter() - t0) * 1e6)
+
+    return {
+        "format": fmt,
+        "rows": len(metadata),
+        "stores": len(store_rows),
+        "load_ms": round(load_s * 1000, 2),
+        "store_index_ms": round(index_s * 1000, 2),
+        "rss_anon_mb": round((after["RssAnon"] - before["RssAnon"]) / 1024, 2),
+        "rss_file_mb": round((after["RssFile"] - before["RssFile"]) / 1024, 2),
+        "row_p50_us": round(float(np.percentile(lat, 50)), 2) if lat else 0.0,
+        "row_p99_us": round(float(np.percentile(lat, 99)), 2) if lat else 0.0,
+    }
+
+
+# analyzer/__init__ 은 rag_engine(임베더 백그라운드 로드)·experiments 까지 import 하므로,
+# 측정 프로세스에서는 패키지 껍데기만 등록해 메타데이터 계층만 올린다.
+_BENCH_ONE = (
+    "import sys, types, json; "
+    "pkg = types.ModuleType('analyzer'); pkg.__path__ = [{pkg_dir!r}]; sys.modules['analyzer'] = pkg; "
+    "from analyzer.build_columnar_metadata import bench_one; "
+    "print(json.dumps(bench_one({fmt!r}, {meta_path!r})))"
+)
+
+
+def benchmark(meta_path: str) -> List[Dict[str, Any]]:
+    rows = []
+    pkg_dir = os.path.dirname(os.path.abspath(__file__))
+    for fmt in FORMATS:
+        code = _BENCH_ONE.format(pkg_dir=pkg_dir, fmt=fmt, meta_path=meta_path)
+        proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"⚠️ {fmt} 벤치마크 실패: {proc.stderr.strip()[-500:]}")
+            continue
+        rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return rows
+
+
+def print_table(rows: List[Dict[str, Any]]) -> None:
+    cols = ["format", "rows", "load_ms", "store_index_ms", "rss_anon_mb", "rss_file_mb", "row_p50_us", "row_p99_us"]
+    print(" | ".join(f"{c:>14}" for c in cols))
+    for r in rows:
+        print(" | ".join(f"{str(r.get(c)):>14}" for c in cols))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="메타데이터 JSONL → 컬럼형 변환 + 형식별 로드 시간/메모리 벤치마크")
+    parser.add_argument("--folder", default=VECTOR_DB_DIR, help="검색할 벡터DB 폴더 (기본 analyzer/vector_dbs 전체)")
+    parser.add_argument("--bench", action="store_true", help="변환 후 jsonl / offsets / columnar 비교")
+    args = parser.parse_args()
+
+    files = find_metadata_files(os.path.abspath(args.folder))
+    if not files:
+        print(f"❌ *_metadata.jsonl 파일이 없습니다: {args.folder}")
+        return
+    for meta_path in files:
+        print(f"🗂️ 변환 완료: {convert(meta_path)}")
+        if args.bench:
+            rows = benchmark(meta_path)
+            print_table(rows)
+            report_path = f"{os.path.splitext(columnar_path_for(meta_path))[0]}.bench.json"
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "source": os.path.basename(meta_path),
+                    "results": rows,
+                    "measured_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+bulk_runner.py
+--------------
+체크포인트 기반 대량 RAG 생성 러너 (generate_rag_summary 래퍼)
+- 작업 단위: (run 이름, 매장 코드, 모드) → SQLite 에 상태 기록
+  pending → running → done(결과 JSON) / failed(오류 메시지, 시도 횟수)
+- 재실행: 같은 --run 이름이면 done 은 건너뛰고 pending 부터 이어서 처리
+  (중단 시점에 running 으로 남은 항목은 시작할 때 pending 으로 되돌림)
+- --retry-failed: failed 항목만 pending 으로 되돌려 다시 처리
+- 동시 실행: --concurrency 개까지만 요청을 띄우고, 하나 끝날 때마다 다음 항목 투입
+  (Gemini 호출 자체는 gemini_client 공용 리미터의 RPM/TPM/동시 실행 상한을 그대로 따름)
+- 진행 로그: 완료 수 / 처리량(건/분) / 예상 남은 시간(ETA)
+- 매장 목록 조회(discover_stores)와 동시 실행 루프(run_items)는 야간 사전 생성(precompute.py)과 공용
+
+실행:
+    python -m analyzer.bulk_runner --run nightly-1017 --modes v1,v2,v3 --concurrency 8
+    python -m analyzer.bulk_runner --run nightly-1017 --retry-failed
+    python -m analyzer.bulk_runner --run nightly-1017 --status
+"""
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.getenv("RAG_BULK_DB_PATH", os.path.join(ROOT, ".cache", "rag_bulk_runs.sqlite3"))
+DEFAULT_CONCURRENCY = int(os.getenv("RAG_BULK_CONCURRENCY", "0"))     # 0 → RAG_GEMINI_MAX_IN_FLIGHT
+PROGRESS_EVERY = float(os.getenv("RAG_BULK_PROGRESS_SECONDS", "10"))
+DEFAULT_MODES = ("v1", "v2", "v3")
+
+STATUSES = ("pending", "running", "done", "failed")
+
+
+# ------------------------------------------------
+# 체크포인트 저장소
+# ------------------------------------------------
+class CheckpointStore:
+    """(run, store_code, mode) 별 상태. 모든 쓰기는 즉시 commit → 프로세스가 죽어도 완료분은 보존."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS bulk_items ("
+            " run TEXT, store_code TEXT, mode TEXT, status TEXT, attempts INTEGER DEFAULT 0,"
+            " error TEXT, result TEXT, seconds REAL, updated_at REAL,"
+            " PRIMARY KEY (run, store_code, mode))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS bulk_items_status ON bulk_items (run, status)")
+        self._db.commit()
+
+    def _execute(self, sql: str, params: Sequence = ()) -> sqlite3.Cursor:
+        with self._lock:
+            cur = self._db.execute(sql, params)
+            self._db.commit()
+            return cur
+
+    def add_items(self, run: str, items: Iterable[Tuple[str, str]]) -> int:
+        """새 항목만 pending 으로 추가 (이미 있는 항목의 상태는 건드리지 않음). 추가된 수 반환"""
+        rows = [(run, str(code), mode, "pending", time.time()) for code, mode in items]
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO bulk_items (run, store_code, mode, status, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+            return self._db.total_changes - before
+
+    def reset(self, run: str, from_status: str) -> int:
+        cur = self._execute(
+            "UPDATE bulk_items SET status = 'pending', updated_at = ? WHERE run = ? AND status = ?",
+            (time.time(), run, from_status),
+        )
+        return cur.rowcount
+
+    def pending(self, run: str) -> List[Tuple[str, str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT store_code, mode FROM bulk_items WHERE run = ? AND status = 'pending'"
+                " ORDER BY mode, store_code",
+                (run,),
+            ).fetchall()
+
+    def mark_running(self, run: str, store_code: str, mode: str) -> None:
+        self._execute(
+            "UPDATE bulk_items SET status = 'running', attempts = attempts + 1, updated_at = ?"
+            " WHERE run = ? AND store_code = ? AND mode = ?",
+            (time.time(), run, store_code, mode),
+        )
+
+    def mark_done(self, run: str, store_code: str, mode: str, result: Dict[str, Any], seconds: float) -> None:
+        self._execute(
+            "UPDATE bulk_items SET status = 'done', error = NULL, result = ?, seconds = ?, updated_at = ?"
+            " WHERE run = ? AND store_code = ? AND mode = ?",
+            (json.dumps(result, ensure_ascii=False), seconds, time.time(), run, store_code, mode),
+        )
+
+    def mark_failed(self, run: str, store_code: str, mode: str, error: str, seconds: float) -> None:
+        self._execute(
+            "UPDATE bulk_items SET status = 'failed', error = ?, seconds = ?, updated_at = ?"
+            " WHERE run = ? AND store_code = ? AND mode = ?",
+            (error[:2000], seconds, time.time(), run, store_code, mode),
+        )
+
+    def counts(self, run: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) FROM bulk_items WHERE run = ? GROUP BY status", (run,)
+            ).fetchall()
+        out = {s: 0 for s in STATUSES}
+        out.update(dict(rows))
+        return out
+
+    def failures(self, run: str, limit: int = 20) -> List[Tuple[str, str, int, str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT store_code, mode, attempts, error FROM bulk_items"
+                " WHERE run = ? AND status = 'failed' ORDER BY updated_at DESC LIMIT ?",
+                (run, limit),
+            ).fetchall()
+
+    def results(self, run: str) -> Iterable[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT store_code, mode, result FROM bulk_items WHERE run = ? AND status = 'done'"
+                " ORDER BY mode, store_code",
+                (run,),
+            ).fetchall()
+        for code, mode, result in rows:
+            yield {"store_code": code, "mode": mode, **json.loads(result)}
+
+
+# ------------------------------------------------
+# 진행률 (처리량 / ETA)
+# ------------------------------------------------
+class Progress:
+    def __init__(self, total: int, every: float = PROGRESS_EVERY, label: str = "Bulk"):
+        self.total = total
+        self.label = label
+        self.every = every
+        self.done = 0
+        self.failed = 0
+        self.t0 = time.time()
+        self._last = 0.0
+
+    def update(self, ok: bool, force: bool = False) -> None:
+        if ok:
+            self.done += 1
+        else:
+            self.failed += 1
+        now = time.time()
+        if force or now - self._last >= self.every or self.done + self.failed == self.total:
+            self._last = now
+            print(f"⏱️ [{self.label}] {self.line()}")
+
+    def line(self) -> str:
+        finished = self.done + self.failed
+        elapsed = time.time() - self.t0
+        rate = finished / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - finished
+        eta = remaining / rate if rate > 0 else float("inf")
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "-"
+        return (
+            f"{finished}/{self.total} (완료 {self.done}, 실패 {self.failed}) "
+            f"| {rate * 60:.1f}건/분 | 경과 {elapsed:.0f}s | ETA {eta_text}"
+        )
+
+
+# ------------------------------------------------
+# 공용 배치 실행 (bulk_runner / precompute)
+# ------------------------------------------------
+def discover_stores(modes: Sequence[str], profile: Optional[str] = None,
+                    stores: Optional[Sequence[str]] = None, label: str = "Bulk") -> List[Tuple[str, str]]:
+    """모드별 리포트 벡터DB 의 store_code 전체 × 모드 (stores 를 주면 그 매장들 × 모드)"""
+    if stores:
+        return [(str(code), mode) for mode in modes for code in stores]
+    from analyzer.rag_engine import get_engine
+
+    engine = get_engine(profile)
+    items = []
+    for mode in modes:
+        try:
+            codes = sorted(engine.vector_entries(mode)[0].store_rows)
+        except FileNotFoundError as e:
+            print(f"⚠️ [{label}] {mode} 건너뜀: {e}")
+            continue
+        items += [(code, mode) for code in codes]
+    return items
+
+
+def run_items(items: Sequence[Tuple[str, str]], work: Callable[[str, str], str],
+              concurrency: int, label: str = "Bulk") -> Dict[str, int]:
+    """
+    (store_code, mode) 항목을 동시 concurrency 개까지만 띄워 work(code, mode) 로 처리하고 상태별 건수 반환.
+    work 는 상태 문자열을 반환하며 "failed" 또는 예외는 실패로 집계.
+    중단(Ctrl+C) 시 진행 중인 항목만 마무리하고 나머지는 투입하지 않는다.
+    """
+    progress = Progress(len(items), label=label)
+    counts: Dict[str, int] = {}
+
+    def _safe(code: str, mode: str) -> str:
+        try:
+            return work(code, mode)
+        except Exception as e:
+            print(f"❌ [{label}] {code} ({mode}) 예외: {type(e).__name__}: {e}")
+            return "failed"
+
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=label.lower())
+    in_flight = set()
+    it = iter(items)
+    try:
+        while True:
+            # 동시 실행 상한까지만 투입 — 중단 시 나머지는 그대로 남음
+            while len(in_flight) < concurrency:
+                nxt = next(it, None)
+                if nxt is None:
+                    break
+                in_flight.add(pool.submit(_safe, *nxt))
+            if not in_flight:
+                break
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                status = fut.result()
+                counts[status] = counts.get(status, 0) + 1
+                progress.update(status != "failed")
+    except KeyboardInterrupt:
+        print(f"🛑 [{label}] 중단 요청 — 진행 중 {len(in_flight)}건 완료 대기 후 종료")
+        for fut in in_flight:
+            fut.cancel()
+        raise
+    finally:
+        pool.shutdown(wait=True)
+    return counts
+
+
+# ------------------------------------------------
+# 실행
+# ------------------------------------------------
+def _default_generate(profile: Optional[str], top_k: int) -> Callable[[str, str], Dict[str, Any]]:
+    from analyzer.rag_engine import generate_rag_summary
+
+    def _generate(store_code: str, mode: str) -> Dict[str, Any]:
+        return generate_rag_summary(store_code, mode, top_k, profile=profile)
+    return _generate
+
+
+def run_bulk(run: str, items: Optional[Iterable[Tuple[str, str]]] = None,
+             concurrency: Optional[int] = None, retry_failed: bool = False,
+             generate: Optional[Callable[[str, str], Dict[str, Any]]] = None,
+             profile: Optional[str] = None, top_k: int = 5,
+             store: Optional[CheckpointStore] = None) -> Dict[str, int]:
+    """
+    items 를 run 에 등록(이미 있으면 무시)하고 pending 항목을 concurrency 개씩 처리.
+    generate(store_code, mode) 는 결과 dict 를 반환하며, "error" 키가 있거나 예외가 나면 failed 로 기록.
+    """
+    store = store or CheckpointStore()
+    if concurrency is None or concurrency <= 0:
+        from analyzer import gemini_client
+        concurrency = DEFAULT_CONCURRENCY or gemini_client.MAX_IN_FLIGHT
+    generate = generate or _default_generate(profile, top_k)
+
+    if items is not None:
+        added = store.add_items(run, items)
+        if added:
+            print(f"📥 [Bulk] '{run}' 에 {added}개 항목 추가")
+    stale = store.reset(run, "running")
+    if stale:
+        print(f"🔁 [Bulk] 중단된 항목 {stale}개를 pending 으로 복구")
+    if retry_failed:
+        print(f"🔁 [Bulk] 실패 항목 {store.reset(run, 'failed')}개 재시도")
+
+    queue = store.pending(run)
+    print(f"🚀 [Bulk] '{run}' 시작: 대기 {len(queue)}개 (concurrency={concurrency}) — {store.counts(run)}")
+
+    def _one(code: str, mode: str) -> str:
+        store.mark_running(run, code, mode)
+        t0 = time.time()
+        try:
+            result = generate(code, mode)
+        except Exception as e:
+            store.mark_failed(run, code, mode, f"{type(e).__name__}: {e}", time.time() - t0)
+            return "failed"
+        if "error" in result:
+            store.mark_failed(run, code, mode, str(result["error"]), time.time() - t0)
+            return "failed"
+        payload = {k: v for k, v in result.items() if k != "traceback"}
+        store.mark_done(run, code, mode, payload, time.time() - t0)
+        return "done"
+
+    # 중단 시 투입되지 않은 항목은 pending 그대로 → 같은 run 으로 재실행하면 이어서 처리
+    run_items(queue, _one, concurrency, label="Bulk")
+    counts = store.counts(run)
+    print(f"✅ [Bulk] '{run}' 종료: {counts}")
+    return counts
+
+
+def export_results(run: str, path: str, store: Optional[CheckpointStore] = None) -> int:
+    """done 항목 결과를 JSONL 로 내보내기"""
+    store = store or CheckpointStore()
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for row in store.results(run):
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="체크포인트 기반 대량 RAG 생성 (중단 후 재실행 시 이어서 처리)")
+    parser.add_argument("--run", required=True, help="실행 이름 (같은 이름으로 재실행하면 이어서 처리)")
+    parser.add_argument("--modes", default=",".join(DEFAULT_MODES), help="쉼표 구분 모드 (기본 v1,v2,v3)")
+    parser.add_argument("--stores", default=None, help="쉼표 구분 매장 코드 (기본: 모드별 리포트 벡터DB 전체)")
+    parser.add_argument("--stores-file", default=None, help="한 줄에 매장 코드 하나인 파일")
+    parser.add_argument("--profile", default=None, help="RagEngine 프로파일 (기본 RAG_PROFILE)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="동시 요청 수 (기본 RAG_BULK_CONCURRENCY, 0 이면 RAG_GEMINI_MAX_IN_FLIGHT)")
+    parser.add_argument("--retry-failed", action="store_true", help="failed 항목만 다시 처리")
+    parser.add_argument("--status", action="store_true", help="상태 요약과 최근 실패만 출력")
+    parser.add_argument("--export", default=None, help="done 결과를 JSONL 로 내보낼 경로")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="체크포인트 SQLite 경로")
+    args = parser.parse_args()
+
+    store = CheckpointStore(args.db)
+    if args.status:
+        print(f"📊 [Bulk] '{args.run}': {store.counts(args.run)}")
+        for code, mode, attempts, error in store.failures(args.run):
+            print(f"   ❌ {code} ({mode}) 시도 {attempts}회: {error}")
+        return
+    if args.export:
+        print(f"💾 [Bulk] {export_results(args.run, args.export, store)}건 → {args.export}")
+        return
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    codes = None
+    if args.stores:
+        codes = [s.strip() for s in args.stores.split(",") if s.strip()]
+    elif args.stores_file:
+        with open(args.stores_file, encoding="utf-8") as f:
+            codes = [line.strip() for line in f if line.strip()]
+
+    # 재실행 / 실패 재시도는 이미 등록된 항목만 처리 (매장 목록 재조회 불필요)
+    if codes is not None:
+        items = discover_stores(modes, stores=codes)
+    elif args.retry_failed or sum(store.counts(args.run).values()):
+        items = None
+    else:
+        items = discover_stores(modes, args.profile)
+
+    run_bulk(
+        args.run,
+        items=items,
+        concurrency=args.concurrency,
+        retry_failed=args.retry_failed,
+        profile=args.profile,
+        top_k=args.top_k,
+        store=store,
+    )
+
+
+if __name__ == "__main__":
+    main()
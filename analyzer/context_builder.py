@@ -0,0 +1,203 @@
+"""
+context_builder.py
+------------------
+토큰 예산 기반 RAG 컨텍스트 조립 (rag_engine 전용)
+- bge-m3 토크나이저(transformers)로 실제 토큰 수를 세어 모드별 예산 안에서만 청크를 채움
+  (토크나이저를 불러올 수 없으면 글자 수 기반 추정으로 폴백)
+- 우선순위: 매장 앵커 → 우리 매장 청크 → 유사 매장 청크 / 세그먼트 청크 (순위대로 번갈아)
+- 예산 경계에 걸린 청크는 문장 단위로 잘라 넣고, 이후 청크는 버림
+- 모드별 예산: RAG_CONTEXT_BUDGETS="v1:2000,v2:1500,v3:1500" (0 이면 무제한)
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from analyzer.embedder import EMBED_MODEL_NAME
+
+DEFAULT_BUDGETS = os.getenv("RAG_CONTEXT_BUDGETS", "v1:2000,v2:1500,v3:1500")
+DEFAULT_BUDGET = int(os.getenv("RAG_CONTEXT_DEFAULT_BUDGET", "2000"))
+
+REPORT_HEADER = "[매장 주요 분석 및 고객층 강화 데이터]"
+SEGMENT_HEADER = "[유사 매장 타겟 확장 전략 사례]"
+EMPTY_SECTION = "(데이터 없음)"
+
+# 문장 경계: 종결부호 뒤 공백 또는 줄바꿈
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?。])\s+|\n+")
+
+
+# ------------------------------------------------
+# 토크나이저 (지연 로드, 프로세스당 1회)
+# ------------------------------------------------
+_tokenizer = None
+_tokenizer_failed = False
+_tokenizer_lock = threading.Lock()
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_failed
+    if _tokenizer is not None or _tokenizer_failed:
+        return _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None and not _tokenizer_failed:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_NAME)
+            except Exception as e:
+                _tokenizer_failed = True
+                print(f"⚠️ [ContextBuilder] 토크나이저 로드 실패 → 글자 수 기반 추정 사용: {e}")
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        return len(text) // 2 + 1  # 한글 위주 보수적 추정 (gemini_client.estimate_tokens 와 동일 기준)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def parse_budgets(spec: str) -> Dict[str, int]:
+    """"v1:2000,v2:1500" → {"v1": 2000, "v2": 1500}"""
+    budgets = {}
+    for part in spec.split(","):
+        if ":" not in part:
+            continue
+        mode, value = part.split(":", 1)
+        try:
+            budgets[mode.strip()] = int(value)
+        except ValueError:
+            print(f"⚠️ [ContextBuilder] 예산 파싱 실패, 무시: {part.strip()}")
+    return budgets
+
+
+_budgets = parse_budgets(DEFAULT_BUDGETS)
+
+
+def budget_for_mode(mode: str) -> int:
+    return _budgets.get(mode, DEFAULT_BUDGET)
+
+
+def set_budget(mode: str, tokens: int) -> None:
+    """모드별 컨텍스트 예산 변경 (답변 품질 대비 튜닝용, 0 이면 무제한)"""
+    _budgets[mode] = int(tokens)
+
+
+# ------------------------------------------------
+# 조립
+# ------------------------------------------------
+@dataclass
+class BuiltContext:
+    text: str                  # 앵커 포함 전체 컨텍스트
+    retrieved_text: str        # 앵커 제외 (근사 중복 캐시 임베딩용)
+    tokens: int
+    budget: int
+    used: Dict[str, int] = field(default_factory=dict)
+    dropped: int = 0
+    truncated: bool = False
+
+    def info(self) -> Dict:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "used": dict(self.used),
+            "dropped": self.dropped,
+            "truncated": self.truncated,
+        }
+
+
+def _dedupe(chunks: List[str], seen: set) -> List[str]:
+    """청크 간 중복 라인 제거 (앞선 우선순위 청크가 이미 넣은 라인은 생략)"""
+    out = []
+    for chunk in chunks:
+        lines = []
+        for ln in chunk.splitlines():
+            if ln.strip() and ln in seen:
+                continue
+            seen.add(ln)
+            lines.append(ln)
+        text = "\n".join(lines).strip()
+        if text:
+            out.append(text)
+    return out
+
+
+def _truncate_to(text: str, limit: int) -> str:
+    """문장 단위로 limit 토큰 이내까지 자름 (한 문장도 안 들어가면 빈 문자열)"""
+    kept, used = [], 0
+    for sentence in _SENTENCE_SPLIT.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        cost = count_tokens(sentence) + 1
+        if used + cost > limit:
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept)
+
+
+def _interleave(a: List[Tuple[str, str]], b: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    out = []
+    for i in range(max(len(a), len(b))):
+        if i < len(a):
+            out.append(a[i])
+        if i < len(b):
+            out.append(b[i])
+    return out
+
+
+def build_context(anchor: str, own_chunks: List[str], similar_chunks: List[str],
+                  segment_chunks: List[str], budget: Optional[int] = None) -> BuiltContext:
+    """
+    우선순위대로 예산을 채워 섹션 구조([매장 ...] / [유사 매장 ...])를 유지한 컨텍스트를 만든다.
+    budget<=0 이면 전부 포함 (라인 중복 제거만 수행).
+    """
+    budget = DEFAULT_BUDGET if budget is None else budget
+    unlimited = budget <= 0
+    seen: set = set(anchor.splitlines()) if anchor else set()
+
+    # 섹션 머리글/구분자 비용을 먼저 차감
+    used_tokens = count_tokens(anchor) + count_tokens(REPORT_HEADER) + count_tokens(SEGMENT_HEADER) + 4
+    remaining = budget - used_tokens
+
+    ordered = [("own", c) for c in _dedupe(own_chunks, seen)]
+    similar = [("similar", c) for c in _dedupe(similar_chunks, seen)]
+    segments = [("segment", c) for c in _dedupe(segment_chunks, seen)]
+    ordered += _interleave(similar, segments)
+
+    picked: Dict[str, List[str]] = {"own": [], "similar": [], "segment": []}
+    dropped, truncated = 0, False
+    for i, (kind, chunk) in enumerate(ordered):
+        if unlimited:
+            picked[kind].append(chunk)
+            continue
+        cost = count_tokens(chunk) + 1  # 청크 구분자
+        if cost <= remaining:
+            picked[kind].append(chunk)
+            remaining -= cost
+            continue
+        part = _truncate_to(chunk, remaining)
+        if part:
+            picked[kind].append(part)
+            remaining -= count_tokens(part) + 1
+            truncated = True
+        dropped = len(ordered) - i - (1 if part else 0)
+        break
+
+    report_text = "\n\n".join(picked["own"] + picked["similar"]) or EMPTY_SECTION
+    segment_text = "\n\n".join(picked["segment"]) or EMPTY_SECTION
+    retrieved = f"{REPORT_HEADER}\n{report_text}\n\n{SEGMENT_HEADER}\n{segment_text}"
+    text = f"{anchor}\n{retrieved}" if anchor else retrieved
+    return BuiltContext(
+        text=text,
+        retrieved_text=retrieved,
+        tokens=count_tokens(text),
+        budget=budget,
+        used={k: len(v) for k, v in picked.items()},
+        dropped=dropped,
+        truncated=truncated,
+    )
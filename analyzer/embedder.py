@@ -0,0 +1,312 @@
+"""
+embedder.py
+-----------
+bge-m3 쿼리 임베더 백엔드 선택 + 패리티/성능 벤치마크
+- RAG_EMBEDDER_BACKEND = fp32 | int8 | onnx  (기본 fp32)
+  - fp32 : SentenceTransformer (PyTorch, CPU 기본)
+  - int8 : PyTorch 동적 양자화 (nn.Linear → qint8), 정확도 손실 작고 RSS/지연 감소
+  - onnx : ONNX Runtime (optimum 필요), CLS 풀링 + L2 정규화로 bge-m3 dense 출력 재현
+- RAG_EMBEDDER_DEVICE 로 PyTorch 백엔드 디바이스 지정 (기본 cpu, 예: mps / cuda)
+- RAG_EMBEDDER_SOCKET 지정 시 load_query_embedder 는 공유 임베딩 서버(embedding_server.py) 클라이언트 반환
+- EmbedderHandle: 백그라운드 로드 + 워밍업 + Event 기반 준비 게이트(타임아웃) + 상태 API
+
+벤치마크:
+    python -m analyzer.embedder --backends fp32,int8,onnx --sample 500
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+EMBED_MODEL_NAME = "BAAI/bge-m3"
+BACKENDS = ("fp32", "int8", "onnx")
+EMBEDDER_BACKEND = os.getenv("RAG_EMBEDDER_BACKEND", "fp32")
+EMBEDDER_DEVICE = os.getenv("RAG_EMBEDDER_DEVICE", "cpu")
+ONNX_MODEL_DIR = os.getenv("RAG_ONNX_MODEL_DIR")  # 미리 export 한 ONNX 폴더 (없으면 즉석 export)
+EMBEDDER_SOCKET = os.getenv("RAG_EMBEDDER_SOCKET")  # 공유 임베딩 서버 Unix 소켓 경로
+LOAD_RETRY_INTERVAL = float(os.getenv("RAG_EMBEDDER_RETRY_INTERVAL", "60"))
+
+
+# ------------------------------------------------
+# ONNX Runtime 백엔드
+# ------------------------------------------------
+class OnnxEmbedder:
+    """SentenceTransformer.encode 와 같은 호출 규약을 갖는 ONNX Runtime 임베더"""
+
+    def __init__(self, model_name: str = EMBED_MODEL_NAME, model_dir: str = ONNX_MODEL_DIR,
+                 max_length: int = 512):
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("onnx 백엔드는 optimum[onnxruntime] 설치가 필요합니다.") from e
+        source = model_dir or model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(source)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(source, export=model_dir is None)
+        self.max_length = max_length
+
+    def encode(self, sentences, normalize_embeddings: bool = True, batch_size: int = 32,
+               convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        out = []
+        for i in range(0, len(sentences), batch_size):
+            batch = self.tokenizer(
+                sentences[i:i + batch_size], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np",
+            )
+            hidden = self.model(**batch).last_hidden_state
+            hidden = hidden.numpy() if hasattr(hidden, "numpy") else np.asarray(hidden)
+            out.append(hidden[:, 0])  # bge-m3 dense = [CLS] 풀링
+        emb = np.vstack(out).astype(np.float32)
+        if normalize_embeddings:
+            emb /= np.linalg.norm(emb, axis=1, keepdims=True).clip(min=1e-12)
+        return emb
+
+
+# ------------------------------------------------
+# 백엔드 로더
+# ------------------------------------------------
+def load_embedder(backend: str = None, model_name: str = EMBED_MODEL_NAME, device: str = None):
+    backend = backend or EMBEDDER_BACKEND
+    device = device or EMBEDDER_DEVICE
+    if backend not in BACKENDS:
+        raise ValueError(f"지원하지 않는 임베더 백엔드: {backend} (가능: {', '.join(BACKENDS)})")
+
+    if backend == "onnx":
+        return OnnxEmbedder(model_name)
+
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "int8":
+        import torch
+
+        # 동적 양자화는 CPU 전용
+        model = SentenceTransformer(model_name, device="cpu")
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+    return SentenceTransformer(model_name, device=device)
+
+
+def load_query_embedder(backend: str = None):
+    """요청 경로용 임베더 — 공유 서버가 설정되어 있으면 원격 클라이언트, 아니면 프로세스 내 모델"""
+    if EMBEDDER_SOCKET:
+        from analyzer.embedding_server import RemoteEmbedder
+
+        return RemoteEmbedder(EMBEDDER_SOCKET)
+    return load_embedder(backend)
+
+
+def cache_model_key(backend: str = None, model_name: str = EMBED_MODEL_NAME) -> str:
+    """임베딩 캐시 키용 모델 식별자 — 백엔드별 벡터가 미세하게 다르므로 구분"""
+    return f"{model_name}:{backend or EMBEDDER_BACKEND}"
+
+
+# ------------------------------------------------
+# 임베더 수명주기 (로드 → 워밍업 → ready / failed)
+# ------------------------------------------------
+class EmbedderHandle:
+    """
+    임베더를 백그라운드 스레드에서 1회 로드하고, 요청 스레드는 wait(timeout) 으로만 기다린다.
+    로드 실패 시 바로 None 을 돌려주며, LOAD_RETRY_INTERVAL 이 지난 뒤 다음 start() 에서 재시도.
+    """
+
+    IDLE, LOADING, READY, FAILED = "idle", "loading", "ready", "failed"
+
+    def __init__(self, backend: str = None, loader: Callable = load_query_embedder,
+                 on_ready: Optional[Callable] = None, warmup_text: str = "warmup",
+                 warmup: Optional[Callable] = None, label: str = "임베딩 모델"):
+        self.backend = backend or EMBEDDER_BACKEND
+        self._loader = loader
+        self._on_ready = on_ready
+        self._warmup_text = warmup_text
+        self._warmup = warmup  # 임베더가 아닌 모델(cross-encoder 등)용 워밍업 함수
+        self.label = label
+        self._lock = threading.Lock()
+        self._done = threading.Event()  # ready 또는 failed 로 끝났을 때 set
+        self._model = None
+        self.state = self.IDLE
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+
+    def start(self) -> None:
+        """로드를 시작 (이미 진행 중/완료면 무시, 실패 후 재시도 간격이 지났으면 재시작)"""
+        with self._lock:
+            if self.state in (self.LOADING, self.READY):
+                return
+            if self.state == self.FAILED and time.time() - (self.finished_at or 0) < LOAD_RETRY_INTERVAL:
+                return
+            self.state = self.LOADING
+            self.error = None
+            self.started_at = time.time()
+            self._done.clear()
+        threading.Thread(target=self._run, name="embedder-loader", daemon=True).start()
+
+    def _run(self) -> None:
+        try:
+            print(f"🚀 [Init] {self.label} 백그라운드 로드 시작... (backend={self.backend})")
+            t0 = time.time()
+            model = self._loader(self.backend)
+            self.load_seconds = time.time() - t0
+            t1 = time.time()
+            if self._warmup is not None:
+                self._warmup(model)
+            else:
+                model.encode([self._warmup_text], normalize_embeddings=True)
+            self.warmup_seconds = time.time() - t1
+            if self._on_ready is not None:
+                self._on_ready(model)
+            with self._lock:
+                self._model = model
+                self.state = self.READY
+            print(
+                f"✅ [Init] {self.label} 준비 완료 "
+                f"(로드 {self.load_seconds:.2f}s, 워밍업 {self.warmup_seconds:.2f}s)"
+            )
+        except Exception as e:
+            with self._lock:
+                self.state = self.FAILED
+                self.error = f"{type(e).__name__}: {e}"
+            print(f"❌ {self.label} 로드 실패:", e)
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    @property
+    def model(self):
+        return self._model
+
+    def wait(self, timeout: Optional[float] = None):
+        """준비된 임베더 반환. timeout 내에 준비되지 않거나 실패했으면 None"""
+        if self._model is not None:
+            return self._model
+        self.start()
+        self._done.wait(timeout)
+        return self._model
+
+    def status(self) -> Dict:
+        return {
+            "state": self.state,
+            "backend": self.backend,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+        }
+
+
+# ------------------------------------------------
+# 벤치마크 (백엔드별 별도 프로세스에서 측정)
+# ------------------------------------------------
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def _measure_backend(backend: str, corpus: List[str], queries: List[str]) -> Dict:
+    rss0 = _rss_mb()
+    t0 = time.time()
+    model = load_embedder(backend)
+    load_s = time.time() - t0
+    model.encode(queries[:1], normalize_embeddings=True)  # 워밍업
+
+    lat = []
+    for q in queries:
+        t = time.perf_counter()
+        model.encode([q], normalize_embeddings=True)
+        lat.append((time.perf_counter() - t) * 1000)
+
+    t = time.time()
+    corpus_emb = np.asarray(model.encode(corpus, normalize_embeddings=True, batch_size=32), dtype=np.float32)
+    corpus_s = time.time() - t
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "rss_mb": round(_rss_mb() - rss0, 1),
+        "query_p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "query_p99_ms": round(float(np.percentile(lat, 99)), 2),
+        "corpus_docs_per_s": round(len(corpus) / corpus_s, 1) if corpus_s else None,
+        "embeddings": corpus_emb,
+    }
+
+
+def _sample_corpus(n: int, seed: int = 0) -> List[str]:
+    from analyzer.metadata_store import load_metadata_eager
+
+    base = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_dbs")
+    texts = []
+    for root, _, files in os.walk(base):
+        for fn in files:
+            if fn.endswith("_metadata.jsonl"):
+                texts.extend(r.get("text", "") for r in load_metadata_eager(os.path.join(root, fn)))
+    texts = [t for t in texts if t]
+    rng = np.random.default_rng(seed)
+    idx = rng.choice(len(texts), size=min(n, len(texts)), replace=False)
+    return [texts[i] for i in idx]
+
+
+def run_benchmark(backends: List[str], sample: int, n_queries: int) -> List[Dict]:
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    corpus = _sample_corpus(sample)
+    intents = ["고객 분석, 주요 고객층", "재방문율, 리텐션", "문제 진단, 개선 아이디어"]
+    queries = [f"매장{i:04d} 매장의 {intents[i % 3]} 및 주 고객층 강화 전략" for i in range(n_queries)]
+
+    # RSS 를 백엔드별로 분리 측정하기 위해 spawn 프로세스 1개씩 사용
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for backend in ["fp32"] + [b for b in backends if b != "fp32"]:
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                results.append(pool.submit(_measure_backend, backend, corpus, queries).result())
+        except Exception as e:
+            print(f"⚠️ {backend} 측정 실패: {e}")
+
+    ref = next((r["embeddings"] for r in results if r["backend"] == "fp32"), None)
+    for r in results:
+        emb = r.pop("embeddings")
+        if ref is not None:
+            cos = np.sum(emb * ref, axis=1)
+            r["cos_mean"] = round(float(cos.mean()), 5)
+            r["cos_min"] = round(float(cos.min()), 5)
+            r["cos_p1"] = round(float(np.percentile(cos, 1)), 5)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="bge-m3 임베더 백엔드별 fp32 패리티 및 지연/RSS 벤치마크")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="쉼표 구분: " + ",".join(BACKENDS))
+    parser.add_argument("--sample", type=int, default=500, help="패리티 측정용 메타데이터 코퍼스 샘플 수")
+    parser.add_argument("--queries", type=int, default=50, help="단건 쿼리 지연 측정 횟수")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    rows = run_benchmark(backends, args.sample, args.queries)
+    print(f"{'backend':<8} {'load(s)':>8} {'RSS(MB)':>8} {'q p50':>8} {'q p99':>8} {'docs/s':>8} {'cos mean':>9} {'cos min':>9}")
+    for r in rows:
+        print(
+            f"{r['backend']:<8} {r['load_s']:>8} {r['rss_mb']:>8} {r['query_p50_ms']:>8} "
+            f"{r['query_p99_ms']:>8} {r['corpus_docs_per_s']:>8} {r.get('cos_mean', '-'):>9} {r.get('cos_min', '-'):>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
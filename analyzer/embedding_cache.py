@@ -0,0 +1,174 @@
+"""
+embedding_cache.py
+------------------
+쿼리 임베딩 캐시 (모델명, 정규화 텍스트) → 벡터
+- 1차: 프로세스 내 LRU (OrderedDict)
+- 2차: SQLite 디스크 계층 — 재시작 후에도 유지
+- 상수 쿼리는 기동 시 precompute() 로 미리 채워 첫 요청부터 히트
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.getenv(
+    "RAG_EMBED_CACHE_PATH", os.path.join(ROOT, ".cache", "query_embeddings.sqlite3")
+)
+DEFAULT_MAX_ITEMS = int(os.getenv("RAG_EMBED_CACHE_SIZE", "4096"))
+
+
+def normalize_query(text: str) -> str:
+    """공백/유니코드 정규화 — 표기만 다른 동일 쿼리를 같은 키로 묶음"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class QueryEmbeddingCache:
+    """스레드 안전 2계층 임베딩 캐시. db_path=None 이면 메모리 계층만 사용."""
+
+    def __init__(self, model_name: str, max_items: int = DEFAULT_MAX_ITEMS,
+                 db_path: Optional[str] = DEFAULT_CACHE_PATH):
+        self.model_name = model_name
+        self.max_items = max_items
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "encode_seconds": 0.0}
+        if db_path:
+            self._db = self._open_db(db_path)
+
+    def set_model_name(self, model_name: str) -> None:
+        """실제 로드된 임베더 기준으로 키 갱신 (예: 원격 서버가 보고한 백엔드). 바뀌면 메모리 계층 비움"""
+        with self._lock:
+            if model_name == self.model_name:
+                return
+            self.model_name = model_name
+            self._lru.clear()
+
+    # ------------------------------------------------
+    # 디스크 계층
+    # ------------------------------------------------
+    @staticmethod
+    def _open_db(db_path: str):
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT, text TEXT, dim INTEGER,"
+                " vector BLOB, created_at REAL)"
+            )
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            print(f"⚠️ [EmbedCache] 디스크 캐시 비활성화: {e}")
+            return None
+
+    def _key(self, text: str, normalize: bool) -> str:
+        raw = f"{self.model_name}\0{int(normalize)}\0{normalize_query(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).copy()
+
+    def _disk_put(self, items: List[tuple]) -> None:
+        if self._db is None or not items:
+            return
+        try:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (key, self.model_name, normalize_query(text), int(vec.shape[0]),
+                     vec.astype(np.float32).tobytes(), time.time())
+                    for key, text, vec in items
+                ],
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ [EmbedCache] 디스크 저장 실패: {e}")
+
+    # ------------------------------------------------
+    # 메모리 계층
+    # ------------------------------------------------
+    def _lru_put(self, key: str, vec: np.ndarray) -> None:
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def get(self, text: str, normalize: bool = True) -> Optional[np.ndarray]:
+        key = self._key(text, normalize)
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return vec
+            vec = self._disk_get(key)
+            if vec is not None:
+                self._lru_put(key, vec)
+                self.counters["disk_hits"] += 1
+            return vec
+
+    # ------------------------------------------------
+    # 캐시 경유 인코딩
+    # ------------------------------------------------
+    def encode(self, embedder, texts: List[str], normalize: bool = True) -> np.ndarray:
+        """
+        히트는 캐시에서, 미스만 모아 한 번에 배치 인코딩 후 양 계층에 저장.
+        embedder 로 인자 없는 callable 을 넘기면 미스가 있을 때만 호출해 임베더를 얻는다.
+        """
+        vecs: List[Optional[np.ndarray]] = [self.get(t, normalize) for t in texts]
+        missing = [i for i, v in enumerate(vecs) if v is None]
+        if missing:
+            if not hasattr(embedder, "encode") and callable(embedder):
+                embedder = embedder()
+            t0 = time.time()
+            encoded = np.asarray(
+                embedder.encode([texts[i] for i in missing], normalize_embeddings=normalize),
+                dtype=np.float32,
+            )
+            new_items = []
+            with self._lock:
+                self.counters["misses"] += len(missing)
+                self.counters["encode_seconds"] += time.time() - t0
+                for i, vec in zip(missing, encoded):
+                    key = self._key(texts[i], normalize)
+                    self._lru_put(key, vec)
+                    new_items.append((key, texts[i], vec))
+                    vecs[i] = vec
+                self._disk_put(new_items)
+        return np.vstack(vecs).astype(np.float32, copy=False)
+
+    def precompute(self, embedder, texts: List[str], normalize: bool = True) -> None:
+        t0 = time.time()
+        self.encode(embedder, texts, normalize)
+        print(f"🧊 [EmbedCache] 상수 쿼리 {len(texts)}개 프리컴퓨트 완료 ({time.time() - t0:.2f}s)")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            c = dict(self.counters)
+            c["memory_items"] = len(self._lru)
+        hits = c["memory_hits"] + c["disk_hits"]
+        total = hits + c["misses"]
+        c["hit_rate"] = round(hits / total, 4) if total else 0.0
+        c["encode_seconds"] = round(c["encode_seconds"], 3)
+        return c
@@ -0,0 +1,281 @@
+"""
+embedding_server.py
+-------------------
+호스트당 1개의 bge-m3 를 공유하는 로컬 임베딩 서버 (Unix 도메인 소켓)
+- 짧은 윈도우(기본 5ms) 안에 도착한 동시 encode 요청을 하나의 배치로 묶어 처리 (micro-batching)
+- 클라이언트 RemoteEmbedder 는 SentenceTransformer.encode 와 같은 규약 → rag_engine 이 그대로 사용
+- RAG_EMBEDDER_SOCKET 을 지정하면 Streamlit/배치 워커가 모델을 직접 로드하지 않고 서버를 사용
+
+프로토콜: [4바이트 big-endian 길이][JSON] 요청
+  {"op": "encode", "texts": [...], "normalize": true} / {"op": "ping"}
+응답: [길이][JSON 헤더] (+ encode 성공 시 [n*d*4 바이트 float32])
+
+실행:
+    python -m analyzer.embedding_server --socket /tmp/rag_embedder.sock --window-ms 5 --max-batch 64
+"""
+
+import os
+import json
+import time
+import queue
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from analyzer.embedder import EMBEDDER_BACKEND, load_embedder
+
+DEFAULT_SOCKET_PATH = os.getenv("RAG_EMBEDDER_SOCKET") or "/tmp/rag_embedder.sock"
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+_HEADER = struct.Struct(">I")
+
+
+# ------------------------------------------------
+# 프레이밍 유틸
+# ------------------------------------------------
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("연결이 종료되었습니다.")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f"프레임이 너무 큽니다: {size} bytes")
+    return _recv_exact(sock, size)
+
+
+def _send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+# ------------------------------------------------
+# 마이크로 배처
+# ------------------------------------------------
+class _Pending:
+    __slots__ = ("texts", "normalize", "done", "result", "error")
+
+    def __init__(self, texts: List[str], normalize: bool):
+        self.texts = texts
+        self.normalize = normalize
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[str] = None
+
+
+class MicroBatcher:
+    """window_ms 동안 모인 요청들을 max_batch 문장 한도로 묶어 모델을 1회 호출"""
+
+    def __init__(self, model, window_ms: float = 5.0, max_batch: int = 64):
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self.counters = {"requests": 0, "batches": 0, "texts": 0, "encode_seconds": 0.0}
+        threading.Thread(target=self._loop, name="embed-batcher", daemon=True).start()
+
+    def submit(self, texts: List[str], normalize: bool = True) -> np.ndarray:
+        item = _Pending(texts, normalize)
+        self._queue.put(item)
+        item.done.wait()
+        if item.error:
+            raise RuntimeError(item.error)
+        return item.result
+
+    def _collect(self) -> List[_Pending]:
+        first = self._queue.get()
+        batch, n_texts = [first], len(first.texts)
+        deadline = time.monotonic() + self.window
+        while n_texts < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n_texts += len(item.texts)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            for normalize in (True, False):
+                group = [b for b in batch if b.normalize == normalize]
+                if group:
+                    self._encode_group(group, normalize)
+
+    def _encode_group(self, group: List[_Pending], normalize: bool) -> None:
+        texts = [t for item in group for t in item.texts]
+        t0 = time.time()
+        try:
+            emb = np.asarray(self.model.encode(texts, normalize_embeddings=normalize), dtype=np.float32)
+            pos = 0
+            for item in group:
+                item.result = emb[pos:pos + len(item.texts)]
+                pos += len(item.texts)
+        except Exception as e:
+            for item in group:
+                item.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.counters["requests"] += len(group)
+            self.counters["batches"] += 1
+            self.counters["texts"] += len(texts)
+            self.counters["encode_seconds"] += time.time() - t0
+            for item in group:
+                item.done.set()
+
+    def stats(self) -> Dict:
+        c = dict(self.counters)
+        c["avg_batch_texts"] = round(c["texts"] / c["batches"], 2) if c["batches"] else 0.0
+        c["encode_seconds"] = round(c["encode_seconds"], 3)
+        return c
+
+
+# ------------------------------------------------
+# 서버
+# ------------------------------------------------
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        server: "EmbeddingServer" = self.server
+        while True:
+            try:
+                req = json.loads(_recv_frame(self.request))
+            except (ConnectionError, OSError):
+                return
+            except ValueError as e:
+                _send_frame(self.request, json.dumps({"ok": False, "error": str(e)}).encode())
+                return
+
+            op = req.get("op", "encode")
+            if op == "ping":
+                header = {"ok": True, "backend": server.backend, "dim": server.dim, "stats": server.batcher.stats()}
+                _send_frame(self.request, json.dumps(header).encode())
+                continue
+            texts = list(req.get("texts", []))
+            if not texts:  # 빈 요청은 모델을 거치지 않고 (0, dim) 응답 — encode([]) 는 (0,) 을 돌려줌
+                _send_frame(self.request, json.dumps({"ok": True, "shape": [0, server.dim]}).encode())
+                continue
+            try:
+                emb = server.batcher.submit(texts, bool(req.get("normalize", True)))
+            except RuntimeError as e:
+                _send_frame(self.request, json.dumps({"ok": False, "error": str(e)}).encode())
+                continue
+            header = json.dumps({"ok": True, "shape": list(emb.shape)}).encode()
+            _send_frame(self.request, header)
+            self.request.sendall(np.ascontiguousarray(emb, dtype=np.float32).tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, model, backend: str, window_ms: float, max_batch: int, dim: int):
+        self.backend = backend
+        self.dim = dim
+        self.batcher = MicroBatcher(model, window_ms, max_batch)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # 이전 프로세스가 남긴 소켓 파일
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+
+
+def serve(socket_path: str = DEFAULT_SOCKET_PATH, backend: str = EMBEDDER_BACKEND,
+          window_ms: float = 5.0, max_batch: int = 64) -> None:
+    t0 = time.time()
+    model = load_embedder(backend)
+    dim = int(np.asarray(model.encode(["warmup"], normalize_embeddings=True)).shape[-1])
+    print(f"✅ [EmbedServer] 모델 로드 완료 ({time.time() - t0:.2f}s, backend={backend}, dim={dim})")
+    with EmbeddingServer(socket_path, model, backend, window_ms, max_batch, dim) as server:
+        print(f"🔌 [EmbedServer] listening on {socket_path} (window={window_ms}ms, max_batch={max_batch})")
+        try:
+            server.serve_forever()
+        finally:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+# ------------------------------------------------
+# 클라이언트
+# ------------------------------------------------
+class RemoteEmbedder:
+    """임베딩 서버 클라이언트 — SentenceTransformer.encode 와 같은 호출 규약. 스레드별 연결 유지."""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        info = self.ping()  # 서버가 없으면 여기서 실패 → EmbedderHandle 이 failed 로 기록
+        self.backend = info.get("backend")
+        self.dim = int(info.get("dim") or 0)
+
+    def _conn(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _drop(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            finally:
+                self._local.sock = None
+
+    def _request(self, payload: Dict, expect_vectors: bool):
+        for attempt in range(2):  # 끊긴 연결은 1회 재연결
+            try:
+                sock = self._conn()
+                _send_frame(sock, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+                header = json.loads(_recv_frame(sock))
+                if not header.get("ok"):
+                    raise RuntimeError(f"임베딩 서버 오류: {header.get('error')}")
+                if not expect_vectors:
+                    return header
+                n, d = header["shape"]
+                raw = _recv_exact(sock, n * d * 4)
+                return np.frombuffer(raw, dtype=np.float32).reshape(n, d)
+            except (ConnectionError, BrokenPipeError, socket.timeout):
+                self._drop()
+                if attempt:
+                    raise
+
+    def ping(self) -> Dict:
+        return self._request({"op": "ping"}, expect_vectors=False)
+
+    def encode(self, sentences, normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        if not len(sentences):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return self._request(
+            {"op": "encode", "texts": list(sentences), "normalize": normalize_embeddings},
+            expect_vectors=True,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="bge-m3 공유 임베딩 서버 (Unix socket, micro-batching)")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Unix 소켓 경로")
+    parser.add_argument("--backend", default=EMBEDDER_BACKEND, help="fp32 / int8 / onnx")
+    parser.add_argument("--window-ms", type=float, default=5.0, help="배치 수집 윈도우(ms)")
+    parser.add_argument("--max-batch", type=int, default=64, help="배치당 최대 문장 수")
+    args = parser.parse_args()
+    serve(args.socket, args.backend, args.window_ms, args.max_batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+"""
+gemini_client.py
+----------------
+프로세스 공용 Gemini 호출 클라이언트 (rag_engine / rag_engine_optimized / keyword_generator 공용)
+- 동시 실행 상한(RAG_GEMINI_MAX_IN_FLIGHT) + 분당 요청 수(RPM) / 분당 토큰 수(TPM) 토큰 버킷
+- 쿼터 여유가 없으면 호출 전에 대기열에서 기다림 → 429 폭주 후 일제 재시도 대신 쿼터 상한 근처로 평탄화
+- 토큰은 프롬프트 길이로 추정해 선차감하고, 응답의 usage_metadata 로 사후 보정
+- 동기 / 스트리밍 / async 경로가 같은 리미터를 공유, 대기열 지표 제공 (stats)
+- 호출 단위 deadline(RAG_GEMINI_DEADLINE) 안에서 지수 백오프 + full jitter 재시도
+  (429/5xx/연결 오류만 재시도, 잘못된 요청·권한·안전 차단 등은 즉시 실패)
+- 선택적 hedging(RAG_GEMINI_HEDGE): 최근 p95 지연을 넘기면 같은 요청을 한 번 더 보내 먼저 온 응답 사용
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent import futures
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import google.generativeai as genai
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+MAX_IN_FLIGHT = int(os.getenv("RAG_GEMINI_MAX_IN_FLIGHT", "8"))
+RPM_LIMIT = float(os.getenv("RAG_GEMINI_RPM", "1000"))
+TPM_LIMIT = float(os.getenv("RAG_GEMINI_TPM", "1000000"))
+QUEUE_TIMEOUT = float(os.getenv("RAG_GEMINI_QUEUE_TIMEOUT", "60"))
+
+DEADLINE_SECONDS = float(os.getenv("RAG_GEMINI_DEADLINE", "60"))
+MAX_ATTEMPTS = int(os.getenv("RAG_GEMINI_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = float(os.getenv("RAG_GEMINI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("RAG_GEMINI_BACKOFF_MAX", "8"))
+HEDGE_ENABLED = os.getenv("RAG_GEMINI_HEDGE", "0") == "1"
+HEDGE_MIN_SAMPLES = int(os.getenv("RAG_GEMINI_HEDGE_MIN_SAMPLES", "20"))
+
+# 출력 상한이 없는 호출의 출력 토큰 선차감 추정치
+DEFAULT_OUTPUT_TOKENS = 1024
+_ASYNC_POLL = 0.02
+
+
+def estimate_tokens(prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> int:
+    """
+    입력(한글 위주라 약 2자/토큰으로 보수적으로 추정) + 출력 상한.
+    실제 사용량은 응답 후 usage_metadata 로 보정되므로 대략적인 값이면 충분하다.
+    """
+    out = (generation_config or {}).get("max_output_tokens") or DEFAULT_OUTPUT_TOKENS
+    return len(prompt) // 2 + int(out)
+
+
+# ------------------------------------------------
+# 토큰 버킷
+# ------------------------------------------------
+class TokenBucket:
+    """per_minute 용량, 초당 per_minute/60 속도로 채워지는 버킷 (잠금은 호출측 책임)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._last = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)  # 용량보다 큰 요청이 영원히 막히지 않도록
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """사후 보정: delta>0 추가 차감(음수 잔량 허용), delta<0 환급"""
+        self.level = min(self.capacity, self.level - delta)
+
+
+# ------------------------------------------------
+# 리미터
+# ------------------------------------------------
+class GeminiLimiter:
+    """동시 실행 상한 + RPM/TPM 버킷. 스레드와 이벤트 루프가 같은 인스턴스를 공유한다."""
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, rpm: float = RPM_LIMIT,
+                 tpm: float = TPM_LIMIT, queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self._rpm = TokenBucket(rpm)
+        self._tpm = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queued = 0
+        self.counters = {
+            "admitted": 0, "waited": 0, "queue_timeouts": 0, "quota_errors": 0,
+            "wait_seconds": 0.0, "max_wait_seconds": 0.0,
+            "peak_in_flight": 0, "peak_queued": 0,
+            "estimated_tokens": 0, "actual_tokens": 0,
+        }
+
+    def _try_admit(self, tokens: int) -> float:
+        """입장 가능하면 자원을 차감하고 0, 아니면 다시 시도할 때까지의 대기(초). (잠금 보유 상태)"""
+        now = time.monotonic()
+        if self._in_flight >= self.max_in_flight:
+            return _ASYNC_POLL
+        wait = max(self._rpm.wait_time(1, now), self._tpm.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        self._rpm.take(1)
+        self._tpm.take(tokens)
+        self._in_flight += 1
+        c = self.counters
+        c["admitted"] += 1
+        c["estimated_tokens"] += tokens
+        c["peak_in_flight"] = max(c["peak_in_flight"], self._in_flight)
+        return 0.0
+
+    def _record_wait(self, waited: float) -> None:
+        c = self.counters
+        if waited > 0.001:
+            c["waited"] += 1
+            c["wait_seconds"] += waited
+            c["max_wait_seconds"] = max(c["max_wait_seconds"], waited)
+
+    def _enqueue(self) -> None:
+        self._queued += 1
+        self.counters["peak_queued"] = max(self.counters["peak_queued"], self._queued)
+
+    def _timeout(self) -> TimeoutError:
+        self.counters["queue_timeouts"] += 1
+        return TimeoutError(f"Gemini 호출 대기열 시간 초과 ({self.queue_timeout:g}s)")
+
+    # ------------------------------------------------
+    # 입장 / 퇴장
+    # ------------------------------------------------
+    def acquire(self, tokens: int, timeout: Optional[float] = None) -> None:
+        t0 = time.monotonic()
+        deadline = t0 + min(self.queue_timeout, timeout if timeout is not None else self.queue_timeout)
+        with self._cond:
+            self._enqueue()
+            try:
+                while True:
+                    wait = self._try_admit(tokens)
+                    if wait == 0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._timeout()
+                    self._cond.wait(min(wait, remaining))
+            finally:
+                self._queued -= 1
+            self._record_wait(time.monotonic() - t0)
+
+    async def acquire_async(self, tokens: int, timeout: Optional[float] = None) -> None:
+        t0 = time.monotonic()
+        deadline = t0 + min(self.queue_timeout, timeout if timeout is not None else self.queue_timeout)
+        with self._cond:
+            self._enqueue()
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_admit(tokens)
+                    if wait == 0:
+                        self._record_wait(time.monotonic() - t0)
+                        return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._cond:
+                        raise self._timeout()
+                await asyncio.sleep(min(wait, remaining))
+        finally:
+            with self._cond:
+                self._queued -= 1
+
+    def release(self, estimated_tokens: int, actual_tokens: Optional[int] = None,
+                quota_error: bool = False) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if actual_tokens is not None:
+                self._tpm.adjust(actual_tokens - min(estimated_tokens, self._tpm.capacity))
+                self.counters["actual_tokens"] += actual_tokens
+            if quota_error:
+                self.counters["quota_errors"] += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, tokens: int, timeout: Optional[float] = None):
+        """with limiter.slot(n) as usage: ... usage["tokens"] = 실제 토큰 수"""
+        self.acquire(tokens, timeout)
+        usage: Dict[str, Any] = {"tokens": None, "quota_error": False}
+        try:
+            yield usage
+        except Exception as e:
+            usage["quota_error"] = is_quota_error(e)
+            raise
+        finally:
+            self.release(tokens, usage["tokens"], usage["quota_error"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            c = dict(self.counters)
+            c["in_flight"] = self._in_flight
+            c["queued"] = self._queued
+            c["rpm_available"] = round(self._rpm.level, 1)
+            c["tpm_available"] = round(self._tpm.level, 1)
+        c["avg_wait_seconds"] = round(c["wait_seconds"] / c["admitted"], 4) if c["admitted"] else 0.0
+        c["wait_seconds"] = round(c["wait_seconds"], 3)
+        c["max_wait_seconds"] = round(c["max_wait_seconds"], 3)
+        return c
+
+
+def is_quota_error(exc: BaseException) -> bool:
+    """429 / ResourceExhausted 여부 (google.api_core 예외 또는 메시지 기준)"""
+    if getattr(exc, "code", None) == 429 or type(exc).__name__ == "ResourceExhausted":
+        return True
+    return "429" in str(exc) or "quota" in str(exc).lower()
+
+
+_RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "Unknown", "RetryError",
+}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    재시도 대상: 429 / 5xx / 서버측 타임아웃 / 연결 오류.
+    그 외(InvalidArgument, PermissionDenied, 안전 필터로 인한 ValueError, 리미터 대기열 초과 등)는 즉시 실패.
+    """
+    if isinstance(exc, ConnectionError):
+        return True
+    if type(exc).__name__ in _RETRYABLE_NAMES:
+        return True
+    return getattr(exc, "code", None) in _RETRYABLE_CODES
+
+
+def _usage_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None) if usage is not None else None
+    return int(total) if total else None
+
+
+class DeadlineExceededError(TimeoutError):
+    """호출 단위 deadline 안에 성공 응답을 얻지 못함"""
+
+
+# ------------------------------------------------
+# 지연 분포 (hedging 기준 p95)
+# ------------------------------------------------
+class LatencyTracker:
+    """모델별 최근 성공 호출 지연(초) 롤링 윈도우"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key: str, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        keys = list(self._samples)
+        return {
+            k: {
+                "n": len(self._samples[k]),
+                "p50": round(self.quantile(k, 0.50), 3),
+                "p95": round(self.quantile(k, 0.95), 3),
+            }
+            for k in keys if self._samples[k]
+        }
+
+
+# ------------------------------------------------
+# 공용 인스턴스
+# ------------------------------------------------
+_limiter = GeminiLimiter()
+_latency = LatencyTracker()
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+_hedge_pool = futures.ThreadPoolExecutor(max_workers=max(2, MAX_IN_FLIGHT * 2), thread_name_prefix="gemini-call")
+_call_lock = threading.Lock()
+_call_counters = {
+    "calls": 0, "attempts": 0, "retries": 0, "fatal_errors": 0,
+    "deadline_exceeded": 0, "hedges_fired": 0, "hedges_won": 0,
+}
+
+
+def get_limiter() -> GeminiLimiter:
+    return _limiter
+
+
+def limiter_stats() -> Dict[str, Any]:
+    """대기열/동시 실행/쿼터 지표"""
+    return _limiter.stats()
+
+
+def call_stats() -> Dict[str, Any]:
+    """재시도/deadline/hedging 카운터 + 모델별 p50/p95 지연"""
+    with _call_lock:
+        c = dict(_call_counters)
+    c["latency"] = _latency.snapshot()
+    return c
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _call_lock:
+        _call_counters[key] += n
+
+
+def _model(model_name: str):
+    with _models_lock:
+        if model_name not in _models:
+            _models[model_name] = genai.GenerativeModel(model_name)
+        return _models[model_name]
+
+
+def _remaining(deadline: float) -> float:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        _count("deadline_exceeded")
+        raise DeadlineExceededError("Gemini 호출 deadline 초과")
+    return remaining
+
+
+def _backoff(attempt: int) -> float:
+    """지수 백오프 + full jitter: U(0, min(max, base·2^attempt))"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _should_retry(exc: Exception, attempt: int, deadline: float) -> Optional[float]:
+    """재시도할 경우 대기 시간(초), 아니면 None"""
+    if not is_retryable(exc):
+        _count("fatal_errors")
+        return None
+    if attempt >= MAX_ATTEMPTS - 1:
+        return None
+    delay = _backoff(attempt)
+    if time.monotonic() + delay >= deadline:
+        return None
+    _count("retries")
+    print(f"⚠️ [Gemini] 재시도 {attempt + 1}/{MAX_ATTEMPTS - 1} ({type(exc).__name__}: {exc}) — {delay:.2f}s 후")
+    return delay
+
+
+def _hedge_delay(model_name: str, hedge: bool, remaining: float) -> Optional[float]:
+    if not hedge:
+        return None
+    p95 = _latency.quantile(model_name, 0.95, HEDGE_MIN_SAMPLES)
+    return p95 if p95 is not None and p95 < remaining else None
+
+
+# ------------------------------------------------
+# 단일 시도 (리미터 + 요청 timeout)
+# ------------------------------------------------
+def _call_once(prompt: str, model_name: str, generation_config, deadline: float):
+    tokens = estimate_tokens(prompt, generation_config)
+    with _limiter.slot(tokens, _remaining(deadline)) as usage:
+        _count("attempts")
+        t0 = time.monotonic()
+        response = _model(model_name).generate_content(
+            prompt, generation_config=generation_config,
+            request_options={"timeout": _remaining(deadline)},
+        )
+        usage["tokens"] = _usage_tokens(response)
+    _latency.record(model_name, time.monotonic() - t0)
+    return response
+
+
+async def _call_once_async(prompt: str, model_name: str, generation_config, deadline: float):
+    tokens = estimate_tokens(prompt, generation_config)
+    await _limiter.acquire_async(tokens, _remaining(deadline))
+    actual, quota_error = None, False
+    try:
+        _count("attempts")
+        t0 = time.monotonic()
+        remaining = _remaining(deadline)
+        response = await asyncio.wait_for(
+            _model(model_name).generate_content_async(
+                prompt, generation_config=generation_config, request_options={"timeout": remaining},
+            ),
+            timeout=remaining,
+        )
+        actual = _usage_tokens(response)
+        _latency.record(model_name, time.monotonic() - t0)
+        return response
+    except DeadlineExceededError:
+        raise
+    except asyncio.TimeoutError:
+        _count("deadline_exceeded")
+        raise DeadlineExceededError("Gemini 호출 deadline 초과")
+    except Exception as e:
+        quota_error = is_quota_error(e)
+        raise
+    finally:
+        _limiter.release(tokens, actual, quota_error)
+
+
+def _hedged_call(prompt: str, model_name: str, generation_config, deadline: float, hedge: bool):
+    """
+    호출 스레드는 deadline 까지만 기다린다 (요청 timeout 이 지켜지지 않아도 호출측은 막히지 않음).
+    p95 를 넘기면 두 번째 요청을 보내고 먼저 성공한 응답 사용 (늦은 쪽은 버림)
+    """
+    remaining = _remaining(deadline)
+    delay = _hedge_delay(model_name, hedge, remaining)
+    primary = _hedge_pool.submit(_call_once, prompt, model_name, generation_config, deadline)
+    done, _ = futures.wait([primary], timeout=delay if delay is not None else remaining)
+    if done:
+        return primary.result()
+    if delay is None:
+        # 헤징 비활성 — wait 가 deadline 직전에 깨어나도 백업 요청은 보내지 않음
+        _count("deadline_exceeded")
+        raise DeadlineExceededError("Gemini 호출 deadline 초과")
+    _count("hedges_fired")
+    backup = _hedge_pool.submit(_call_once, prompt, model_name, generation_config, deadline)
+    pending, error = {primary, backup}, None
+    while pending:
+        done, pending = futures.wait(pending, timeout=_remaining(deadline), return_when=futures.FIRST_COMPLETED)
+        if not done:
+            _remaining(deadline)  # deadline 초과 → DeadlineExceededError
+        for f in done:
+            if f.exception() is None:
+                if f is backup:
+                    _count("hedges_won")
+                return f.result()
+            error = f.exception()
+    raise error
+
+
+async def _hedged_call_async(prompt: str, model_name: str, generation_config, deadline: float, hedge: bool):
+    delay = _hedge_delay(model_name, hedge, _remaining(deadline))
+    primary = asyncio.ensure_future(_call_once_async(prompt, model_name, generation_config, deadline))
+    if delay is None:
+        return await primary
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+    _count("hedges_fired")
+    backup = asyncio.ensure_future(_call_once_async(prompt, model_name, generation_config, deadline))
+    pending, error = {primary, backup}, None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=_remaining(deadline), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                _remaining(deadline)
+            for t in done:
+                if t.exception() is None:
+                    if t is backup:
+                        _count("hedges_won")
+                    return t.result()
+                error = t.exception()
+        raise error
+    finally:
+        for t in (primary, backup):
+            if not t.done():
+                t.cancel()
+
+
+# ------------------------------------------------
+# 호출 API
+# ------------------------------------------------
+def generate_content(prompt: str, model_name: str = DEFAULT_MODEL,
+                     generation_config: Optional[Dict[str, Any]] = None,
+                     deadline: float = DEADLINE_SECONDS, hedge: bool = HEDGE_ENABLED):
+    """
+    리미터 + deadline + 재시도(+ 선택적 hedging)를 거친 동기 호출.
+    GenerativeModel.generate_content 와 같은 응답 객체 반환, deadline 초과 시 DeadlineExceededError.
+    """
+    _count("calls")
+    until = time.monotonic() + deadline
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return _hedged_call(prompt, model_name, generation_config, until, hedge)
+        except DeadlineExceededError:
+            raise
+        except Exception as e:
+            delay = _should_retry(e, attempt, until)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+
+def stream_content(prompt: str, model_name: str = DEFAULT_MODEL,
+                   generation_config: Optional[Dict[str, Any]] = None,
+                   deadline: float = DEADLINE_SECONDS) -> Iterator[Any]:
+    """
+    리미터 + deadline 을 거친 스트리밍 호출 — 응답 조각(chunk)을 yield.
+    첫 조각이 오기 전 실패만 재시도한다 (이미 전달한 조각은 되돌릴 수 없으므로 hedging 미적용).
+    스트림이 끝나거나 소비가 중단될 때까지 동시 실행 슬롯을 점유한다.
+    """
+    _count("calls")
+    until = time.monotonic() + deadline
+    tokens = estimate_tokens(prompt, generation_config)
+    for attempt in range(MAX_ATTEMPTS):
+        started = False
+        try:
+            with _limiter.slot(tokens, _remaining(until)) as usage:
+                _count("attempts")
+                response = _model(model_name).generate_content(
+                    prompt, generation_config=generation_config, stream=True,
+                    request_options={"timeout": _remaining(until)},
+                )
+                for chunk in response:
+                    started = True
+                    yield chunk
+                usage["tokens"] = _usage_tokens(response)
+            return
+        except DeadlineExceededError:
+            raise
+        except Exception as e:
+            delay = None if started else _should_retry(e, attempt, until)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+
+async def generate_content_async(prompt: str, model_name: str = DEFAULT_MODEL,
+                                 generation_config: Optional[Dict[str, Any]] = None,
+                                 deadline: float = DEADLINE_SECONDS, hedge: bool = HEDGE_ENABLED):
+    """generate_content 의 async 버전 — 대기/백오프 중에도 이벤트 루프를 막지 않음"""
+    _count("calls")
+    until = time.monotonic() + deadline
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return await _hedged_call_async(prompt, model_name, generation_config, until, hedge)
+        except DeadlineExceededError:
+            raise
+        except Exception as e:
+            delay = _should_retry(e, attempt, until)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
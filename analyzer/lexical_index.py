@@ -0,0 +1,172 @@
+"""
+lexical_index.py
+----------------
+문자 n-gram BM25 역색인 + RRF(Reciprocal Rank Fusion) (vector_registry / rag_engine 전용)
+- 매장 코드, 법정동명, 업종 용어처럼 dense 임베딩이 약한 질의를 어휘 경로로 보완
+- 메타데이터 text 필드를 단어별 문자 n-gram(기본 2·3-gram)으로 쪼개 벡터DB 로드 시 1회 구축
+  (형태소 분석기 없이 한국어 조사/복합어에 강건)
+- 색인은 CSR 형태(용어별 오프셋 + 문서 id + 사전 계산한 BM25 가중치)라 검색은 배열 합산만 수행
+- RRF: 여러 순위 리스트(쿼리별 FAISS / BM25)를 1/(k + rank) 합으로 융합
+- 임베더가 준비되지 않았을 때도 BM25 순위만으로 동일한 후보 풀을 만들 수 있음 (어휘 폴백)
+"""
+
+import re
+import os
+import json
+import math
+import time
+from collections import Counter
+from typing import AbstractSet, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from analyzer.metadata_store import ColumnarMetadata, JsonlOffsetMetadata
+from analyzer.mmr_selector import Candidate
+
+HYBRID_ENABLED = os.getenv("RAG_HYBRID", "1") == "1"
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+BM25_K1 = float(os.getenv("RAG_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("RAG_BM25_B", "0.75"))
+NGRAM_SIZES = tuple(int(n) for n in os.getenv("RAG_BM25_NGRAMS", "2,3").split(",") if n.strip())
+
+_NON_WORD = re.compile(r"[^\w]+")
+_TEXT_RE = re.compile(rb'"text":\s*("(?:[^"\\]|\\.)*")')
+
+
+def tokenize(text: str, sizes: Sequence[int] = NGRAM_SIZES) -> List[str]:
+    """소문자화 후 단어별 문자 n-gram. 가장 작은 n 보다 짧은 단어(2글자 이상)는 단어 그대로"""
+    min_n = min(sizes)
+    out: List[str] = []
+    for word in _NON_WORD.sub(" ", text.lower()).split():
+        if len(word) < min_n:
+            if len(word) >= 2:
+                out.append(word)
+            continue
+        for n in sizes:
+            out.extend(word[i:i + n] for i in range(len(word) - n + 1))
+    return out
+
+
+def _iter_texts(metadata, skip_rows: AbstractSet[int] = frozenset()) -> Iterable[str]:
+    """지연 메타데이터는 원문 바이트에서 text 만 추출해 전체 파싱을 피함 (skip_rows 는 빈 문서로 취급)"""
+    lazy = isinstance(metadata, JsonlOffsetMetadata)
+    columnar = isinstance(metadata, ColumnarMetadata)
+    for i in range(len(metadata)):
+        if i in skip_rows:
+            yield ""
+        elif columnar:
+            yield metadata.value(i, "text", "") or ""
+        elif lazy:
+            m = _TEXT_RE.search(metadata.raw(i))
+            yield json.loads(m.group(1)) if m else ""
+        else:
+            yield metadata[i].get("text", "") or ""
+
+
+# ------------------------------------------------
+# BM25 역색인
+# ------------------------------------------------
+class BM25Index:
+    """행 번호(= FAISS id) 기준 BM25. 가중치는 구축 시 idf·tf·길이 정규화까지 미리 계산"""
+
+    def __init__(self, texts: Iterable[str], k1: float = BM25_K1, b: float = BM25_B,
+                 sizes: Sequence[int] = NGRAM_SIZES):
+        t0 = time.time()
+        self.sizes = tuple(sizes)
+        term_docs: Dict[str, List[int]] = {}
+        term_tfs: Dict[str, List[int]] = {}
+        lengths: List[int] = []
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text, self.sizes))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_docs.setdefault(term, []).append(row)
+                term_tfs.setdefault(term, []).append(tf)
+
+        self.n_docs = len(lengths)
+        doc_len = np.asarray(lengths, dtype=np.float32)
+        avgdl = float(doc_len.mean()) if self.n_docs and doc_len.mean() > 0 else 1.0
+        norm = k1 * (1.0 - b + b * doc_len / avgdl)
+
+        self.vocab: Dict[str, int] = {}
+        offsets = [0]
+        docs_parts, weight_parts = [], []
+        for tid, (term, docs) in enumerate(term_docs.items()):
+            self.vocab[term] = tid
+            ids = np.asarray(docs, dtype=np.int32)
+            tf = np.asarray(term_tfs[term], dtype=np.float32)
+            df = len(docs)
+            idf = math.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            docs_parts.append(ids)
+            weight_parts.append((idf * tf * (k1 + 1.0) / (tf + norm[ids])).astype(np.float32))
+            offsets.append(offsets[-1] + df)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.doc_ids = np.concatenate(docs_parts) if docs_parts else np.zeros(0, dtype=np.int32)
+        self.weights = np.concatenate(weight_parts) if weight_parts else np.zeros(0, dtype=np.float32)
+        self.build_seconds = time.time() - t0
+
+    @classmethod
+    def from_metadata(cls, metadata, skip_rows: AbstractSet[int] = frozenset(), **kwargs) -> "BM25Index":
+        """skip_rows: 삭제 표시(tombstone)된 행 — 행 번호는 유지하되 색인에서 제외"""
+        return cls(_iter_texts(metadata, skip_rows), **kwargs)
+
+    def search(self, query: str, top_k: int = 10, exclude_rows: Sequence[int] = ()) -> List[Tuple[int, float]]:
+        """[(행 번호, BM25 점수)] 점수 내림차순 (동점은 행 번호 순), 점수 0 인 행은 제외"""
+        if self.n_docs == 0 or top_k <= 0:
+            return []
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query, self.sizes)):
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            s, e = self.offsets[tid], self.offsets[tid + 1]
+            scores[self.doc_ids[s:e]] += self.weights[s:e]  # 한 용어 안에서 문서 id 는 유일
+        if len(exclude_rows):
+            scores[np.asarray(list(exclude_rows), dtype=np.int64)] = 0.0
+        rows = np.flatnonzero(scores)
+        if len(rows) > top_k:
+            rows = rows[np.argpartition(-scores[rows], top_k - 1)[:top_k]]
+        rows = rows[np.lexsort((rows, -scores[rows]))]
+        return [(int(r), float(scores[r])) for r in rows]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets.nbytes + self.doc_ids.nbytes + self.weights.nbytes)
+
+    def stats(self) -> Dict:
+        return {
+            "docs": self.n_docs,
+            "terms": len(self.vocab),
+            "postings": int(len(self.doc_ids)),
+            "mb": round(self.nbytes / 1024 ** 2, 2),
+            "build_seconds": round(self.build_seconds, 3),
+        }
+
+
+# ------------------------------------------------
+# RRF 융합
+# ------------------------------------------------
+def rrf_scores(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> Dict[int, float]:
+    """행 번호 순위 리스트들 → 행별 Σ 1/(k + rank), rank 는 1부터"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def dense_rankings(I: np.ndarray, exclude_rows: Sequence[int] = ()) -> List[List[int]]:
+    """FAISS 검색 결과 I(nq×k) → 쿼리별 행 번호 순위 리스트"""
+    skip = set(exclude_rows)
+    return [[int(r) for r in row if r >= 0 and int(r) not in skip] for row in I]
+
+
+def rrf_candidates(source: str, fused: Dict[int, float], scale: float = 0.0) -> Dict[int, Candidate]:
+    """
+    RRF 점수를 MMR 관련도로 쓰기 위해 [0, 1] 로 정규화한 후보 dict.
+    scale 은 정규화 분모 (0 이면 이 풀의 최고점) — 리포트/세그먼트 풀을 같은 기준으로 맞출 때 지정
+    """
+    if not fused:
+        return {}
+    top = scale or max(fused.values())
+    return {row: Candidate(source, row, score / top) for row, score in fused.items()}
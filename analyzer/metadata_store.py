@@ -0,0 +1,359 @@
+"""
+metadata_store.py
+-----------------
+벡터DB 메타데이터(*_metadata.jsonl) 접근 계층
+- eager: 기존처럼 전체 JSONL 을 list[dict] 로 파싱
+- lazy : 줄 시작 오프셋 사이드카(*_metadata.offsets.npy) + mmap 으로
+         검색에 걸린 행만 그때그때 파싱 (여러 워커가 page cache 를 공유)
+- columnar: 컬럼별 UTF-8 블롭 + 오프셋 배열을 한 파일(*_metadata.columns.bin)에 담아 mmap,
+            행 dict 는 접근 시점에만 생성 (RAG_METADATA_FORMAT=columnar, build_columnar_metadata.py)
+- append_rows: 증분 추가 (vector_store.py) — 파일 끝에 행을 덧붙이고 오프셋 사이드카도 이어서 갱신
+"""
+
+import os
+import json
+import mmap
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+def offsets_path_for(meta_path: str) -> str:
+    root, _ = os.path.splitext(meta_path)
+    return f"{root}.offsets.npy"
+
+
+# ------------------------------------------------
+# 오프셋 테이블 생성/로드
+# ------------------------------------------------
+def build_line_offsets(meta_path: str) -> np.ndarray:
+    """
+    비어있지 않은 각 줄의 시작 오프셋 + 마지막에 파일 크기를 담은 uint64 배열.
+    i 번째 행 = buf[offsets[i]:offsets[i+1]]
+    """
+    starts = []
+    pos = 0
+    with open(meta_path, "rb") as f:
+        for line in f:
+            if line.strip():
+                starts.append(pos)
+            pos += len(line)
+    starts.append(pos)
+    return np.asarray(starts, dtype=np.uint64)
+
+
+def _sidecar_is_fresh(meta_path: str, sidecar: str, offsets: np.ndarray) -> bool:
+    if not len(offsets):
+        return False
+    st_meta = os.stat(meta_path)
+    return (
+        int(offsets[-1]) == st_meta.st_size
+        and os.stat(sidecar).st_mtime_ns >= st_meta.st_mtime_ns
+    )
+
+
+def load_line_offsets(meta_path: str) -> np.ndarray:
+    """사이드카가 최신이면 읽고, 아니면 새로 만들어 저장 (쓰기 불가 시 메모리에서만 사용)"""
+    sidecar = offsets_path_for(meta_path)
+    if os.path.exists(sidecar):
+        try:
+            offsets = np.load(sidecar, mmap_mode="r")
+            if _sidecar_is_fresh(meta_path, sidecar, offsets):
+                return offsets
+        except (OSError, ValueError):
+            pass
+
+    offsets = build_line_offsets(meta_path)
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.save(f, offsets)
+        os.replace(tmp, sidecar)
+        print(f"🗂️ [Metadata] 오프셋 사이드카 생성: {os.path.basename(sidecar)} ({len(offsets) - 1} rows)")
+    except OSError as e:
+        print(f"⚠️ [Metadata] 오프셋 사이드카 저장 실패 (메모리에서만 사용): {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return offsets
+
+
+# ------------------------------------------------
+# 지연 파싱 메타데이터
+# ------------------------------------------------
+class JsonlOffsetMetadata:
+    """
+    list[dict] 처럼 len()/[] 로 접근하지만, 실제 파싱은 요청된 행에 대해서만 수행.
+    파일은 mmap 으로 열어 여러 프로세스가 같은 page cache 를 공유한다.
+    """
+
+    def __init__(self, meta_path: str):
+        self.path = meta_path
+        self._offsets = load_line_offsets(meta_path)
+        self._file = open(meta_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return self._buf[int(self._offsets[i]):int(self._offsets[i + 1])]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return json.loads(self.raw(i))
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self) -> int:
+        """프로세스 전용(비공유) 메모리 — 오프셋 테이블 크기"""
+        return int(self._offsets.nbytes)
+
+    def close(self) -> None:
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._file.close()
+
+
+def load_metadata_eager(meta_path: str) -> List[dict]:
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ------------------------------------------------
+# 컬럼형 메타데이터 (build_columnar_metadata.py 로 변환)
+# ------------------------------------------------
+COLUMNAR_MAGIC = b"RAGCOL01"
+_TAG_MISSING, _TAG_STR, _TAG_JSON = 0, 1, 2
+
+
+def columnar_path_for(meta_path: str) -> str:
+    root, _ = os.path.splitext(meta_path)
+    return f"{root}.columns.bin"
+
+
+def _source_stamp(meta_path: str) -> Dict[str, int]:
+    st = os.stat(meta_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def write_columnar(meta_path: str, out_path: Optional[str] = None) -> str:
+    """
+    JSONL → 컬럼별 [태그(uint8) | 값 끝 오프셋(uint64, n+1) | UTF-8 바이트 블롭] 단일 파일.
+    문자열은 그대로, 그 외 값(null/숫자/리스트/dict)은 JSON 문자열로 저장하고 태그로 구분.
+    레이아웃: MAGIC(8) + 헤더 길이(uint64) + 헤더 JSON + 8바이트 정렬된 섹션들
+    """
+    out_path = out_path or columnar_path_for(meta_path)
+    stamp = _source_stamp(meta_path)
+    rows = load_metadata_eager(meta_path)
+    n = len(rows)
+    names = list(dict.fromkeys(k for row in rows for k in row))
+
+    sections: List[bytes] = []
+    columns = []
+    pos = 0
+
+    def _add(buf: bytes) -> List[int]:
+        nonlocal pos
+        span = [pos, len(buf)]
+        pad = (-len(buf)) % 8
+        sections.append(buf + b"\0" * pad)
+        pos += len(buf) + pad
+        return span
+
+    for name in names:
+        tags = np.zeros(n, dtype=np.uint8)
+        ends = np.zeros(n + 1, dtype=np.uint64)
+        parts: List[bytes] = []
+        size = 0
+        for i, row in enumerate(rows):
+            if name in row:
+                v = row[name]
+                if isinstance(v, str):
+                    tags[i] = _TAG_STR
+                    b = v.encode("utf-8")
+                else:
+                    tags[i] = _TAG_JSON
+                    b = json.dumps(v, ensure_ascii=False).encode("utf-8")
+                parts.append(b)
+                size += len(b)
+            ends[i + 1] = size
+        columns.append({
+            "name": name,
+            "tags": _add(tags.tobytes()),
+            "offsets": _add(ends.tobytes()),
+            "data": _add(b"".join(parts)),
+        })
+
+    header = json.dumps({"rows": n, "source": stamp, "columns": columns}, ensure_ascii=False).encode("utf-8")
+    header += b" " * ((-(len(COLUMNAR_MAGIC) + 8 + len(header))) % 8)
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(COLUMNAR_MAGIC)
+            f.write(np.uint64(len(header)).tobytes())
+            f.write(header)
+            for s in sections:
+                f.write(s)
+        os.replace(tmp, out_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return out_path
+
+
+class ColumnarMetadata:
+    """
+    JsonlOffsetMetadata 와 같은 list[dict] 인터페이스. 파일을 mmap 으로 열고 헤더만 파싱하며,
+    행 dict 는 요청 시점에 만들고 value(i, name) 은 dict 없이 필드 하나만 읽는다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._buf[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+            self.close()
+            raise ValueError(f"컬럼형 메타데이터 파일이 아닙니다: {path}")
+        hlen = int(np.frombuffer(self._buf, dtype=np.uint64, count=1, offset=len(COLUMNAR_MAGIC))[0])
+        start = len(COLUMNAR_MAGIC) + 8
+        self.header = json.loads(bytes(self._buf[start:start + hlen]))
+        base = start + hlen
+        self._rows = int(self.header["rows"])
+        self._columns: Dict[str, tuple] = {}
+        for col in self.header["columns"]:
+            tags = np.frombuffer(self._buf, dtype=np.uint8, count=self._rows, offset=base + col["tags"][0])
+            ends = np.frombuffer(self._buf, dtype=np.uint64, count=self._rows + 1, offset=base + col["offsets"][0])
+            self._columns[col["name"]] = (tags, ends, base + col["data"][0])
+        self.names = list(self._columns)
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @property
+    def source(self) -> Dict[str, int]:
+        return self.header["source"]
+
+    def value(self, i: int, name: str, default: Any = None) -> Any:
+        col = self._columns.get(name)
+        if col is None:
+            return default
+        tags, ends, data = col
+        tag = tags[i]
+        if tag == _TAG_MISSING:
+            return default
+        raw = self._buf[data + int(ends[i]):data + int(ends[i + 1])]
+        return raw.decode("utf-8") if tag == _TAG_STR else json.loads(raw)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        row = {}
+        buf = self._buf
+        for name, (tags, ends, data) in self._columns.items():
+            tag = tags.item(i)
+            if tag == _TAG_MISSING:
+                continue
+            raw = buf[data + ends.item(i):data + ends.item(i + 1)]
+            if tag == _TAG_STR:
+                row[name] = raw.decode("utf-8")
+            else:
+                row[name] = None if raw == b"null" else json.loads(raw)
+        return row
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self) -> int:
+        """프로세스 전용(비공유) 메모리 — 헤더/컬럼 뷰 정도 (본문은 page cache 공유)"""
+        return len(json.dumps(self.header)) + 128 * len(self._columns)
+
+    def close(self) -> None:
+        self._columns = {}
+        self._buf.close()
+        self._file.close()
+
+
+def load_columnar(meta_path: str, convert: bool = True) -> Optional[ColumnarMetadata]:
+    """
+    JSONL 과 지문(size, mtime)이 같은 컬럼형 파일을 연다. 없거나 오래됐으면 convert=True 일 때 새로 변환,
+    변환할 수 없으면 None (호출 측은 JSONL 로 폴백).
+    """
+    path = columnar_path_for(meta_path)
+    if os.path.exists(path):
+        try:
+            col = ColumnarMetadata(path)
+            if col.source == _source_stamp(meta_path):
+                return col
+            col.close()
+        except (OSError, ValueError) as e:
+            print(f"⚠️ [Metadata] 컬럼형 파일 읽기 실패: {e}")
+    if not convert:
+        return None
+    try:
+        t0 = time.time()
+        write_columnar(meta_path, path)
+        print(f"🗂️ [Metadata] 컬럼형 변환: {os.path.basename(path)} ({time.time() - t0:.2f}s)")
+        return ColumnarMetadata(path)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ [Metadata] 컬럼형 변환 실패 (JSONL 사용): {e}")
+        return None
+
+
+# ------------------------------------------------
+# 증분 추가 (vector_store.py)
+# ------------------------------------------------
+def append_rows(meta_path: str, rows: List[dict]) -> int:
+    """
+    JSONL 끝에 행을 한 번의 write 로 추가하고 첫 행 번호를 반환.
+    오프셋 사이드카가 최신이면 새 행 오프셋만 덧붙여 갱신 (전체 재스캔 없음).
+    """
+    offsets = load_line_offsets(meta_path)
+    payload = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+    start = int(offsets[-1])
+    with open(meta_path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() != start:
+            raise RuntimeError(f"메타데이터 오프셋 불일치 (파일 {f.tell()} != 사이드카 {start}): {meta_path}")
+        if start:
+            f.seek(start - 1)
+            if f.read(1) != b"\n":  # 마지막 줄에 개행이 없으면 보충
+                f.write(b"\n")
+                start += 1
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+    new_starts, pos = [], start
+    for line in payload.splitlines(keepends=True):
+        new_starts.append(pos)
+        pos += len(line)
+    updated = np.concatenate([np.asarray(offsets[:-1], dtype=np.uint64),
+                              np.asarray(new_starts + [pos], dtype=np.uint64)])
+    sidecar = offsets_path_for(meta_path)
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.save(f, updated)
+        os.replace(tmp, sidecar)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return len(offsets) - 1
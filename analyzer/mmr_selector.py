@@ -0,0 +1,110 @@
+"""
+mmr_selector.py
+---------------
+MMR(Maximal Marginal Relevance) 기반 다양성 청크 선택 (rag_engine 전용)
+- 관련도: FAISS 검색 거리(D)를 코사인 유사도로 환산 (쿼리가 여러 개면 최댓값)
+- 중복도: 인덱스에서 복원(reconstruct)한 청크 임베딩 간 코사인 유사도 — 추가 인코딩 없음
+- score = λ·관련도 − (1−λ)·이미 고른 청크와의 최대 유사도, 두 인덱스 후보를 한 풀에서 k개 선택
+- RAG_MMR_LAMBDA=1 이면 순수 관련도 순 (다양성 미적용)
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import faiss
+
+MMR_ENABLED = os.getenv("RAG_MMR", "1") == "1"
+MMR_K = int(os.getenv("RAG_MMR_K", "8"))
+MMR_FETCH_K = int(os.getenv("RAG_MMR_FETCH_K", "10"))
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+
+
+@dataclass
+class Candidate:
+    source: str                        # "report" / "segment"
+    row: int                           # 메타데이터/인덱스 행 번호
+    relevance: float                   # 쿼리와의 코사인 유사도 (쿼리 간 최댓값)
+    vector: Optional[np.ndarray] = None
+
+
+def distances_to_similarity(D: np.ndarray, metric: int) -> np.ndarray:
+    """IP 인덱스는 그대로, L2 인덱스는 정규화 벡터 기준 cos = 1 − d²/2 로 환산"""
+    if metric == faiss.METRIC_L2:
+        return 1.0 - D / 2.0
+    return D
+
+
+def collect_candidates(source: str, D: np.ndarray, I: np.ndarray, metric: int,
+                       exclude_rows: Sequence[int] = ()) -> Dict[int, Candidate]:
+    """nq×k 검색 결과를 행 번호별 후보로 합침 (같은 행은 쿼리 간 최대 관련도)"""
+    sims = distances_to_similarity(D, metric)
+    skip = set(exclude_rows)
+    out: Dict[int, Candidate] = {}
+    for q in range(I.shape[0]):
+        for sim, row in zip(sims[q], I[q]):
+            row = int(row)
+            if row < 0 or row in skip:
+                continue
+            cand = out.get(row)
+            if cand is None:
+                out[row] = Candidate(source, row, float(sim))
+            elif sim > cand.relevance:
+                cand.relevance = float(sim)
+    return out
+
+
+def attach_vectors(index, candidates: Dict[int, Candidate]) -> bool:
+    """
+    인덱스에서 후보 임베딩 복원. 복원 불가 인덱스면 False.
+    (Flat/HNSW/SQ8 은 그대로 지원, PQ 계열은 근사 복원. IVF 는 레지스트리가 로드 시 만든 direct map 필요 —
+     공유 인덱스이므로 여기서는 읽기만 한다)
+    """
+    if not candidates:
+        return True
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        print("⚠️ [MMR] IVF direct map 없음 → 관련도 순으로 선택")
+        return False
+    rows = np.fromiter(candidates.keys(), dtype=np.int64)
+    try:
+        vecs = np.asarray(index.reconstruct_batch(rows), dtype=np.float32)
+    except RuntimeError as e:
+        print(f"⚠️ [MMR] 벡터 복원 불가 → 관련도 순으로 선택: {e}")
+        return False
+    faiss.normalize_L2(vecs)
+    for row, vec in zip(rows, vecs):
+        candidates[int(row)].vector = vec
+    return True
+
+
+def mmr_select(candidates: List[Candidate], k: int = MMR_K, lambda_: float = MMR_LAMBDA) -> List[Candidate]:
+    """후보 풀에서 MMR 로 k개를 고른 순서대로 반환 (벡터가 없는 후보가 있으면 관련도 순)"""
+    if not candidates:
+        return []
+    k = min(k, len(candidates))
+    if lambda_ >= 1.0 or any(c.vector is None for c in candidates):
+        return sorted(candidates, key=lambda c: -c.relevance)[:k]
+
+    rel = np.array([c.relevance for c in candidates], dtype=np.float32)
+    vecs = np.stack([c.vector for c in candidates])
+    sim = vecs @ vecs.T
+    selected: List[int] = []
+    max_sim = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    for _ in range(k):
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        score = lambda_ * rel - (1.0 - lambda_) * redundancy
+        score[~available] = -np.inf
+        best = int(np.argmax(score))
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, sim[best])
+    return [candidates[i] for i in selected]
+
+
+def split_by_source(picked: List[Candidate]) -> Tuple[List[Candidate], List[Candidate]]:
+    reports = [c for c in picked if c.source == "report"]
+    segments = [c for c in picked if c.source == "segment"]
+    return reports, segments
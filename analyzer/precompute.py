@@ -0,0 +1,224 @@
+"""
+precompute.py
+-------------
+RAG 요약 야간 사전 생성 + 결과 저장소
+- 입력 해시: 매장 코드 · 모드 · top_k · 프로파일 설정 · Gemini 모델 · 리포트/세그먼트 벡터DB 파일 지문
+  · RAG_PRECOMPUTE_VERSION → 월간 데이터 갱신으로 벡터DB 가 바뀌면 자동으로 미스 (라이브 생성)
+  (프롬프트 문구나 예산 등 코드/환경 설정을 바꿨다면 RAG_PRECOMPUTE_VERSION 을 올려 무효화)
+- 저장소: SQLite (store_code, mode, profile) → (input_hash, 결과 JSON)
+- rag_engine: 저장소 히트면 검색/LLM 없이 즉시 반환 (cache_hit="precomputed"), 미스면 라이브 생성
+- 배치: 모드별 리포트 벡터DB 의 store_code 전체 × v1~v3 를 공용 Gemini 리미터 아래에서 생성
+  (매장 목록 조회 / 동시 실행 루프는 bulk_runner 공용, 결과는 이 저장소에 기록.
+   이미 최신 해시로 저장된 조합은 건너뜀 → 중단 후 재실행해도 이어서 진행)
+
+실행 (예: 매일 새벽 cron):
+    python -m analyzer.precompute --modes v1,v2,v3 --workers 8
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+import dataclasses
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STORE_PATH = os.getenv(
+    "RAG_PRECOMPUTE_PATH", os.path.join(ROOT, ".cache", "rag_precomputed.sqlite3")
+)
+SERVE_PRECOMPUTED = os.getenv("RAG_PRECOMPUTE_SERVE", "1") == "1"
+PRECOMPUTE_VERSION = os.getenv("RAG_PRECOMPUTE_VERSION", "1")
+DEFAULT_MODES = ("v1", "v2", "v3")
+
+
+def compute_input_hash(mct_id: str, mode: str, top_k: int, profile, model_name: str,
+                       fingerprints: Sequence) -> str:
+    """결과를 결정하는 입력 전체의 sha256 (profile 은 RagProfile dataclass)"""
+    raw = json.dumps(
+        {
+            "store": str(mct_id),
+            "mode": mode,
+            "top_k": top_k,
+            "profile": dataclasses.asdict(profile),
+            "model": model_name,
+            "vector_dbs": [list(map(list, fp)) for fp in fingerprints],
+            "version": PRECOMPUTE_VERSION,
+        },
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ------------------------------------------------
+# 결과 저장소
+# ------------------------------------------------
+class PrecomputedStore:
+    """(store_code, mode, profile) 별 최신 결과 1건. 해시가 다르면 오래된 결과로 보고 미스 처리."""
+
+    def __init__(self, db_path: Optional[str] = DEFAULT_STORE_PATH, serve: bool = SERVE_PRECOMPUTED):
+        self.serve = serve
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "stores": 0}
+        self._db = self._open_db(db_path) if db_path else None
+
+    @staticmethod
+    def _open_db(db_path: str):
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS precomputed ("
+                " store_code TEXT, mode TEXT, profile TEXT, input_hash TEXT,"
+                " result TEXT, created_at REAL,"
+                " PRIMARY KEY (store_code, mode, profile))"
+            )
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            print(f"⚠️ [Precompute] 결과 저장소 비활성화: {e}")
+            return None
+
+    @property
+    def enabled(self) -> bool:
+        return self.serve and self._db is not None
+
+    def _row(self, store_code: str, mode: str, profile: str) -> Optional[tuple]:
+        if self._db is None:
+            return None
+        try:
+            with self._lock:
+                return self._db.execute(
+                    "SELECT input_hash, result FROM precomputed WHERE store_code = ? AND mode = ? AND profile = ?",
+                    (str(store_code), mode, profile),
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+
+    def get(self, store_code: str, mode: str, profile: str, input_hash: str) -> Optional[Dict[str, Any]]:
+        row = self._row(store_code, mode, profile)
+        if row is None:
+            self.counters["misses"] += 1
+            return None
+        if row[0] != input_hash:
+            self.counters["stale"] += 1
+            return None
+        self.counters["hits"] += 1
+        return json.loads(row[1])
+
+    def is_fresh(self, store_code: str, mode: str, profile: str, input_hash: str) -> bool:
+        row = self._row(store_code, mode, profile)
+        return row is not None and row[0] == input_hash
+
+    def put(self, store_code: str, mode: str, profile: str, input_hash: str, result: Dict[str, Any]) -> None:
+        if self._db is None:
+            return
+        payload = {k: v for k, v in result.items() if k not in ("timing", "cache_hit")}
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO precomputed VALUES (?, ?, ?, ?, ?, ?)",
+                    (str(store_code), mode, profile, input_hash,
+                     json.dumps(payload, ensure_ascii=False), time.time()),
+                )
+                self._db.commit()
+            self.counters["stores"] += 1
+        except sqlite3.Error as e:
+            print(f"⚠️ [Precompute] 저장 실패 ({store_code}, {mode}): {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self.counters)
+        c["enabled"] = self.enabled
+        if self._db is not None:
+            try:
+                with self._lock:
+                    c["rows"] = self._db.execute("SELECT COUNT(*) FROM precomputed").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        total = c["hits"] + c["misses"] + c["stale"]
+        c["hit_rate"] = round(c["hits"] / total, 4) if total else 0.0
+        return c
+
+
+_shared_store: Optional[PrecomputedStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_precomputed_store() -> PrecomputedStore:
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = PrecomputedStore()
+        return _shared_store
+
+
+# ------------------------------------------------
+# 배치 생성
+# ------------------------------------------------
+def run_precompute(modes: Sequence[str] = DEFAULT_MODES, profile: Optional[str] = None,
+                   workers: Optional[int] = None, stores: Optional[List[str]] = None,
+                   top_k: int = 5, force: bool = False, limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    매장 × 모드 조합을 생성해 저장소에 기록. Gemini 호출은 gemini_client 공용 리미터(RPM/TPM/동시 실행)를
+    그대로 거치므로 workers 는 준비 단계(검색/프롬프트) 병렬도 정도로만 잡으면 된다.
+    """
+    from analyzer import gemini_client
+    from analyzer.bulk_runner import discover_stores, run_items
+    from analyzer.rag_engine import get_engine
+
+    engine = get_engine(profile)
+    store = get_precomputed_store()
+    workers = workers or gemini_client.MAX_IN_FLIGHT
+
+    jobs = discover_stores(modes, profile, stores, label="Precompute")
+    if limit:
+        jobs = jobs[:limit]
+
+    summary = {"total": len(jobs), "generated": 0, "skipped": 0, "failed": 0}
+    t0 = time.time()
+    print(f"🌙 [Precompute] {len(jobs)}개 조합 (profile={engine.name}, workers={workers})")
+
+    def _one(code: str, mode: str) -> str:
+        input_hash = engine.input_hash(code, mode, top_k)
+        if not force and store.is_fresh(code, mode, engine.name, input_hash):
+            return "skipped"
+        result = engine.generate(code, mode, top_k, use_precomputed=False)
+        if "error" in result:
+            print(f"❌ [Precompute] {code} ({mode}): {result['error']}")
+            return "failed"
+        store.put(code, mode, engine.name, input_hash, result)
+        return "generated"
+
+    summary.update(run_items(jobs, _one, workers, label="Precompute"))
+    summary["seconds"] = round(time.time() - t0, 1)
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="매장 × 모드 RAG 요약 사전 생성 (야간 배치)")
+    parser.add_argument("--modes", default=",".join(DEFAULT_MODES), help="쉼표 구분 모드 (기본 v1,v2,v3)")
+    parser.add_argument("--profile", default=None, help="RagEngine 프로파일 (기본 RAG_PROFILE)")
+    parser.add_argument("--workers", type=int, default=None, help="동시 작업 수 (기본 RAG_GEMINI_MAX_IN_FLIGHT)")
+    parser.add_argument("--stores", default=None, help="쉼표 구분 매장 코드 (기본: 모드별 리포트 벡터DB 전체)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=None, help="처리할 최대 조합 수 (점검용)")
+    parser.add_argument("--force", action="store_true", help="최신 결과가 있어도 다시 생성")
+    args = parser.parse_args()
+
+    summary = run_precompute(
+        modes=[m.strip() for m in args.modes.split(",") if m.strip()],
+        profile=args.profile,
+        workers=args.workers,
+        stores=[s.strip() for s in args.stores.split(",") if s.strip()] if args.stores else None,
+        top_k=args.top_k,
+        force=args.force,
+        limit=args.limit,
+    )
+    print(f"✅ [Precompute] 완료: {summary}")
+
+
+if __name__ == "__main__":
+    main()
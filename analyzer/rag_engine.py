@@ -4,20 +4,44 @@ rag_engine.py
 Gemini-2.5-Flash + FAISS 기반 RAG 엔진
 - 주 고객층 강화 전략 + 유사매장 타겟 확장 전략 병합형 분석
 - 현재 매장 페르소나(summary/persona 등)를 프롬프트 컨텍스트 최상단에 앵커로 삽입
+- 검색: 듀얼 쿼리 → FAISS + BM25 RRF 융합(lexical_index) → MMR 다양성 선택 → (opt-in) cross-encoder 재순위화(reranker)
+- 사전 생성 결과(precompute.py, 야간 배치) → 히트면 즉시 반환, 미스면 라이브 생성
+- 응답 캐시: 프롬프트 정확 일치(response_cache) → 근사 중복 컨텍스트(semantic_cache, 모드별 opt-in)
+- RagEngine: load → embed → retrieve → select → prompt → cache → generate 단계형 파이프라인
+  (단계별 교체/타이밍, 동작 차이는 rag_profiles.py 의 이름 있는 프로파일로 선택 — RAG_PROFILE)
+- 진입점: generate_rag_summary (동기) / stream_rag_summary (스트리밍) / generate_rag_summary_async (async)
+  — 모두 프로파일 엔진의 prepare → Gemini → finalize 단계를 공유
 """
 
 import os
-import json
+import asyncio
 import traceback
-import threading
 import time
+import threading
+from functools import partial
 import numpy as np
-import faiss
-from typing import Dict, Any, List, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 import google.generativeai as genai
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from analyzer.vector_registry import get_vector_db, get_vector_entry
+from analyzer.embedding_cache import QueryEmbeddingCache
+from analyzer.response_cache import get_response_cache, make_cache_key
+from analyzer.semantic_cache import SemanticCache
+from analyzer.context_builder import build_context, budget_for_mode, count_tokens
+from analyzer.reranker import Reranker
+from analyzer.precompute import compute_input_hash, get_precomputed_store
+from analyzer.rag_profiles import DEFAULT_PROFILE, RagProfile, brief_prompt, get_profile, legacy_prompt
+from analyzer.lexical_index import HYBRID_ENABLED, dense_rankings, rrf_candidates, rrf_scores
+from analyzer.mmr_selector import (
+    MMR_ENABLED, MMR_FETCH_K, MMR_K, MMR_LAMBDA,
+    attach_vectors, collect_candidates, mmr_select, split_by_source,
+)
+from analyzer import gemini_client, tracing
+from analyzer.tracing import Trace, span
+from analyzer.embedder import EMBEDDER_BACKEND, EmbedderHandle, cache_model_key
 
 # ------------------------------------------------
 # ✅ 병렬/성능 설정
@@ -35,54 +59,120 @@ load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 print("🔍 GEMINI_API_KEY =", "✅ 로드 완료" if os.getenv("GEMINI_API_KEY") else "❌ 없음")
 
-embedder = None
-_embedder_lock = threading.Lock()
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+_response_cache = get_response_cache()
+_semantic_cache = SemanticCache()
+_reranker = Reranker()
+_precomputed = get_precomputed_store()
+
+# 요청 스레드가 임베더 준비를 기다리는 최대 시간(초) — 초과 시 어휘 검색으로 폴백
+EMBEDDER_WAIT_TIMEOUT = float(os.getenv("RAG_EMBEDDER_WAIT_TIMEOUT", "3"))
+
+_query_cache = QueryEmbeddingCache(cache_model_key(EMBEDDER_BACKEND))
+
+
+def _on_embedder_ready(model) -> None:
+    # 공유 임베딩 서버(RemoteEmbedder)는 서버가 보고한 백엔드로 캐시 키를 맞춘다 (int8/onnx 서버 ≠ fp32 키)
+    from analyzer.embedding_server import RemoteEmbedder
+
+    if isinstance(model, RemoteEmbedder) and model.backend:
+        _query_cache.set_model_name(cache_model_key(model.backend))
+    _query_cache.precompute(model, constant_queries())
+
+
+_embedder = EmbedderHandle(EMBEDDER_BACKEND, on_ready=_on_embedder_ready)
+
+
+def get_embedder_status() -> Dict[str, Any]:
+    """임베더 수명주기 상태 (idle/loading/ready/failed, 로드·워밍업 시간, 오류)"""
+    return _embedder.status()
 
-def _load_embedder_background():
-    global embedder
-    try:
-        with _embedder_lock:
-            if embedder is None:
-                print("🚀 [Init] 임베딩 모델 백그라운드 로드 시작...")
-                t0 = time.time()
-                embedder = SentenceTransformer("BAAI/bge-m3")
-                print(f"✅ [Init] 임베딩 모델 로드 완료 (전역 1회, {time.time() - t0:.2f}s)")
-    except Exception as e:
-        print("❌ 임베딩 모델 로드 실패:", e)
 
-threading.Thread(target=_load_embedder_background, daemon=True).start()
+def wait_for_embedder(timeout: float = EMBEDDER_WAIT_TIMEOUT):
+    """준비된 임베더 또는 None (timeout 초과/로드 실패)"""
+    return _embedder.wait(timeout)
 
 
 # ------------------------------------------------
-# 벡터DB 로드 유틸
+# 벡터DB 로드 유틸 (프로세스 전역 레지스트리 경유)
 # ------------------------------------------------
 def load_vector_db(folder_path: str, base_name: str):
-    t0 = time.time()
-    index_path = os.path.join(folder_path, f"{base_name}.faiss")
-    meta_path = os.path.join(folder_path, f"{base_name}_metadata.jsonl")
-    if not os.path.exists(index_path) or not os.path.exists(meta_path):
-        raise FileNotFoundError(f"[{base_name}] 파일을 찾을 수 없습니다: {folder_path}")
-    index = faiss.read_index(index_path)
-    with open(meta_path, "r", encoding="utf-8") as f:
-        metadata = [json.loads(line.strip()) for line in f]
-    print(f"⏱️ [load_vector_db] {base_name} 로드 완료 ({time.time() - t0:.2f}s)")
-    return index, metadata
+    """
+    (folder, base_name) 별로 프로세스당 1회만 로드/워밍된 (index, metadata) 반환.
+    파일 mtime/size 가 바뀐 경우에만 재로드한다. (analyzer/vector_registry.py)
+    """
+    return get_vector_db(folder_path, base_name)
 
 
 # ------------------------------------------------
 # 유사 문서 검색
 # ------------------------------------------------
 def retrieve_similar_docs(index, metadata, query_vector: np.ndarray, top_k: int = 5):
+    return retrieve_similar_docs_batch(index, metadata, query_vector, top_k)[0]
+
+
+def retrieve_similar_docs_batch(index, metadata, query_vectors: np.ndarray, top_k: int = 5) -> List[List[dict]]:
+    """nq×d 쿼리 행렬로 인덱스를 1회만 검색하고, 쿼리별 히트 리스트를 반환"""
     t0 = time.time()
-    D, I = index.search(query_vector, top_k)
-    results = [metadata[idx] for idx in I[0] if 0 <= idx < len(metadata)]
-    print(f"⏱️ [retrieve_similar_docs] 검색 완료 ({time.time() - t0:.2f}s)")
+    D, I = index.search(query_vectors, top_k)
+    results = [[metadata[idx] for idx in row if 0 <= idx < len(metadata)] for row in I]
+    print(f"⏱️ [retrieve_similar_docs] 검색 완료 (nq={len(I)}, {time.time() - t0:.2f}s)")
     return results
 
 
+# 리포트/세그먼트 인덱스 동시 검색용 (FAISS search 는 GIL 을 해제)
+_search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-search")
+
+
+# ------------------------------------------------
+# 어휘 기반 폴백 검색 (임베더 미준비 + RAG_HYBRID=0 일 때)
+# ------------------------------------------------
+def retrieve_lexical_docs(metadata, query: str, top_k: int = 5) -> List[dict]:
+    """쿼리 토큰의 text 내 등장 횟수로 점수화하는 단순 어휘 검색"""
+    tokens = [t for t in query.replace(",", " ").replace("/", " ").split() if len(t) >= 2]
+    scored = []
+    for i in range(len(metadata)):
+        text = metadata[i].get("text", "")
+        score = sum(text.count(t) for t in tokens)
+        if score:
+            scored.append((score, i))
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [metadata[i] for _, i in scored[:top_k]]
+
+
+def _extend_unique(target: List[dict], docs: List[dict]) -> None:
+    for doc in docs:
+        if doc not in target:
+            target.append(doc)
+
+
+def _encode_queries(queries: List[str], timeout: float = EMBEDDER_WAIT_TIMEOUT) -> List[Optional[np.ndarray]]:
+    """
+    캐시 히트는 임베더 없이 반환하고, 미스가 있을 때만 임베더를 timeout 까지 기다려 인코딩.
+    임베더가 준비되지 않은 쿼리는 None (호출측에서 어휘 검색으로 폴백).
+    """
+    vecs = [_query_cache.get(q) for q in queries]
+    missing = [i for i, v in enumerate(vecs) if v is None]
+    if missing:
+        model = _embedder.wait(timeout)
+        if model is None:
+            print(f"⚠️ [Embedder] 준비되지 않음 ({_embedder.state}) → {len(missing)}개 쿼리 어휘 검색 폴백")
+            return vecs
+        encoded = _query_cache.encode(model, [queries[i] for i in missing])
+        for i, vec in zip(missing, encoded):
+            vecs[i] = vec
+    return vecs
+
+
 # ------------------------------------------------
 # (개선A) 듀얼 쿼리 — 우리 매장 강화 + 유사매장 확장
 # ------------------------------------------------
+SIMILAR_STORE_QUERY = (
+    "유사 매장에서 성공한 타겟 확장 전략, 연령/성별별 타겟팅, "
+    "채널별 성과, 트렌드 기반 마케팅 사례"
+)
+
+
 def build_dual_queries(mct_id: str, mode: str) -> List[str]:
     """매장 중심 쿼리 + 유사매장 타겟 전략 쿼리 동시 수행"""
     base_intent = {
@@ -92,13 +182,86 @@ def build_dual_queries(mct_id: str, mode: str) -> List[str]:
     }.get(mode, "매장 분석, 마케팅 전략, 데이터 기반 인사이트")
 
     query_1 = f"{mct_id} 매장의 {base_intent} 및 주 고객층 강화 전략"  # 우리 매장 중심
-    query_2 = (
-        "유사 매장에서 성공한 타겟 확장 전략, 연령/성별별 타겟팅, "
-        "채널별 성과, 트렌드 기반 마케팅 사례"  # 확장 타겟 참고
-    )
+    query_2 = SIMILAR_STORE_QUERY  # 확장 타겟 참고
     return [query_1, query_2]
 
 
+def constant_queries() -> List[str]:
+    """매장/모드와 무관한 상수 쿼리 — 기동 시 임베딩 캐시에 미리 채움"""
+    return [SIMILAR_STORE_QUERY]
+
+
+def embedding_cache_stats() -> Dict[str, float]:
+    """쿼리 임베딩 캐시 히트율/카운터 (메모리·디스크 계층 포함)"""
+    return _query_cache.stats()
+
+
+def response_cache_stats() -> Dict[str, Any]:
+    """Gemini 응답 캐시 hit/miss/eviction 카운터"""
+    return _response_cache.stats()
+
+
+def gemini_limiter_stats() -> Dict[str, Any]:
+    """공용 Gemini 리미터 대기열/동시 실행/쿼터 지표"""
+    return gemini_client.limiter_stats()
+
+
+def semantic_cache_stats() -> Dict[str, Any]:
+    """근사 중복 캐시 모드별 히트율 / 절약된 LLM 시간(초)"""
+    return _semantic_cache.stats()
+
+
+def precomputed_stats() -> Dict[str, Any]:
+    """사전 생성 결과 저장소 히트/미스/오래된 결과(stale) 수"""
+    return _precomputed.stats()
+
+
+def rerank_stats() -> Dict[str, Any]:
+    """cross-encoder 재순위화 상태 / 점수 캐시 히트율 / 예산 초과 중단 횟수"""
+    return _reranker.stats()
+
+
+def set_semantic_cache_threshold(mode: str, threshold: Optional[float]) -> None:
+    """모드별 근사 중복 캐시 임계값 설정 (None/0 → 해당 모드 비활성)"""
+    _semantic_cache.set_threshold(mode, threshold)
+
+
+def _embed_context(text: str) -> Tuple[Optional[np.ndarray], float]:
+    """검색 컨텍스트 임베딩 (쿼리 캐시는 거치지 않음). 임베더 미준비 시 (None, 0)."""
+    model = _embedder.wait(EMBEDDER_WAIT_TIMEOUT)
+    if model is None:
+        return None, 0.0
+    t0 = time.time()
+    vec = model.encode([text], normalize_embeddings=True)
+    return np.asarray(vec, dtype=np.float32)[0], time.time() - t0
+
+
+# ------------------------------------------------
+# 근사 중복 캐시 버킷 키 — 우리 매장 자기 청크가 같은 매장끼리만 응답 공유
+# ------------------------------------------------
+def build_semantic_anchor(mct_id: str, own_reports: List[dict]) -> str:
+    """
+    store_code 역색인으로 찾은 자기 청크 본문(매장 코드/상호는 자리표시로 치환)을 이어 붙인 문자열.
+    자기 진단 내용이 같은 이웃 매장은 같은 버킷에 들어가고, 자기 청크가 없으면 매장 코드 단독 버킷.
+    """
+    if not own_reports:
+        return f"store:{mct_id}"
+    parts = []
+    for row in own_reports:
+        text = row.get("text", "") or ""
+        for ident in (str(row.get("store_code") or mct_id), row.get("store_name")):
+            if ident:
+                text = text.replace(str(ident), "<STORE>")
+        parts.append(text)
+    return "own:" + "\n".join(parts)
+
+
+def _store_identifiers(mct_id: str, own_reports: List[dict]) -> Tuple[str, ...]:
+    """응답 본문에 등장하면 다른 매장에 재사용할 수 없는 식별자 (매장 코드, 상호)"""
+    names = {str(r["store_name"]) for r in own_reports if r.get("store_name")}
+    return (str(mct_id),) + tuple(sorted(names))
+
+
 # ------------------------------------------------
 # (개선B) 현재 매장 페르소나/요약 앵커 생성
 # ------------------------------------------------
@@ -124,18 +287,6 @@ def build_store_profile_anchor(report_results: List[dict]) -> str:
     return "📊 [현재 매장 데이터 분석]\n" + "\n".join(fields) + "\n"
 
 
-# ------------------------------------------------
-# (보조) 라인 중복 제거
-# ------------------------------------------------
-def dedupe_lines(text: str) -> str:
-    lines, seen, out = text.splitlines(), set(), []
-    for ln in lines:
-        if ln not in seen:
-            seen.add(ln)
-            out.append(ln)
-    return "\n".join(out)
-
-
 # ------------------------------------------------
 # 프롬프트 (v1/v2/v3 실행형으로 통일)
 # ------------------------------------------------
@@ -207,93 +358,498 @@ def get_prompt_for_mode(mode: str, mct_id: str, combined_context: str) -> str:
 
 
 # ------------------------------------------------
-# RAG 리포트 생성
+# 단계형 RAG 엔진
+#   load → embed → retrieve → select → prompt → cache → (generate)
+#   - 각 단계는 run(dict) 을 읽고 채우는 함수, stages= 로 단계별 교체 가능 (fn(engine, run))
+#   - 단계별 소요시간은 tracing span 으로 측정 → 결과 timing["stages"] + 프로파일별 전역 p50/p95/p99
+#     (load 안의 vector_load, prompt 안의 context_build 등 중첩 구간 포함)
+#   - 동작 차이(쿼리/검색/컨텍스트/프롬프트/캐시/출력 제한)는 RagProfile 로 표현 (rag_profiles.py)
 # ------------------------------------------------
-def generate_rag_summary(mct_id: str, mode: str = "v1", top_k: int = 5) -> Dict[str, Any]:
-    t_start = time.time()
-    print(f"🚀 [RAG Triggered] mct_id={mct_id}, mode={mode}")
+PREPARE_STAGES = ("load", "embed", "retrieve", "select", "prompt", "cache")
+STAGES = PREPARE_STAGES + ("generate",)
+
+_PROMPT_BUILDERS = {
+    "full": get_prompt_for_mode,
+    "brief": brief_prompt,
+    "legacy": legacy_prompt,
+}
+
+
+def _compact_text(text: str) -> str:
+    return " ".join(text.split())
 
-    try:
-        # 1) 벡터DB 로드
+
+class RagEngine:
+    """프로파일 1개에 대응하는 RAG 파이프라인. 임베더/캐시/벡터DB 는 프로세스 공용 자원을 공유한다."""
+
+    def __init__(self, profile: Union[str, RagProfile, None] = None,
+                 stages: Optional[Dict[str, Callable[["RagEngine", Dict[str, Any]], None]]] = None,
+                 model_name: str = GEMINI_MODEL_NAME):
+        self.profile = profile if isinstance(profile, RagProfile) else get_profile(profile)
+        self.model_name = model_name
+        self._stages: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            name: getattr(self, f"stage_{name}") for name in PREPARE_STAGES
+        }
+        for name, fn in (stages or {}).items():
+            if name not in PREPARE_STAGES:
+                raise ValueError(f"알 수 없는 단계: {name} (가능: {', '.join(PREPARE_STAGES)})")
+            self._stages[name] = partial(fn, self)
+
+    @property
+    def name(self) -> str:
+        return self.profile.name
+
+    # ------------------------------------------------
+    # 단계 실행 / 타이밍
+    # ------------------------------------------------
+    def stage_stats(self) -> Dict[str, Dict[str, float]]:
+        """이 프로파일의 구간별 호출 횟수 / 평균·최대 / p50·p95·p99 (ms) — 프로파일 간 A/B 비교용"""
+        return tracing.percentiles(self.name)
+
+    def prepare(self, mct_id: str, mode: str = "v1", top_k: int = 5) -> Dict[str, Any]:
+        """
+        Gemini 호출 직전까지의 상태 dict 반환
+        (prompt, cache_key, cache_hit, rag_text(히트 시), persona_anchor, semantic_anchor, context_vec,
+         report_results, segment_results, context_info, trace, t_start, t_prepared).
+        관련 데이터가 없으면 {"error": ...}. 예외는 호출측에서 처리한다.
+        """
+        run: Dict[str, Any] = {
+            "mct_id": mct_id,
+            "mode": mode,
+            "top_k": top_k,
+            "profile": self.name,
+            "trace": Trace(self.name),
+            "t_start": time.time(),
+        }
+        for stage in PREPARE_STAGES:
+            with run["trace"].span(stage):
+                self._stages[stage](run)
+            if "error" in run:
+                return {"error": run["error"]}
+        run["t_prepared"] = time.time()
+        return run
+
+    # ------------------------------------------------
+    # 1) 벡터DB 로드 + 쿼리 구성
+    # ------------------------------------------------
+    def vector_entries(self, mode: str):
+        """(모드별 리포트 엔트리, 공통 세그먼트 엔트리) — 프로세스 전역 레지스트리 경유"""
         base_dir = os.path.dirname(os.path.abspath(__file__))
         report_folder = os.path.join(base_dir, "vector_dbs", mode)
         shared_folder = os.path.join(base_dir, "vector_dbs", "shared")
-        reports_index, reports_meta = load_vector_db(report_folder, "marketing_reports")
-        segments_index, segments_meta = load_vector_db(shared_folder, "marketing_segments")
-
-        # 2) 임베딩 준비
-        global embedder
-        if embedder is None:
-            _load_embedder_background()
-            while embedder is None:
-                time.sleep(0.5)
-
-        # 3) 듀얼 쿼리 검색 (우리 매장 강화 + 유사매장 확장)
-        queries = build_dual_queries(mct_id, mode)
-        all_reports, all_segments = [], []
-        for q in queries:
-            q_emb = embedder.encode([q], normalize_embeddings=True)
-            q_vec = np.array(q_emb, dtype=np.float32)
-            all_reports.extend(retrieve_similar_docs(reports_index, reports_meta, q_vec, top_k))
-            all_segments.extend(retrieve_similar_docs(segments_index, segments_meta, q_vec, top_k))
-
-        # 4) (간단) 중복 제거
-        def _uniq(items: List[dict], key_priority: List[str]) -> List[dict]:
-            seen, out = set(), []
-            for i, it in enumerate(items):
-                key = None
-                for k in key_priority:
-                    if it.get(k) is not None:
-                        key = f"{k}:{it.get(k)}"
-                        break
-                if key is None:
-                    key = f"idx:{i}"
-                if key not in seen:
-                    seen.add(key)
-                    out.append(it)
-            return out
-
-        report_results = _uniq(all_reports, ["id", "chunk_id", "store_code"])
-        segment_results = _uniq(all_segments, ["id", "chunk_id", "store_code"])
+        return (
+            get_vector_entry(report_folder, "marketing_reports"),
+            get_vector_entry(shared_folder, "marketing_segments"),
+        )
 
-        if not report_results and not segment_results:
-            return {"error": f"'{mct_id}' 관련 데이터를 찾을 수 없습니다."}
-
-        # 5) 페르소나 앵커 구성
-        persona_anchor = build_store_profile_anchor(report_results)
-
-        # 6) 컨텍스트 병합 (앵커 → 우리 매장 데이터 → 유사 매장 사례)
-        report_context = "\n\n".join([r.get("text", "") for r in report_results])
-        segment_context = "\n\n".join([s.get("text", "") for s in segment_results])
-
-        combined_context = ""
-        if persona_anchor:
-            combined_context += persona_anchor + "\n"
-        combined_context += (
-            "[매장 주요 분석 및 고객층 강화 데이터]\n"
-            + (report_context or "(데이터 없음)") + "\n\n"
-            + "[유사 매장 타겟 확장 전략 사례]\n"
-            + (segment_context or "(데이터 없음)")
+    def stage_load(self, run: Dict[str, Any]) -> None:
+        mct_id, mode = run["mct_id"], run["mode"]
+        with span("vector_load"):
+            run["reports_entry"], run["segments_entry"] = self.vector_entries(mode)
+
+        # 우리 매장 청크는 store_code 역색인으로 정확 조회 (ANN 불필요)
+        own_reports = run["reports_entry"].rows_for_store(mct_id) if self.profile.exact_own_store else []
+        run["own_reports"] = own_reports
+        if self.profile.queries == "store_code":
+            run["queries"] = [str(mct_id)]
+        elif own_reports:
+            print(f"🎯 [Exact] store_code 역색인 히트: {len(own_reports)}개 청크")
+            run["queries"] = [SIMILAR_STORE_QUERY]  # ANN 은 유사매장/세그먼트 쪽만
+        else:
+            run["queries"] = build_dual_queries(mct_id, mode)
+
+    # ------------------------------------------------
+    # 2) 쿼리 배치 인코딩 (캐시 히트 시 임베더 불필요, 미준비 쿼리는 None)
+    # ------------------------------------------------
+    def stage_embed(self, run: Dict[str, Any]) -> None:
+        t_enc = time.time()
+        run["q_vecs"] = _encode_queries(run["queries"])
+        print(f"⏱️ [임베딩] {len(run['queries'])}개 쿼리 배치 인코딩/캐시 조회 ({time.time() - t_enc:.2f}s)")
+
+    # ------------------------------------------------
+    # 3) 검색 — 인덱스별 nq×d 행렬 1회 검색(리포트/세그먼트 병렬),
+    #    하이브리드면 쿼리별 FAISS 순위 + BM25 순위를 RRF 로 융합
+    #    (임베더가 준비되지 않으면 BM25 순위만으로 후보 구성)
+    # ------------------------------------------------
+    def stage_retrieve(self, run: Dict[str, Any]) -> None:
+        reports_entry, segments_entry = run["reports_entry"], run["segments_entry"]
+        reports_index, segments_index = reports_entry.index, segments_entry.index
+        queries, q_vecs = run["queries"], run["q_vecs"]
+        own_rows = reports_entry.store_rows.get(str(run["mct_id"]), ()) if run["own_reports"] else ()
+        mmr = self.profile.mmr and MMR_ENABLED
+        fetch_k = max(run["top_k"], MMR_FETCH_K) if mmr else run["top_k"]
+        hybrid = (
+            self.profile.hybrid and HYBRID_ENABLED
+            and reports_entry.lexical is not None and segments_entry.lexical is not None
         )
-        combined_context = dedupe_lines(combined_context)
+        rep_cands: Dict[int, Any] = {}
+        seg_cands: Dict[int, Any] = {}
+        rep_rankings: List[List[int]] = []
+        seg_rankings: List[List[int]] = []
+
+        dense = [i for i, v in enumerate(q_vecs) if v is not None]
+        if dense:
+            q_mat = np.vstack([q_vecs[i] for i in dense]).astype(np.float32, copy=False)
+            report_future = _search_pool.submit(reports_index.search, q_mat, fetch_k)
+            seg_D, seg_I = segments_index.search(q_mat, fetch_k)
+            rep_D, rep_I = report_future.result()
+            rep_cands = collect_candidates("report", rep_D, rep_I, reports_index.metric_type, exclude_rows=own_rows)
+            seg_cands = collect_candidates("segment", seg_D, seg_I, segments_index.metric_type)
+            rep_rankings += dense_rankings(rep_I, own_rows)
+            seg_rankings += dense_rankings(seg_I)
+
+        if hybrid:
+            for q in queries:
+                rep_rankings.append([r for r, _ in reports_entry.lexical.search(q, fetch_k, exclude_rows=own_rows)])
+                seg_rankings.append([r for r, _ in segments_entry.lexical.search(q, fetch_k)])
+            rep_fused, seg_fused = rrf_scores(rep_rankings), rrf_scores(seg_rankings)
+            scale = max(list(rep_fused.values()) + list(seg_fused.values()), default=0.0)
+            rep_cands = rrf_candidates("report", rep_fused, scale)
+            seg_cands = rrf_candidates("segment", seg_fused, scale)
+
+        run.update(rep_cands=rep_cands, seg_cands=seg_cands, hybrid=hybrid, mmr=mmr, dense=bool(dense))
+
+    # ------------------------------------------------
+    # 4) 선택 — MMR(관련도 + 복원 임베딩 기반 다양성) → (opt-in) cross-encoder 재순위화
+    # ------------------------------------------------
+    def stage_select(self, run: Dict[str, Any]) -> None:
+        mct_id, top_k = run["mct_id"], run["top_k"]
+        reports_entry, segments_entry = run["reports_entry"], run["segments_entry"]
+        reports_meta, segments_meta = reports_entry.metadata, segments_entry.metadata
+        rep_cands, seg_cands = run["rep_cands"], run["seg_cands"]
+        own_reports = run["own_reports"]
+
+        # 우리 매장 청크를 맨 앞에 고정 → build_store_profile_anchor 가 자기 매장을 앵커로 사용
+        report_results: List[dict] = list(own_reports)
+        segment_results: List[dict] = []
+        pool = list(rep_cands.values()) + list(seg_cands.values())
+        if pool:
+            if run["mmr"]:
+                attach_vectors(reports_entry.index, rep_cands)
+                attach_vectors(segments_entry.index, seg_cands)
+                picked = mmr_select(pool, MMR_K)
+            else:
+                picked = mmr_select(pool, len(pool), lambda_=1.0)  # 관련도 순 전체
+            picked_reports, picked_segments = split_by_source(picked)
+            report_results += [reports_meta[c.row] for c in picked_reports]
+            segment_results += [segments_meta[c.row] for c in picked_segments]
+            source = (" (dense+BM25 RRF)" if run["dense"] else " (BM25)") if run["hybrid"] else ""
+            print(
+                f"🧩 [{'MMR' if run['mmr'] else 'Select'}] 후보 {len(pool)}개{source} → "
+                f"리포트 {len(picked_reports)} / 세그먼트 {len(picked_segments)} "
+                f"(λ={MMR_LAMBDA if run['mmr'] else 1.0})"
+            )
+
+        # 하이브리드 비활성 시: 임베딩이 없는 쿼리는 단순 어휘 검색 결과를 중복 없이 뒤에 덧붙임
+        if not run["hybrid"]:
+            for query, vec in zip(run["queries"], run["q_vecs"]):
+                if vec is None:
+                    lexical_reports = retrieve_lexical_docs(reports_meta, query, top_k)
+                    _extend_unique(report_results, [r for r in lexical_reports if str(r.get("store_code")) != str(mct_id)])
+                    _extend_unique(segment_results, retrieve_lexical_docs(segments_meta, query, top_k))
+
+        # (opt-in) cross-encoder 재순위화 — 유사 매장/세그먼트 후보를 점수 순 상위 N개로 압축
+        rerank_info: Dict[str, Any] = {}
+        if self.profile.rerank and _reranker.enabled:
+            candidates = [("report", d) for d in report_results[len(own_reports):]]
+            candidates += [("segment", d) for d in segment_results]
+            with span("rerank"):
+                kept, rerank_info = _reranker.rerank(
+                    " ".join(run["queries"]), candidates, text_of=lambda item: item[1].get("text", "")
+                )
+            report_results = list(own_reports) + [d for src, d in kept if src == "report"]
+            segment_results = [d for src, d in kept if src == "segment"]
 
-        # 7) 프롬프트 생성
-        prompt = get_prompt_for_mode(mode, mct_id, combined_context)
-        print(f"🧾 [Prompt Info] 글자 수: {len(prompt):,} / 예상 토큰 수: ~{len(prompt)//4}")
+        if not report_results and not segment_results:
+            run["error"] = f"'{mct_id}' 관련 데이터를 찾을 수 없습니다."
+            return
+        run.update(report_results=report_results, segment_results=segment_results, rerank_info=rerank_info)
+
+    # ------------------------------------------------
+    # 5) 앵커 + 컨텍스트 + 프롬프트
+    # ------------------------------------------------
+    def stage_prompt(self, run: Dict[str, Any]) -> None:
+        mct_id, mode = run["mct_id"], run["mode"]
+        own_reports, report_results, segment_results = run["own_reports"], run["report_results"], run["segment_results"]
+        persona_anchor = build_store_profile_anchor(report_results) if self.profile.anchor else ""
+
+        with span("context_build"):
+            if self.profile.context == "budget":
+                # 모드별 토큰 예산 안에서 앵커 → 우리 매장 → 유사 매장/세그먼트 순으로 채움
+                context = build_context(
+                    persona_anchor,
+                    [r.get("text", "") for r in own_reports],
+                    [r.get("text", "") for r in report_results[len(own_reports):]],
+                    [s.get("text", "") for s in segment_results],
+                    budget_for_mode(mode),
+                )
+                print(
+                    f"🧮 [Context] {context.tokens:,}/{context.budget or '∞'} 토큰, 사용 {context.used}, "
+                    f"제외 {context.dropped}개{' (문장 단위 절단)' if context.truncated else ''}"
+                )
+                combined_context, retrieved_text, context_info = context.text, context.retrieved_text, context.info()
+            else:
+                # 구 엔진 형식: 검색 결과를 그대로 연결 (compact 는 공백 압축)
+                join = _compact_text if self.profile.context == "compact" else (lambda s: s)
+                report_context = join("\n\n".join(r.get("text", "") for r in report_results))
+                segment_context = join("\n\n".join(s.get("text", "") for s in segment_results))
+                retrieved_text = f"[매장 분석 데이터]\n{report_context}\n\n[마케팅 전략 데이터]\n{segment_context}"
+                combined_context = f"{persona_anchor}\n{retrieved_text}" if persona_anchor else retrieved_text
+                context_info = {"tokens": count_tokens(combined_context), "budget": 0}
+        if run["rerank_info"]:
+            context_info["rerank"] = run["rerank_info"]
+
+        prompt = _PROMPT_BUILDERS[self.profile.prompt](mode, mct_id, combined_context)
+        print(f"🧾 [Prompt Info] 글자 수: {len(prompt):,} / 토큰 수: {count_tokens(prompt):,}")
+        run.update(
+            prompt=prompt, persona_anchor=persona_anchor,
+            retrieved_text=retrieved_text, context_info=context_info,
+        )
 
-        # 8) Gemini 호출
-        t4 = time.time()
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
-        print(f"⏱️ [Gemini 호출 시간] {time.time() - t4:.2f}s")
-        print(f"✅ [총 소요시간] {time.time() - t_start:.2f}s")
+    # ------------------------------------------------
+    # 6) 응답 캐시 조회 (미스일 때만 호출측이 Gemini 호출)
+    #    - 1차: 프롬프트(+모델+생성설정) 정확 일치
+    #    - 2차(모드별 opt-in): 자기 청크가 같은 매장(build_semantic_anchor) + 검색 컨텍스트 코사인 유사도 ≥ 임계값
+    #      (다른 매장의 응답은 그 매장 코드/상호가 본문에 없을 때만 그대로 재사용)
+    # ------------------------------------------------
+    def stage_cache(self, run: Dict[str, Any]) -> None:
+        mct_id, mode = run["mct_id"], run["mode"]
+        run["cache_key"] = make_cache_key(run["prompt"], self.model_name, self.profile.generation_config)
+        run["rag_text"], run["cache_hit"], run["context_vec"] = None, None, None
+        run["semantic_anchor"] = build_semantic_anchor(mct_id, run["own_reports"])
+        if not self.profile.response_cache:
+            return
+        rag_text = _response_cache.get(run["cache_key"])
+        if rag_text is not None:
+            run["rag_text"], run["cache_hit"] = rag_text, "exact"
+            print(f"⚡ [CACHE HIT] '{mct_id}' ({mode}) 응답 재사용")
+        elif self.profile.semantic_cache and _semantic_cache.enabled(mode):
+            context_vec, embed_s = _embed_context(run["retrieved_text"])
+            run["context_vec"] = context_vec
+            if context_vec is not None:
+                near = _semantic_cache.lookup(mode, run["semantic_anchor"], context_vec, embed_s, store_code=mct_id)
+                if near is not None:
+                    run["rag_text"] = near["text"]
+                    run["cache_hit"] = "semantic"
+                    print(
+                        f"⚡ [SEMANTIC HIT] '{mct_id}' ({mode}) ← '{near['store_code']}' "
+                        f"(cos={near['similarity']:.4f})"
+                    )
+
+    # ------------------------------------------------
+    # 사전 생성 결과 (precompute.py) — 입력 해시가 같으면 검색/LLM 없이 바로 반환
+    # ------------------------------------------------
+    def input_hash(self, mct_id: str, mode: str, top_k: int = 5) -> str:
+        reports_entry, segments_entry = self.vector_entries(mode)
+        return compute_input_hash(
+            mct_id, mode, top_k, self.profile, self.model_name,
+            [reports_entry.fingerprint, segments_entry.fingerprint],
+        )
 
+    def lookup_precomputed(self, mct_id: str, mode: str, top_k: int = 5) -> Optional[Dict[str, Any]]:
+        if not _precomputed.enabled:
+            return None
+        t0 = time.perf_counter()
+        result = _precomputed.get(mct_id, mode, self.name, self.input_hash(mct_id, mode, top_k))
+        if result is None:
+            return None
+        seconds = time.perf_counter() - t0
+        tracing.observe("precomputed", seconds, self.name)
+        print(f"⚡ [PRECOMPUTED HIT] '{mct_id}' ({mode}) 사전 생성 결과 반환 ({seconds * 1000:.1f}ms)")
+        result.update(
+            cache_hit="precomputed",
+            profile=self.name,
+            timing={
+                "prepare": round(seconds, 3), "first_token": round(seconds, 3), "total": round(seconds, 3),
+                "stages": {"precomputed": round(seconds, 4)},
+            },
+        )
+        return result
+
+    # ------------------------------------------------
+    # 마무리: 응답 캐시 기록 + 결과 구성
+    # ------------------------------------------------
+    def finalize(self, state: Dict[str, Any], rag_text: str, llm_seconds: Optional[float] = None,
+                 first_token_at: Optional[float] = None) -> Dict[str, Any]:
+        """새로 생성된 응답(llm_seconds 지정)은 캐시에 기록하고 최종 결과 dict 반환"""
+        mct_id, mode = state["mct_id"], state["mode"]
+        if llm_seconds is not None:
+            state["trace"].add("generate", llm_seconds)
+            if self.profile.response_cache:
+                _response_cache.put(state["cache_key"], rag_text, self.model_name)
+            if state["context_vec"] is not None:
+                _semantic_cache.store(
+                    mode, state["semantic_anchor"], state["context_vec"], rag_text, mct_id, llm_seconds,
+                    identifiers=_store_identifiers(mct_id, state["own_reports"]),
+                )
+            print(f"⏱️ [Gemini 호출 시간] {llm_seconds:.2f}s")
+        t_start, t_end = state["t_start"], time.time()
+        print(f"✅ [총 소요시간] {t_end - t_start:.2f}s")
         return {
             "store_code": mct_id,
-            "rag_summary": response.text,
-            "references": {"reports": report_results, "segments": segment_results},
+            "rag_summary": rag_text,
+            "references": {"reports": state["report_results"], "segments": state["segment_results"]},
+            "cache_hit": state["cache_hit"],
+            "context": state["context_info"],
+            "profile": self.name,
+            "timing": {
+                "prepare": round(state["t_prepared"] - t_start, 3),
+                "first_token": round((first_token_at or t_end) - t_start, 3),
+                "total": round(t_end - t_start, 3),
+                "stages": state["trace"].as_dict(),
+            },
         }
 
-    except Exception as e:
-        print(f"❌ RAG ERROR: {e}")
-        return {"error": str(e), "traceback": traceback.format_exc(limit=2)}
\ No newline at end of file
+    # ------------------------------------------------
+    # 7) 생성 — 스트리밍 / 동기 / async
+    # ------------------------------------------------
+    def stream(self, mct_id: str, mode: str = "v1", top_k: int = 5,
+               use_precomputed: bool = True) -> Iterator[Union[str, Dict[str, Any]]]:
+        """
+        Gemini 응답 텍스트 조각(str)을 도착하는 대로 yield 하고,
+        마지막에 generate 와 같은 결과 dict(+ timing)를 1회 yield 한다.
+        사전 생성/캐시 히트는 전체 텍스트를 한 조각으로 내보낸다. 오류 시 {"error", "traceback"} dict 만 yield.
+        """
+        print(f"🚀 [RAG Triggered] mct_id={mct_id}, mode={mode}, profile={self.name}")
+
+        try:
+            precomputed = self.lookup_precomputed(mct_id, mode, top_k) if use_precomputed else None
+            if precomputed is not None:
+                yield precomputed.get("rag_summary", "")
+                yield precomputed
+                return
+
+            state = self.prepare(mct_id, mode, top_k)
+            if "error" in state:
+                yield state
+                return
+
+            if state["cache_hit"]:
+                yield state["rag_text"]
+                yield self.finalize(state, state["rag_text"], first_token_at=time.time())
+                return
+
+            # Gemini 스트리밍 호출 (공용 리미터 경유) — 조각이 도착하는 즉시 전달
+            t4 = time.time()
+            first_token_at = None
+            parts = []
+            for chunk in gemini_client.stream_content(state["prompt"], self.model_name, self.profile.generation_config):
+                try:
+                    piece = chunk.text
+                except ValueError:  # 안전 필터 등으로 텍스트가 없는 조각
+                    continue
+                if not piece:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.time()
+                    print(f"⏱️ [첫 토큰] {first_token_at - state['t_start']:.2f}s")
+                parts.append(piece)
+                yield piece
+            yield self.finalize(state, "".join(parts), time.time() - t4, first_token_at)
+
+        except Exception as e:
+            print(f"❌ RAG ERROR: {e}")
+            yield {"error": str(e), "traceback": traceback.format_exc(limit=2)}
+
+    def generate(self, mct_id: str, mode: str = "v1", top_k: int = 5,
+                 use_precomputed: bool = True) -> Dict[str, Any]:
+        """stream 을 끝까지 소비해 최종 결과 dict 만 반환"""
+        result: Dict[str, Any] = {}
+        for event in self.stream(mct_id, mode, top_k, use_precomputed):
+            if isinstance(event, dict):
+                result = event
+        return result
+
+    async def generate_async(self, mct_id: str, mode: str = "v1", top_k: int = 5,
+                             use_precomputed: bool = True) -> Dict[str, Any]:
+        """
+        generate 의 awaitable 버전.
+        검색·프롬프트 구성은 _prepare_pool 에서, Gemini 호출은 generate_content_async 로 대기하므로
+        이벤트 루프 1개가 수백 개의 동시 LLM 요청을 유지할 수 있다.
+        """
+        print(f"🚀 [RAG Triggered/async] mct_id={mct_id}, mode={mode}, profile={self.name}")
+
+        try:
+            loop = asyncio.get_running_loop()
+            if use_precomputed:
+                precomputed = await loop.run_in_executor(
+                    _prepare_pool, self.lookup_precomputed, mct_id, mode, top_k
+                )
+                if precomputed is not None:
+                    return precomputed
+            state = await loop.run_in_executor(_prepare_pool, self.prepare, mct_id, mode, top_k)
+            if "error" in state:
+                return state
+            if state["cache_hit"]:
+                return self.finalize(state, state["rag_text"])
+
+            t4 = time.time()
+            response = await gemini_client.generate_content_async(
+                state["prompt"], self.model_name, self.profile.generation_config
+            )
+            return self.finalize(state, response.text, time.time() - t4)
+
+        except Exception as e:
+            print(f"❌ RAG ERROR: {e}")
+            return {"error": str(e), "traceback": traceback.format_exc(limit=2)}
+
+
+# 검색/임베딩(CPU·FAISS) 단계 오프로딩용 — Gemini 대기는 스레드를 점유하지 않음
+_prepare_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("RAG_PREPARE_WORKERS", str(num_cores))),
+    thread_name_prefix="rag-prepare",
+)
+
+_engines: Dict[str, RagEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(profile: Optional[str] = None) -> RagEngine:
+    """프로파일 이름별 공유 엔진 (기본 RAG_PROFILE)"""
+    name = profile or DEFAULT_PROFILE
+    engine = _engines.get(name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(name)
+            if engine is None:
+                engine = _engines[name] = RagEngine(name)
+    return engine
+
+
+def stage_stats() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """프로파일별 구간 통계 (count / mean / max / p50 / p95 / p99, ms)"""
+    return tracing.percentiles()
+
+
+# ------------------------------------------------
+# 모듈 수준 API (기본 프로파일 엔진 위임 — 기존 호출부 호환)
+# ------------------------------------------------
+def prepare_rag(mct_id: str, mode: str = "v1", top_k: int = 5, profile: Optional[str] = None) -> Dict[str, Any]:
+    return get_engine(profile).prepare(mct_id, mode, top_k)
+
+
+def finalize_rag(mct_id: str, mode: str, state: Dict[str, Any], rag_text: str,
+                 llm_seconds: Optional[float] = None, first_token_at: Optional[float] = None) -> Dict[str, Any]:
+    return get_engine(state.get("profile")).finalize(state, rag_text, llm_seconds, first_token_at)
+
+
+def stream_rag_summary(mct_id: str, mode: str = "v1", top_k: int = 5,
+                       profile: Optional[str] = None) -> Iterator[Union[str, Dict[str, Any]]]:
+    return get_engine(profile).stream(mct_id, mode, top_k)
+
+
+def generate_rag_summary(mct_id: str, mode: str = "v1", top_k: int = 5, profile: Optional[str] = None) -> Dict[str, Any]:
+    return get_engine(profile).generate(mct_id, mode, top_k)
+
+
+async def generate_rag_summary_async(mct_id: str, mode: str = "v1", top_k: int = 5,
+                                     profile: Optional[str] = None) -> Dict[str, Any]:
+    return await get_engine(profile).generate_async(mct_id, mode, top_k)
+
+
+# ------------------------------------------------
+# 임베딩 모델(및 opt-in cross-encoder) 백그라운드 로드 시작
+# (상수 쿼리 프리컴퓨트가 모듈 하단 정의를 참조하므로 모듈 끝에서 기동)
+# ------------------------------------------------
+_embedder.start()
+_reranker.start()
@@ -0,0 +1,207 @@
+"""
+rag_profiles.py
+---------------
+RagEngine(rag_engine.py) 설정 프로파일 — 엔진 파일을 바꿔 끼우는 대신 프로파일 이름으로 A/B
+- default   : 현재 엔진 (듀얼 쿼리 + 매장 역색인 + 하이브리드/MMR/재순위화 + 토큰 예산 컨텍스트 + 2단 응답 캐시)
+- optimized : 구 rag_engine_optimized.py (매장 코드 단일 쿼리, dense 검색, 공백 압축 컨텍스트,
+              요약형 프롬프트, max_output_tokens=500, 정확 일치 응답 캐시)
+- legacy    : 구 .rag_engine.py / .rag_engine_multiprocessing.py (매장 코드 단일 쿼리, dense 검색,
+              단순 연결 컨텍스트, 초기 프롬프트, 캐시/출력 제한 없음)
+  (두 파일은 임베더 로드 방식/스레드 수만 달랐고, 이는 이제 프로세스 공용 설정이 담당)
+- 기본 프로파일: RAG_PROFILE (기본 default)
+"""
+
+import os
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Optional
+
+DEFAULT_PROFILE = os.getenv("RAG_PROFILE", "default")
+
+
+@dataclass(frozen=True)
+class RagProfile:
+    name: str
+    queries: str = "dual"                 # dual: 매장 강화 + 유사매장 확장 / store_code: 매장 코드 그대로
+    exact_own_store: bool = True          # store_code 역색인으로 우리 매장 청크 고정
+    hybrid: bool = True                   # FAISS + BM25 RRF (RAG_HYBRID 와 AND)
+    mmr: bool = True                      # MMR 다양성 선택 (RAG_MMR 와 AND)
+    rerank: bool = True                   # cross-encoder 재순위화 (RAG_RERANK 와 AND)
+    anchor: bool = True                   # 매장 페르소나 앵커 삽입
+    context: str = "budget"               # budget: 토큰 예산 / compact: 공백 압축 / plain: 단순 연결
+    prompt: str = "full"                  # full / brief / legacy
+    generation_config: Optional[Dict[str, Any]] = field(default=None, hash=False)
+    response_cache: bool = True
+    semantic_cache: bool = True
+
+    def with_overrides(self, **kwargs) -> "RagProfile":
+        return replace(self, **kwargs)
+
+
+PROFILES: Dict[str, RagProfile] = {
+    "default": RagProfile("default"),
+    "optimized": RagProfile(
+        "optimized",
+        queries="store_code",
+        exact_own_store=False,
+        hybrid=False,
+        mmr=False,
+        rerank=False,
+        anchor=False,
+        context="compact",
+        prompt="brief",
+        generation_config={"max_output_tokens": 500},
+        semantic_cache=False,
+    ),
+    "legacy": RagProfile(
+        "legacy",
+        queries="store_code",
+        exact_own_store=False,
+        hybrid=False,
+        mmr=False,
+        rerank=False,
+        anchor=False,
+        context="plain",
+        prompt="legacy",
+        response_cache=False,
+        semantic_cache=False,
+    ),
+}
+
+
+def get_profile(name: Optional[str] = None) -> RagProfile:
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"알 수 없는 RAG 프로파일: {name} (가능: {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+def register_profile(profile: RagProfile) -> None:
+    """실험용 프로파일 등록 (예: PROFILES['default'].with_overrides(name='no-mmr', mmr=False))"""
+    PROFILES[profile.name] = profile
+
+
+# ------------------------------------------------
+# 구 엔진 프롬프트 (optimized / legacy 프로파일 재현용)
+# ------------------------------------------------
+def brief_prompt(mode: str, mct_id: str, combined_context: str) -> str:
+    """구 rag_engine_optimized.py 프롬프트"""
+    prompts = {
+        "v1": f"""
+        다음은 '{mct_id}' 매장과 유사한 사례들의 **고객 분석 및 마케팅 데이터**입니다.
+        이를 기반으로 **AI 마케팅 리포트**를 작성하세요.
+
+        {combined_context}
+
+        작성 지침:
+        1️⃣ 매장 핵심 요약 — 고객 구성, 구매 패턴, 주요 상권 특징을 요약
+        2️⃣ 데이터 기반 인사이트 — 최소 3개, 각 인사이트마다 **데이터 근거**를 괄호로 명시
+        3️⃣ 타겟층별로 적합한 마케팅 채널 추천
+        4️⃣ 추천 채널별 맞춤 홍보 문구 제안
+        5️⃣ 결론 — 어떤 채널이 ROI 대비 가장 효과적인지 제시
+        """,
+
+        "v2": f"""
+        다음은 '{mct_id}' 매장과 유사한 사례들의 **재방문율 분석 데이터**입니다.
+        이 데이터를 기반으로 **재방문율 향상 전략 보고서**를 작성하세요.
+
+        {combined_context}
+        """,
+
+        "v3": f"""
+        다음은 '{mct_id}' 매장과 유사한 **요식업종 가맹점 데이터**입니다.
+        이 데이터를 기반으로 **현재 가장 큰 문제점과 이를 보완할 마케팅 아이디어**를 제시하세요.
+
+        {combined_context}
+        """,
+
+        "default": f"""
+        다음은 '{mct_id}' 매장과 유사한 사례들의 데이터입니다.
+        이를 기반으로 AI 마케팅 리포트를 작성하세요.
+
+        {combined_context}
+        """
+    }
+    return prompts.get(mode, prompts["default"])
+
+
+def legacy_prompt(mode: str, mct_id: str, combined_context: str) -> str:
+    """구 .rag_engine.py / .rag_engine_multiprocessing.py 프롬프트"""
+    prompts = {
+        "v1": f"""
+        다음은 '{mct_id}' 매장과 유사한 사례들의 **고객 분석 및 마케팅 데이터**입니다.
+        이를 기반으로 **AI 마케팅 리포트**를 작성하세요.
+
+        {combined_context}
+
+        작성 지침:
+        1️⃣ 매장 핵심 요약 — 고객 구성, 구매 패턴, 주요 상권 특징을 요약
+        2️⃣ 데이터 기반 인사이트 — 최소 3개, 각 인사이트마다 **데이터 근거**를 괄호로 명시
+            예: "10~20대 여성 고객 비중이 높음 (출처: 챔스*** 리포트, +3.7pp)"
+        3️⃣ 타겟층별로 적합한 마케팅 채널 추천 (예: 인스타그램, 네이버 블로그, 배달앱 등)
+        4️⃣ 추천 채널별 맞춤 홍보 문구 제안
+        5️⃣ 결론 — 어떤 채널이 ROI 대비 가장 효과적인지 제시
+
+        ⚙️ 작성 규칙:
+        - 모든 근거는 [매장 분석 데이터] 또는 [마케팅 전략 데이터]에서 인용해야 함
+        - 인용 시 “(출처: 매장코드 또는 세그먼트명)” 형태로 표시
+        - 결과는 한국어로 작성
+        """,
+
+        "v2": f"""
+        다음은 '{mct_id}' 매장과 유사한 사례들의 **재방문율 분석 데이터**입니다.
+        이 데이터를 기반으로 **재방문율 향상 전략 보고서**를 작성하세요.
+
+        {combined_context}
+
+        작성 지침:
+        1️⃣ 현재 재방문율 상태 요약 — 수치와 비교 기준 포함
+        2️⃣ 재방문율에 영향을 미친 요인 3가지 이상 제시 (각 요인별 데이터 근거 명시)
+        3️⃣ 단기 / 중기 / 장기별 리텐션 전략을 구체적으로 제시
+            - 단기: 쿠폰, 이벤트, 앱 푸시
+            - 중기: 멤버십, 고객 주기 최적화
+            - 장기: 충성고객 관리, 커뮤니티 강화
+        4️⃣ 각 전략의 예상 효과를 수치나 사례로 제시
+        5️⃣ 결론 — 어떤 전략이 ROI 기준으로 가장 효율적인지 제시
+
+        ⚙️ 작성 규칙:
+        - 모든 근거는 [매장 분석 데이터] 또는 [마케팅 전략 데이터]에서 인용해야 함
+        - 인용 시 “(출처: 매장코드 또는 세그먼트명)” 형태로 표시
+        - 결과는 한국어로 작성
+        """,
+
+        "v3": f"""
+        다음은 '{mct_id}' 매장과 유사한 **요식업종 가맹점 데이터**입니다.
+        이 데이터를 기반으로 **현재 가장 큰 문제점과 이를 보완할 마케팅 아이디어**를 제시하세요.
+
+        {combined_context}
+
+        작성 지침:
+        1️⃣ 요식업종 매장의 핵심 문제점 3개를 도출하고 각 문제의 **데이터 근거**를 명시
+            예: "점심 매출 집중률 높음 (출처: 91BA22FC44, +42%)"
+        2️⃣ 문제별 원인을 분석하고, 고객군/상권/트렌드와 연관지어 설명
+        3️⃣ 각 문제를 해결하기 위한 **마케팅 아이디어**를 제시 (온라인/오프라인 포함)
+            - 예: 메뉴 리뉴얼, 타겟형 광고, 지역 제휴, 배달 최적화 등
+        4️⃣ 각 아이디어의 기대 효과를 데이터 기반으로 추정
+        5️⃣ 결론 — 어떤 아이디어가 단기성과 vs 장기브랜딩 측면에서 우선순위가 높은지 정리
+
+        ⚙️ 작성 규칙:
+        - 반드시 데이터 기반으로 논리적으로 작성
+        - 인용 시 “(출처: 매장코드 또는 세그먼트명)” 형태로 표시
+        - 결과는 한국어로 작성
+        """,
+
+        "default": f"""
+        다음은 '{mct_id}' 매장과 유사한 사례들의 데이터입니다.
+        이를 기반으로 AI 마케팅 리포트를 작성하세요.
+
+        {combined_context}
+
+        작성 지침:
+        1️⃣ 매장 핵심 요약
+        2️⃣ 데이터 기반 인사이트
+        3️⃣ 주요 문제점 및 원인
+        4️⃣ 개선 전략
+        5️⃣ 결론 및 요약
+        """
+    }
+    return prompts.get(mode, prompts["default"])
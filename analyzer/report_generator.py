@@ -1,16 +1,20 @@
+import asyncio
 import traceback
 import concurrent.futures
 
 # -----------------------------
 # 내부 모듈 import
 # -----------------------------
-from analyzer.rag_engine import generate_rag_summary
+from analyzer.rag_engine import generate_rag_summary, generate_rag_summary_async, stream_rag_summary
 from experiments._0_final.store_status import get_store_status_with_insights
 from experiments._1_final.report_generator import generate_marketing_report1
 from experiments._2_final.report_generator2 import generate_marketing_report2
 from experiments._3_final.report_generator3 import generate_marketing_report3
 from experiments._4_final.delivery_prediction import predict_delivery
-from experiments.keywords.keyword_generator import generate_keyword_trend_report
+from experiments.keywords.keyword_generator import (
+    generate_keyword_trend_report,
+    generate_keyword_trend_report_async,
+)
 
 
 # -----------------------------
@@ -30,6 +34,70 @@ def get_industry_from_store(mct_id: str) -> str:
         return "기타"
 
 
+# -----------------------------
+# 내부 분석 라우팅
+# -----------------------------
+def route_base_result(mct_id: str, mode: str):
+    """
+    모드별 내부 분석 결과 반환 → (base_result, None)
+    라우팅 자체가 불가능한 경우(미지원 모드 / 배달 예측 대상 아님) → (None, {"error": ...})
+    """
+    if mode == "v0":
+        return get_store_status_with_insights(mct_id), None
+    if mode == "v1":
+        return generate_marketing_report1(mct_id), None
+    if mode == "v2":
+        return generate_marketing_report2(mct_id), None
+    if mode == "v3":
+        return generate_marketing_report3(mct_id), None
+    if mode == "v4":
+        base_result = predict_delivery(mct_id)
+        if base_result is None:
+            return None, {"error": "해당 가맹점을 찾을 수 없거나 이미 배달을 운영 중입니다."}
+        # 배달 예측 리포트 포맷 정리
+        return {
+            "store_code": base_result.get("store_code"),
+            "store_name": base_result.get("store_name"),
+            "store_type": base_result.get("store_type"),
+            "district": base_result.get("district"),
+            "area": base_result.get("area"),
+            "emoji": base_result.get("emoji", "📦"),
+            "success_prob": base_result.get("success_prob", 0.0),
+            "fail_prob": 100 - base_result.get("success_prob", 0.0),
+            "status": base_result.get("level", "-"),
+            "message": base_result.get("summary", ""),
+            "recommendation": base_result.get("recommendation", ""),
+            "reasons": base_result.get("reasons", []),
+            "interpret_text": base_result.get("interpret_text", "")
+        }, None
+    return None, {"error": f"지원되지 않는 모드입니다: {mode}"}
+
+
+def merge_report(mct_id: str, mode: str, base_result: dict, rag_output: dict,
+                 trend_output: dict, industry: str) -> dict:
+    """
+    내부 분석 + RAG + 키워드 트렌드 결과 병합
+    """
+    return {
+        "store_code": mct_id,
+        "mode": mode,
+        "store_name": base_result.get("store_name", ""),
+        "status": base_result.get("status", ""),
+        "message": base_result.get("message")
+            or base_result.get("status_detail", "")
+            or "",
+        "analysis": base_result.get("analysis", ""),
+        "recommendations": base_result.get("recommendations", ""),
+        "metadata": base_result.get("metadata", {}),
+        "revisit_rate": base_result.get("revisit_rate", None),
+        "rag_summary": rag_output.get("rag_summary", ""),
+        "references": rag_output.get("references", {}),
+        "rag_timing": rag_output.get("timing", {}),
+        "keyword_trend": trend_output.get("TOP10", []),
+        "industry": industry
+    }
+
+
 # -----------------------------
 # 마케팅 리포트 메인
 # -----------------------------
@@ -38,41 +106,12 @@ def generate_marketing_report(mct_id: str, mode: str = "v1", rag: bool = True):
     AI 마케팅 리포트 생성 게이트웨이 (자동 라우팅 + 병렬 RAG/키워드)
     """
     try:
-        base_result = None
-
         # --------------------------------------
         # ① 내부 분석 라우팅
         # --------------------------------------
-        if mode == "v0":
-            base_result = get_store_status_with_insights(mct_id)
-        elif mode == "v1":
-            base_result = generate_marketing_report1(mct_id)
-        elif mode == "v2":
-            base_result = generate_marketing_report2(mct_id)
-        elif mode == "v3":
-            base_result = generate_marketing_report3(mct_id)
-        elif mode == "v4":
-            base_result = predict_delivery(mct_id)
-            if base_result is None:
-                return {"error": "해당 가맹점을 찾을 수 없거나 이미 배달을 운영 중입니다."}
-            # 배달 예측 리포트 포맷 정리
-            base_result = {
-                "store_code": base_result.get("store_code"),
-                "store_name": base_result.get("store_name"),
-                "store_type": base_result.get("store_type"),
-                "district": base_result.get("district"),
-                "area": base_result.get("area"),
-                "emoji": base_result.get("emoji", "📦"),
-                "success_prob": base_result.get("success_prob", 0.0),
-                "fail_prob": 100 - base_result.get("success_prob", 0.0),
-                "status": base_result.get("level", "-"),
-                "message": base_result.get("summary", ""),
-                "recommendation": base_result.get("recommendation", ""),
-                "reasons": base_result.get("reasons", []),
-                "interpret_text": base_result.get("interpret_text", "")
-            }
-        else:
-            return {"error": f"지원되지 않는 모드입니다: {mode}"}
+        base_result, route_error = route_base_result(mct_id, mode)
+        if route_error:
+            return route_error
 
         # --------------------------------------
         # ② RAG 비활성 모드 → 내부 분석 결과만 반환
@@ -93,31 +132,73 @@ def generate_marketing_report(mct_id: str, mode: str = "v1", rag: bool = True):
             rag_output = futures["rag"].result()
             trend_output = futures["trend"].result()
 
-        rag_text = rag_output.get("rag_summary", "")
-        keyword_top10 = trend_output.get("TOP10", [])
-
         # --------------------------------------
         # ④ 결과 병합
         # --------------------------------------
-        result = {
-            "store_code": mct_id,
-            "mode": mode,
-            "store_name": base_result.get("store_name", ""),
-            "status": base_result.get("status", ""),
-            "message": base_result.get("message")
-                or base_result.get("status_detail", "")
-                or "",
-            "analysis": base_result.get("analysis", ""),
-            "recommendations": base_result.get("recommendations", ""),
-            "metadata": base_result.get("metadata", {}),
-            "revisit_rate": base_result.get("revisit_rate", None),
-            "rag_summary": rag_text,
-            "references": rag_output.get("references", {}),
-            "keyword_trend": keyword_top10,
-            "industry": industry
-        }
-
-        return result
+        return merge_report(mct_id, mode, base_result, rag_output, trend_output, industry)
+
+    except Exception as e:
+        return {"error": str(e), "traceback": traceback.format_exc(limit=2)}
+
+
+# -----------------------------
+# 마케팅 리포트 스트리밍
+# -----------------------------
+def stream_marketing_report(mct_id: str, mode: str = "v1"):
+    """
+    generate_marketing_report 의 스트리밍 버전.
+    RAG 텍스트 조각(str)을 도착하는 대로 yield 하고, 마지막에 병합 결과 dict 를 yield.
+    키워드 트렌드는 RAG 스트리밍과 병렬로 백그라운드에서 수집한다.
+    """
+    try:
+        base_result, route_error = route_base_result(mct_id, mode)
+        if route_error:
+            yield route_error
+            return
+
+        industry = base_result.get("업종분류") or get_industry_from_store(mct_id)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            trend_future = executor.submit(generate_keyword_trend_report, industry)
+            rag_output = {}
+            for event in stream_rag_summary(mct_id, mode):
+                if isinstance(event, dict):
+                    rag_output = event
+                else:
+                    yield event
+            trend_output = trend_future.result()
+
+        yield merge_report(mct_id, mode, base_result, rag_output, trend_output, industry)
+
+    except Exception as e:
+        yield {"error": str(e), "traceback": traceback.format_exc(limit=2)}
+
+
+# -----------------------------
+# 마케팅 리포트 (async)
+# -----------------------------
+async def generate_marketing_report_async(mct_id: str, mode: str = "v1", rag: bool = True):
+    """
+    generate_marketing_report 의 async 버전.
+    내부 분석(동기 모듈)은 executor 로 오프로딩하고, RAG 와 키워드 트렌드는 같은 이벤트 루프에서 동시에 대기.
+    요청당 스레드를 점유하지 않으므로 워커 1개가 다수의 동시 LLM 요청을 처리할 수 있다.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        base_result, route_error = await loop.run_in_executor(None, route_base_result, mct_id, mode)
+        if route_error:
+            return route_error
+        if not rag:
+            return base_result
+
+        industry = base_result.get("업종분류") or await loop.run_in_executor(
+            None, get_industry_from_store, mct_id
+        )
+        rag_output, trend_output = await asyncio.gather(
+            generate_rag_summary_async(mct_id, mode),
+            generate_keyword_trend_report_async(industry),
+        )
+        return merge_report(mct_id, mode, base_result, rag_output, trend_output, industry)
 
     except Exception as e:
         return {"error": str(e), "traceback": traceback.format_exc(limit=2)}
@@ -0,0 +1,191 @@
+"""
+reranker.py
+-----------
+Cross-encoder 재순위화 (rag_engine 전용, opt-in: RAG_RERANK=1)
+- 1차 검색(bi-encoder + MMR) 후보를 (쿼리, 청크) 쌍으로 배치 스코어링해 상위 N개만 프롬프트에 넣음
+- CPU CrossEncoder(sentence-transformers)를 EmbedderHandle 로 백그라운드 로드
+  — 준비 전 요청은 재순위화 없이 1차 순서 그대로 통과
+- 점수 캐시: (쿼리 해시, 청크 id=본문 해시) → 점수, 프로세스 내 LRU
+- 지연 예산(RAG_RERANK_BUDGET_MS): 배치마다 남은 시간과 최근 쌍당 지연을 비교해 초과가 예상되면 중단,
+  점수를 받지 못한 후보는 1차 순서대로 뒤에 붙임
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from analyzer.embedder import EmbedderHandle
+
+RERANK_ENABLED = os.getenv("RAG_RERANK", "0") == "1"
+RERANK_MODEL_NAME = os.getenv("RAG_RERANK_MODEL", "BAAI/bge-reranker-v2-m3")
+RERANK_TOP_N = int(os.getenv("RAG_RERANK_TOP_N", "5"))
+RERANK_BATCH = int(os.getenv("RAG_RERANK_BATCH", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", "400"))
+RERANK_CACHE_SIZE = int(os.getenv("RAG_RERANK_CACHE_SIZE", "8192"))
+RERANK_MAX_LENGTH = int(os.getenv("RAG_RERANK_MAX_LENGTH", "512"))
+
+T = TypeVar("T")
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id(text: str) -> str:
+    """청크 식별자 — 메타데이터 chunk_id 는 파일 간 중복되므로 본문 해시 사용 (인덱스 재빌드에도 유지)"""
+    return _digest(text)
+
+
+def load_cross_encoder(model_name: str = RERANK_MODEL_NAME):
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model_name, device="cpu", max_length=RERANK_MAX_LENGTH)
+
+
+class Reranker:
+    """(쿼리, 청크) 배치 스코어링 + 점수 LRU + 지연 예산"""
+
+    def __init__(self, model_name: str = RERANK_MODEL_NAME, top_n: int = RERANK_TOP_N,
+                 batch_size: int = RERANK_BATCH, budget_ms: float = RERANK_BUDGET_MS,
+                 cache_size: int = RERANK_CACHE_SIZE, enabled: bool = RERANK_ENABLED,
+                 loader: Callable = load_cross_encoder):
+        self.enabled = enabled
+        self.top_n = top_n
+        self.batch_size = max(1, batch_size)
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self.handle = EmbedderHandle(
+            model_name,
+            loader=loader,
+            warmup=lambda model: model.predict([("warmup", "warmup")]),
+            label="Cross-encoder",
+        )
+        self._lock = threading.Lock()
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._pair_seconds: Optional[float] = None  # 쌍당 지연 EWMA (예산 예측용)
+        self.calls = 0
+        self.not_ready = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        self.budget_cuts = 0
+        self.total_seconds = 0.0
+
+    def start(self) -> None:
+        if self.enabled:
+            self.handle.start()
+
+    # ------------------------------------------------
+    # 점수 캐시
+    # ------------------------------------------------
+    def _cached(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def _store(self, pairs: Dict[Tuple[str, str], float]) -> None:
+        with self._lock:
+            for key, score in pairs.items():
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    # ------------------------------------------------
+    # 스코어링
+    # ------------------------------------------------
+    def score(self, query: str, texts: Sequence[str], model=None,
+              budget_ms: Optional[float] = None) -> List[Optional[float]]:
+        """
+        texts 각각의 cross-encoder 점수 (캐시 우선, 미스는 batch_size 단위로 predict).
+        예산 초과로 스코어링하지 못한 항목은 None.
+        """
+        model = model or self.handle.model
+        budget = self.budget_ms if budget_ms is None else budget_ms
+        t0 = time.perf_counter()
+        deadline = t0 + budget / 1000 if budget > 0 else None
+
+        q = _digest(query)
+        keys = [(q, chunk_id(t)) for t in texts]
+        scores: List[Optional[float]] = [self._cached(k) for k in keys]
+        hits = sum(s is not None for s in scores)
+        missing = [i for i, s in enumerate(scores) if s is None]
+
+        scored_now: Dict[Tuple[str, str], float] = {}
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            if deadline is not None and scored_now:
+                # 첫 배치는 항상 수행, 이후는 예상 소요가 남은 예산을 넘으면 중단
+                expected = (self._pair_seconds or 0.0) * len(batch)
+                if time.perf_counter() + expected > deadline:
+                    self.budget_cuts += 1
+                    break
+            tb = time.perf_counter()
+            out = model.predict([(query, texts[i]) for i in batch], batch_size=self.batch_size)
+            per_pair = (time.perf_counter() - tb) / len(batch)
+            self._pair_seconds = per_pair if self._pair_seconds is None else 0.7 * self._pair_seconds + 0.3 * per_pair
+            for i, s in zip(batch, out):
+                scores[i] = float(s)
+                scored_now[keys[i]] = float(s)
+
+        if scored_now:
+            self._store(scored_now)
+        self.cache_hits += hits
+        self.pairs_scored += len(scored_now)
+        self.total_seconds += time.perf_counter() - t0
+        return scores
+
+    def rerank(self, query: str, items: List[T], text_of: Callable[[T], str],
+               top_n: Optional[int] = None) -> Tuple[List[T], Dict[str, Any]]:
+        """
+        items 를 cross-encoder 점수 순으로 정렬해 상위 top_n 개 반환 (+ 요약 정보).
+        모델이 아직 준비되지 않았으면 items 를 그대로 돌려준다.
+        """
+        top_n = self.top_n if top_n is None else top_n
+        if not self.enabled or not items:
+            return items, {}
+        model = self.handle.wait(0)
+        if model is None:
+            self.not_ready += 1
+            return items, {"applied": False, "state": self.handle.state}
+
+        self.calls += 1
+        t0 = time.perf_counter()
+        scores = self.score(query, [text_of(it) for it in items], model)
+        scored = sorted(
+            (i for i, s in enumerate(scores) if s is not None), key=lambda i: -scores[i]
+        )
+        unscored = [i for i, s in enumerate(scores) if s is None]
+        order = (scored + unscored)[:top_n] if top_n > 0 else scored + unscored
+        info = {
+            "applied": True,
+            "candidates": len(items),
+            "kept": len(order),
+            "scored": len(scored),
+            "ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+        print(
+            f"🎚️ [Rerank] 후보 {len(items)}개 → {len(order)}개 "
+            f"(스코어 {len(scored)}/{len(items)}, {info['ms']}ms)"
+        )
+        return [items[i] for i in order], info
+
+    def stats(self) -> Dict[str, Any]:
+        pairs = self.pairs_scored + self.cache_hits
+        return {
+            "enabled": self.enabled,
+            "model": self.handle.status(),
+            "calls": self.calls,
+            "not_ready": self.not_ready,
+            "pairs_scored": self.pairs_scored,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": round(self.cache_hits / pairs, 4) if pairs else 0.0,
+            "cache_items": len(self._scores),
+            "budget_cuts": self.budget_cuts,
+            "avg_ms": round(self.total_seconds * 1000 / self.calls, 1) if self.calls else 0.0,
+            "pair_ms": round(self._pair_seconds * 1000, 2) if self._pair_seconds is not None else None,
+        }
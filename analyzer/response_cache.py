@@ -0,0 +1,182 @@
+"""
+response_cache.py
+-----------------
+Gemini 응답 2계층 캐시 (rag_engine / rag_engine_optimized 공용)
+- 키: sha256(모델명 + 생성 설정(JSON) + 프롬프트)
+- 1차: 프로세스 내 LRU — 바이트 단위 상한(RAG_RESPONSE_CACHE_MB)
+- 2차: SQLite + TTL(RAG_RESPONSE_CACHE_TTL 초) — 재시작/프로세스 간 공유
+- hit/miss/eviction/expired 카운터 제공 (stats)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.getenv(
+    "RAG_RESPONSE_CACHE_PATH", os.path.join(ROOT, ".cache", "gemini_responses.sqlite3")
+)
+DEFAULT_MAX_BYTES = int(float(os.getenv("RAG_RESPONSE_CACHE_MB", "64")) * 1024 * 1024)
+DEFAULT_TTL = float(os.getenv("RAG_RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def make_cache_key(prompt: str, model: str, generation_config: Optional[Dict[str, Any]] = None) -> str:
+    config = json.dumps(generation_config or {}, sort_keys=True, ensure_ascii=False)
+    raw = f"{model}\0{config}\0{prompt}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """스레드 안전 LRU(바이트 상한) + SQLite(TTL) 응답 캐시. db_path=None 이면 메모리만 사용."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, db_path: Optional[str] = DEFAULT_CACHE_PATH,
+                 ttl_seconds: float = DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (text, nbytes, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0,
+            "evictions": 0, "expired": 0, "stores": 0,
+        }
+        self._db = self._open_db(db_path) if db_path else None
+
+    # ------------------------------------------------
+    # 디스크 계층
+    # ------------------------------------------------
+    @staticmethod
+    def _open_db(db_path: str):
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, value TEXT,"
+                " created_at REAL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses(expires_at)")
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            print(f"⚠️ [ResponseCache] 디스크 캐시 비활성화: {e}")
+            return None
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] < time.time():
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self.counters["expired"] += 1
+                return None
+            return row
+        except sqlite3.Error:
+            return None
+
+    def _disk_put(self, key: str, model: str, text: str, expires_at: float) -> None:
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, text, time.time(), expires_at),
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ [ResponseCache] 디스크 저장 실패: {e}")
+
+    # ------------------------------------------------
+    # 메모리 계층
+    # ------------------------------------------------
+    def _lru_put(self, key: str, text: str, expires_at: float) -> None:
+        nbytes = len(text.encode("utf-8")) + len(key)
+        if nbytes > self.max_bytes:
+            return
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._lru[key] = (text, nbytes, expires_at)
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes:
+            _, (_, evicted, _) = self._lru.popitem(last=False)
+            self._bytes -= evicted
+            self.counters["evictions"] += 1
+
+    def _lru_drop(self, key: str) -> None:
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+
+    # ------------------------------------------------
+    # 공개 API
+    # ------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._lru.get(key)
+            if item is not None:
+                if item[2] >= now:
+                    self._lru.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return item[0]
+                self._lru_drop(key)
+                self.counters["expired"] += 1
+            row = self._disk_get(key)
+            if row is not None:
+                self._lru_put(key, row[0], row[1])
+                self.counters["disk_hits"] += 1
+                return row[0]
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key: str, text: str, model: str = "") -> None:
+        if not text:
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._lru_put(key, text, expires_at)
+            self._disk_put(key, model, text, expires_at)
+            self.counters["stores"] += 1
+
+    def purge_expired(self) -> int:
+        """만료 항목을 디스크 계층에서 일괄 삭제하고 삭제 수 반환"""
+        if self._db is None:
+            return 0
+        with self._lock:
+            cur = self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+            return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+            c["memory_items"] = len(self._lru)
+            c["memory_mb"] = round(self._bytes / 1024 ** 2, 3)
+        hits = c["memory_hits"] + c["disk_hits"]
+        total = hits + c["misses"]
+        c["hit_rate"] = round(hits / total, 4) if total else 0.0
+        return c
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """프로세스 공용 인스턴스 (두 엔진이 같은 캐시를 공유)"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
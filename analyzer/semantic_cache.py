@@ -0,0 +1,158 @@
+"""
+semantic_cache.py
+-----------------
+RAG 프롬프트 의미 기반 근사 중복 캐시 (rag_engine 전용, 정확 일치 response_cache 다음 단계)
+- 같은 상권/클러스터 매장은 세그먼트 청크가 거의 같아 combined_context 가 조금만 달라 해시 캐시가 빗나감
+- 중복 제거된 검색 컨텍스트(앵커 제외)를 임베딩해, 같은 모드·같은 매장 앵커 버킷 안에서
+  코사인 유사도가 모드별 임계값 이상이면 이전 Gemini 응답을 재사용
+  (앵커 = 매장 코드/상호를 가린 자기 청크 본문, rag_engine.build_semantic_anchor)
+- 다른 매장이 만든 응답은 그 매장 식별자(코드/상호)가 본문에 없을 때만 재사용 — 응답 본문은 수정하지 않음
+- 모드별 임계값: RAG_SEMANTIC_CACHE_MODES="v1:0.97,v2:0.96" (목록에 없거나 0 이면 해당 모드 비활성)
+- 히트율과 절약된 LLM 호출 시간(초) 집계 (stats)
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_MODE_THRESHOLDS = os.getenv("RAG_SEMANTIC_CACHE_MODES", "")
+DEFAULT_MAX_ITEMS = int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", "2048"))
+
+
+def parse_mode_thresholds(spec: str) -> Dict[str, float]:
+    """"v1:0.97,v2:0.96" → {"v1": 0.97, "v2": 0.96} (0 이하 값은 비활성으로 간주해 제외)"""
+    thresholds = {}
+    for part in spec.split(","):
+        if ":" not in part:
+            continue
+        mode, value = part.split(":", 1)
+        try:
+            threshold = float(value)
+        except ValueError:
+            print(f"⚠️ [SemanticCache] 임계값 파싱 실패, 무시: {part.strip()}")
+            continue
+        if threshold > 0:
+            thresholds[mode.strip()] = threshold
+    return thresholds
+
+
+def anchor_key(anchor: str) -> str:
+    return hashlib.sha1(anchor.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("vector", "text", "store_code", "llm_seconds", "portable")
+
+    def __init__(self, vector: np.ndarray, text: str, store_code: str, llm_seconds: float,
+                 identifiers: Sequence[str] = ()):
+        self.vector = vector
+        self.text = text
+        self.store_code = store_code
+        self.llm_seconds = llm_seconds
+        # 원 매장 식별자가 본문에 없으면 다른 매장에도 그대로 재사용 가능
+        self.portable = not any(ident and ident in text for ident in (store_code, *identifiers))
+
+
+class SemanticCache:
+    """(모드, 앵커 해시) 버킷별 컨텍스트 벡터 → 응답. 전체 항목 수는 max_items 로 LRU 제한."""
+
+    def __init__(self, thresholds: Optional[Dict[str, float]] = None, max_items: int = DEFAULT_MAX_ITEMS):
+        self.thresholds = dict(parse_mode_thresholds(DEFAULT_MODE_THRESHOLDS) if thresholds is None else thresholds)
+        self.max_items = max_items
+        self._buckets: "OrderedDict[Tuple[str, str], List[_Entry]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, float]] = {}
+
+    # ------------------------------------------------
+    # 설정
+    # ------------------------------------------------
+    def enabled(self, mode: str) -> bool:
+        return self.thresholds.get(mode, 0.0) > 0
+
+    def set_threshold(self, mode: str, threshold: Optional[float]) -> None:
+        """런타임에 모드별 임계값 변경. None/0 이면 해당 모드 비활성."""
+        with self._lock:
+            if threshold and threshold > 0:
+                self.thresholds[mode] = float(threshold)
+            else:
+                self.thresholds.pop(mode, None)
+
+    def _mode_counters(self, mode: str) -> Dict[str, float]:
+        return self._counters.setdefault(
+            mode, {"lookups": 0, "hits": 0, "stores": 0, "saved_llm_seconds": 0.0, "embed_seconds": 0.0}
+        )
+
+    # ------------------------------------------------
+    # 조회 / 저장
+    # ------------------------------------------------
+    def lookup(self, mode: str, anchor: str, vector: np.ndarray, embed_seconds: float = 0.0,
+               store_code: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        임계값 이상으로 가장 가까운 항목 반환: {"text", "store_code", "similarity"}.
+        앵커가 비어 있으면 매장 식별이 불가능하므로 조회하지 않는다.
+        store_code 가 주어지면 다른 매장 항목은 본문에 원 매장 식별자가 없는 것만 후보로 본다.
+        """
+        if not self.enabled(mode) or not anchor:
+            return None
+        key = (mode, anchor_key(anchor))
+        with self._lock:
+            c = self._mode_counters(mode)
+            c["lookups"] += 1
+            c["embed_seconds"] += embed_seconds
+            bucket = self._buckets.get(key)
+            if bucket and store_code is not None:
+                bucket = [e for e in bucket if e.portable or e.store_code == str(store_code)]
+            if not bucket:
+                return None
+            sims = np.stack([e.vector for e in bucket]) @ vector
+            best = int(np.argmax(sims))
+            if float(sims[best]) < self.thresholds[mode]:
+                return None
+            entry = bucket[best]
+            self._buckets.move_to_end(key)
+            c["hits"] += 1
+            c["saved_llm_seconds"] += entry.llm_seconds
+            return {"text": entry.text, "store_code": entry.store_code, "similarity": float(sims[best])}
+
+    def store(self, mode: str, anchor: str, vector: np.ndarray, text: str,
+              store_code: str, llm_seconds: float, identifiers: Sequence[str] = ()) -> None:
+        if not self.enabled(mode) or not anchor or not text:
+            return
+        key = (mode, anchor_key(anchor))
+        entry = _Entry(np.asarray(vector, dtype=np.float32).ravel(), text, str(store_code), llm_seconds, identifiers)
+        with self._lock:
+            self._buckets.setdefault(key, []).append(entry)
+            self._buckets.move_to_end(key)
+            self._size += 1
+            self._mode_counters(mode)["stores"] += 1
+            while self._size > self.max_items:
+                old_key, old_bucket = next(iter(self._buckets.items()))
+                old_bucket.pop(0)
+                self._size -= 1
+                if not old_bucket:
+                    del self._buckets[old_key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_mode = {m: dict(c) for m, c in self._counters.items()}
+            size, thresholds = self._size, dict(self.thresholds)
+        for c in per_mode.values():
+            c["hit_rate"] = round(c["hits"] / c["lookups"], 4) if c["lookups"] else 0.0
+            c["saved_llm_seconds"] = round(c["saved_llm_seconds"], 2)
+            c["embed_seconds"] = round(c["embed_seconds"], 3)
+        lookups = sum(c["lookups"] for c in per_mode.values())
+        hits = sum(c["hits"] for c in per_mode.values())
+        return {
+            "thresholds": thresholds,
+            "items": size,
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "saved_llm_seconds": round(sum(c["saved_llm_seconds"] for c in per_mode.values()), 2),
+            "modes": per_mode,
+        }
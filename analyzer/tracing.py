@@ -0,0 +1,171 @@
+"""
+tracing.py
+----------
+RAG 파이프라인 경량 트레이싱 (rag_engine 전용, 외부 의존성 없음)
+- span(name): 구간 소요시간을 perf_counter 로 측정하는 컨텍스트 매니저 (traced(name) 은 데코레이터 버전)
+- Trace: 요청 1건의 구간별 소요시간(초) — 결과 dict 의 timing["stages"] 로 반환
+  (같은 이름이 여러 번 열리면 합산, 중첩 구간은 부모 구간 시간에도 포함됨)
+- 프로세스 전역 히스토그램: (scope, 구간) 별 고정 로그 버킷 카운트 → p50/p95/p99 추정
+  (메모리 O(버킷 수), scope 는 보통 엔진 프로파일 이름)
+"""
+
+import time
+import bisect
+import inspect
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 버킷 상한(ms) — 마지막 버킷은 +inf
+BUCKET_BOUNDS_MS: Tuple[float, ...] = (
+    1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000,
+)
+QUANTILES = (0.50, 0.95, 0.99)
+
+
+# ------------------------------------------------
+# 히스토그램
+# ------------------------------------------------
+class Histogram:
+    """고정 버킷 지연 히스토그램. 분위수는 버킷 안 선형 보간 (관측 최솟값/최댓값으로 양 끝 보정)"""
+
+    def __init__(self, bounds_ms: Tuple[float, ...] = BUCKET_BOUNDS_MS):
+        self.bounds = bounds_ms
+        self.counts: List[int] = [0] * (len(bounds_ms) + 1)
+        self.n = 0
+        self.total_ms = 0.0
+        self.min_ms = float("inf")
+        self.max_ms = 0.0
+
+    def add(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.n += 1
+        self.total_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> float:
+        if self.n == 0:
+            return 0.0
+        target = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= target:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.max_ms
+                lo, hi = max(lo, self.min_ms), min(hi, self.max_ms)
+                return lo + (hi - lo) * (target - seen) / c
+            seen += c
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        out = {
+            "count": self.n,
+            "mean_ms": round(self.total_ms / self.n, 2) if self.n else 0.0,
+            "max_ms": round(self.max_ms, 2),
+        }
+        for q in QUANTILES:
+            out[f"p{int(q * 100)}_ms"] = round(self.quantile(q), 2)
+        return out
+
+
+_hist_lock = threading.Lock()
+_histograms: Dict[Tuple[str, str], Histogram] = {}
+
+
+def observe(name: str, seconds: float, scope: str = "default") -> None:
+    """프로세스 전역 히스토그램에 구간 소요시간 기록"""
+    with _hist_lock:
+        hist = _histograms.get((scope, name))
+        if hist is None:
+            hist = _histograms[(scope, name)] = Histogram()
+        hist.add(seconds * 1000)
+
+
+def percentiles(scope: Optional[str] = None) -> Dict[str, Any]:
+    """scope 지정 시 {구간: 통계}, 미지정 시 {scope: {구간: 통계}} (통계: count/mean/max/p50/p95/p99, ms)"""
+    with _hist_lock:
+        items = [(k, h.snapshot()) for k, h in _histograms.items()]
+    if scope is not None:
+        return {name: snap for (s, name), snap in items if s == scope}
+    out: Dict[str, Dict[str, Any]] = {}
+    for (s, name), snap in items:
+        out.setdefault(s, {})[name] = snap
+    return out
+
+
+def reset() -> None:
+    with _hist_lock:
+        _histograms.clear()
+
+
+# ------------------------------------------------
+# 요청 단위 트레이스
+# ------------------------------------------------
+_current: contextvars.ContextVar = contextvars.ContextVar("rag_trace", default=None)
+
+
+class Trace:
+    """요청 1건의 구간별 소요시간. 기록과 동시에 scope 히스토그램에도 반영한다."""
+
+    def __init__(self, scope: str = "default"):
+        self.scope = scope
+        self.spans: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+        observe(name, seconds, self.scope)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        token = _current.set(self)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+            _current.reset(token)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(s, 4) for name, s in self.spans.items()}
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, scope: str = "default") -> Iterator[None]:
+    """현재 트레이스가 있으면 거기에, 없으면 scope 히스토그램에만 기록"""
+    trace = _current.get()
+    if trace is not None:
+        with trace.span(name):
+            yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, scope)
+
+
+def traced(name: Optional[str] = None, scope: str = "default") -> Callable:
+    """함수 전체를 span 으로 감싸는 데코레이터 (async 함수 지원)"""
+    def decorator(fn: Callable) -> Callable:
+        label = name or fn.__name__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(label, scope):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label, scope):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
@@ -0,0 +1,337 @@
+"""
+vector_registry.py
+------------------
+프로세스 전역 벡터DB 레지스트리
+- (folder, base_name) 단위로 FAISS 인덱스 + 메타데이터를 프로세스당 1회만 로드/워밍
+- 인덱스/메타데이터 파일의 mtime·size 가 바뀐 경우에만 재로드
+- 인덱스별 메모리 사용량 리포트 (memory_report)
+- 로드 시 store_code → 행 번호 역색인 구축 (매장 자기 리포트 O(1) 조회)
+- RAG_HYBRID=1 이면 로드 시 text 필드 문자 n-gram BM25 역색인도 함께 구축 (lexical_index.py)
+- build_ann_index.py 가 만든 {base_name}.ann.faiss 가 있으면 Flat 인덱스 대신 자동 사용
+- RAG_VECTOR_MMAP=1 이면 FAISS 인덱스를 mmap 으로 열고 메타데이터는 오프셋 기반 지연 파싱
+  → 워커 N개가 코퍼스를 N벌 복사하지 않고 page cache 를 공유, 콜드 스타트 단축
+- vector_store.py 의 증분 갱신 반영: {base_name}.tombstones.npy 의 삭제 행은 store_code 역색인/BM25 에서 제외,
+  {base_name}.ann.stale 표시가 있으면 ANN 인덱스 대신 최신 Flat(ID 매핑) 인덱스 사용
+- RAG_METADATA_FORMAT=columnar 면 메타데이터를 컬럼형 파일(*_metadata.columns.bin, mmap)로 로드
+  (없거나 JSONL 보다 오래됐으면 자동 변환, 실패 시 JSONL 로 폴백)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import AbstractSet, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import faiss
+
+from analyzer.metadata_store import (
+    ColumnarMetadata,
+    JsonlOffsetMetadata,
+    columnar_path_for,
+    load_columnar,
+    load_metadata_eager,
+)
+from analyzer.lexical_index import HYBRID_ENABLED, BM25Index
+
+VECTOR_DB_MMAP = os.getenv("RAG_VECTOR_MMAP", "0") == "1"
+USE_ANN_INDEX = os.getenv("RAG_USE_ANN_INDEX", "1") == "1"
+METADATA_FORMAT = os.getenv("RAG_METADATA_FORMAT", "jsonl")  # jsonl / columnar
+
+
+# ------------------------------------------------
+# 레지스트리 엔트리
+# ------------------------------------------------
+@dataclass
+class VectorDBEntry:
+    folder: str
+    base_name: str
+    index: Any
+    metadata: Sequence[dict]
+    fingerprint: Tuple
+    loaded_at: float
+    load_seconds: float
+    index_bytes: int
+    metadata_bytes: int
+    mmap: bool = False
+    store_rows: Dict[str, List[int]] = field(default_factory=dict)
+    lexical: Optional[BM25Index] = None
+    tombstones: int = 0
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.folder, self.base_name)
+
+    def rows_for_store(self, store_code: str) -> List[dict]:
+        """store_code 역색인으로 해당 매장의 청크를 원래 행 순서대로 반환 (없으면 [])"""
+        return [self.metadata[i] for i in self.store_rows.get(str(store_code), [])]
+
+    @property
+    def lexical_bytes(self) -> int:
+        return self.lexical.nbytes if self.lexical is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "folder": self.folder,
+            "base_name": self.base_name,
+            "ntotal": int(self.index.ntotal),
+            "dim": int(self.index.d),
+            "rows": len(self.metadata),
+            "stores": len(self.store_rows),
+            "tombstones": self.tombstones,
+            "index_mb": round(self.index_bytes / 1024 ** 2, 2),
+            "metadata_mb": round(self.metadata_bytes / 1024 ** 2, 2),
+            "total_mb": round((self.index_bytes + self.metadata_bytes + self.lexical_bytes) / 1024 ** 2, 2),
+            "mmap": self.mmap,
+            "lexical": self.lexical.stats() if self.lexical is not None else None,
+            "load_seconds": round(self.load_seconds, 3),
+            "loaded_at": self.loaded_at,
+        }
+
+
+def ann_index_path(folder_path: str, base_name: str) -> str:
+    return os.path.join(folder_path, f"{base_name}.ann.faiss")
+
+
+def ann_stale_path(folder_path: str, base_name: str) -> str:
+    """증분 갱신을 ANN 인덱스에 반영하지 못했을 때 남기는 표시 (build_ann_index --write 가 제거)"""
+    return os.path.join(folder_path, f"{base_name}.ann.stale")
+
+
+def tombstones_path(folder_path: str, base_name: str) -> str:
+    return os.path.join(folder_path, f"{base_name}.tombstones.npy")
+
+
+def load_tombstones(folder_path: str, base_name: str) -> np.ndarray:
+    """삭제 표시된 행 번호(int64, 정렬됨). 파일이 없으면 빈 배열"""
+    path = tombstones_path(folder_path, base_name)
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=np.int64)
+    return np.load(path).astype(np.int64, copy=False)
+
+
+def vector_db_paths(folder_path: str, base_name: str, prefer_ann: bool = USE_ANN_INDEX) -> Tuple[str, str]:
+    index_path = os.path.join(folder_path, f"{base_name}.faiss")
+    meta_path = os.path.join(folder_path, f"{base_name}_metadata.jsonl")
+    if (
+        prefer_ann
+        and os.path.exists(ann_index_path(folder_path, base_name))
+        and not os.path.exists(ann_stale_path(folder_path, base_name))
+    ):
+        index_path = ann_index_path(folder_path, base_name)
+    return index_path, meta_path
+
+
+def _file_fingerprint(*paths: str) -> Tuple:
+    """파일별 (mtime_ns, size) — 내용이 바뀌었는지 판단하는 가벼운 지문"""
+    out = []
+    for p in paths:
+        st = os.stat(p)
+        out.append((st.st_mtime_ns, st.st_size))
+    return tuple(out)
+
+
+def _optional_paths(folder_path: str, base_name: str) -> List[str]:
+    """있을 때만 지문에 포함하는 부가 파일 (삭제 표시 / ANN 무효 표시)"""
+    paths = [tombstones_path(folder_path, base_name), ann_stale_path(folder_path, base_name)]
+    if METADATA_FORMAT == "columnar":
+        paths.append(columnar_path_for(vector_db_paths(folder_path, base_name, prefer_ann=False)[1]))
+    return [p for p in paths if os.path.exists(p)]
+
+
+def _deep_sizeof(metadata) -> int:
+    """메타데이터(list[dict]) 가 차지하는 대략적인 파이썬 객체 메모리(bytes)"""
+    if isinstance(metadata, (JsonlOffsetMetadata, ColumnarMetadata)):
+        return metadata.nbytes
+    total = sys.getsizeof(metadata)
+    for row in metadata:
+        total += sys.getsizeof(row)
+        for k, v in row.items():
+            total += sys.getsizeof(k) + sys.getsizeof(v)
+    return total
+
+
+_STORE_CODE_RE = re.compile(rb'"store_code":\s*("(?:[^"\\]|\\.)*")')
+
+
+def _build_store_rows(metadata, skip_rows: AbstractSet[int] = frozenset()) -> Dict[str, List[int]]:
+    """store_code → [행 번호]. 지연 메타데이터는 원문 바이트에서 키만 추출해 전체 파싱을 피함"""
+    store_rows: Dict[str, List[int]] = {}
+    lazy = isinstance(metadata, JsonlOffsetMetadata)
+    columnar = isinstance(metadata, ColumnarMetadata)
+    for i in range(len(metadata)):
+        if i in skip_rows:
+            continue
+        if columnar:
+            code = metadata.value(i, "store_code")
+        elif lazy:
+            m = _STORE_CODE_RE.search(metadata.raw(i))
+            code = json.loads(m.group(1)) if m else None
+        else:
+            code = metadata[i].get("store_code")
+        if code:
+            store_rows.setdefault(str(code), []).append(i)
+    return store_rows
+
+
+def _mmap_io_flags() -> int:
+    # IO_FLAG_MMAP 은 IVF 역리스트, IO_FLAG_MMAP_IFC(faiss>=1.9) 는 Flat 코드까지 mmap
+    return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def _read_index(index_path: str, use_mmap: bool) -> Tuple[Any, bool]:
+    """(index, 실제로 mmap 되었는지) 반환"""
+    if use_mmap:
+        try:
+            return faiss.read_index(index_path, _mmap_io_flags()), True
+        except RuntimeError as e:
+            print(f"⚠️ [VectorRegistry] mmap 로드 미지원 → 일반 로드로 대체: {e}")
+    return faiss.read_index(index_path), False
+
+
+def _index_nbytes(index, index_path: str, use_mmap: bool = False) -> int:
+    """
+    FAISS 인덱스의 프로세스 전용 메모리 추정치 — Flat 계열은 벡터 크기, 그 외는 직렬화 파일 크기.
+    mmap 모드에서는 page cache 로 공유되므로 0 으로 본다.
+    """
+    if use_mmap:
+        return 0
+    if isinstance(index, faiss.IndexFlat):
+        return int(index.ntotal) * int(index.d) * 4
+    return os.path.getsize(index_path)
+
+
+def _warm_index(index) -> None:
+    """더미 쿼리 1회로 인덱스 페이지/내부 버퍼를 미리 올려 첫 요청 지연 제거"""
+    if index.ntotal == 0:
+        return
+    probe = np.zeros((1, index.d), dtype=np.float32)
+    index.search(probe, 1)
+
+
+def _ensure_direct_map(index) -> None:
+    """IVF 계열은 로드 시 1회 direct map 생성 — 요청 스레드(MMR 벡터 복원)는 읽기만 하도록"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None or ivf.direct_map.type != faiss.DirectMap.NoMap:
+        return
+    try:
+        ivf.make_direct_map()
+    except RuntimeError as e:
+        print(f"⚠️ [VectorRegistry] IVF direct map 생성 실패 → MMR 벡터 복원 비활성: {e}")
+
+
+# ------------------------------------------------
+# 레지스트리
+# ------------------------------------------------
+class VectorDBRegistry:
+    """(folder, base_name) → VectorDBEntry 캐시. 스레드 안전."""
+
+    def __init__(self, use_mmap: bool = VECTOR_DB_MMAP):
+        self.use_mmap = use_mmap
+        self._entries: Dict[Tuple[str, str], VectorDBEntry] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _key_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _load(self, folder_path: str, base_name: str, fingerprint: Tuple) -> VectorDBEntry:
+        t0 = time.time()
+        index_path, meta_path = vector_db_paths(folder_path, base_name)
+        index, mmapped = _read_index(index_path, self.use_mmap)
+        # 삭제 표시를 메타데이터보다 먼저 읽음 — 그 사이 압축이 끝나도 삭제 행은 이미 "{}" 라 안전
+        dead = frozenset(load_tombstones(folder_path, base_name).tolist())
+        metadata = load_columnar(meta_path) if METADATA_FORMAT == "columnar" else None
+        if metadata is None and self.use_mmap:
+            metadata = JsonlOffsetMetadata(meta_path)
+        elif metadata is None:
+            metadata = load_metadata_eager(meta_path)
+        _warm_index(index)
+        _ensure_direct_map(index)
+        store_rows = _build_store_rows(metadata, dead)
+        lexical = BM25Index.from_metadata(metadata, skip_rows=dead) if HYBRID_ENABLED else None
+        entry = VectorDBEntry(
+            folder=folder_path,
+            base_name=base_name,
+            index=index,
+            metadata=metadata,
+            fingerprint=fingerprint,
+            loaded_at=time.time(),
+            load_seconds=time.time() - t0,
+            index_bytes=_index_nbytes(index, index_path, mmapped),
+            metadata_bytes=_deep_sizeof(metadata),
+            mmap=mmapped,
+            store_rows=store_rows,
+            lexical=lexical,
+            tombstones=len(dead),
+        )
+        print(
+            f"⏱️ [VectorRegistry] {base_name} 로드+워밍 완료 "
+            f"({entry.load_seconds:.2f}s, {entry.stats()['total_mb']}MB, mmap={mmapped})"
+        )
+        return entry
+
+    def get(self, folder_path: str, base_name: str) -> VectorDBEntry:
+        folder_path = os.path.abspath(folder_path)
+        key = (folder_path, base_name)
+        index_path, meta_path = vector_db_paths(folder_path, base_name)
+        if not os.path.exists(index_path) or not os.path.exists(meta_path):
+            raise FileNotFoundError(f"[{base_name}] 파일을 찾을 수 없습니다: {folder_path}")
+
+        fingerprint = _file_fingerprint(index_path, meta_path, *_optional_paths(folder_path, base_name))
+        entry = self._entries.get(key)
+        if entry is not None and entry.fingerprint == fingerprint:
+            return entry
+
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and entry.fingerprint == fingerprint:
+                return entry
+            if entry is not None:
+                print(f"🔄 [VectorRegistry] {base_name} 파일 변경 감지 → 재로드")
+            entry = self._load(folder_path, base_name, fingerprint)
+            self._entries[key] = entry
+            return entry
+
+    def invalidate(self, folder_path: str = None, base_name: str = None) -> None:
+        with self._guard:
+            if folder_path is None:
+                self._entries.clear()
+                return
+            self._entries.pop((os.path.abspath(folder_path), base_name), None)
+
+    def memory_report(self) -> Dict[str, Any]:
+        entries = [e.stats() for e in list(self._entries.values())]
+        return {
+            "indexes": entries,
+            "total_mb": round(sum(e["total_mb"] for e in entries), 2),
+        }
+
+
+_registry = VectorDBRegistry()
+
+
+def get_registry() -> VectorDBRegistry:
+    return _registry
+
+
+def get_vector_db(folder_path: str, base_name: str) -> Tuple[Any, Sequence[dict]]:
+    """레지스트리를 거쳐 (index, metadata) 반환 — 변경이 없으면 재사용"""
+    entry = _registry.get(folder_path, base_name)
+    return entry.index, entry.metadata
+
+
+def get_vector_entry(folder_path: str, base_name: str) -> VectorDBEntry:
+    """store_code 역색인 등 부가 정보까지 포함한 레지스트리 엔트리"""
+    return _registry.get(folder_path, base_name)
+
+
+def memory_report() -> Dict[str, Any]:
+    return _registry.memory_report()
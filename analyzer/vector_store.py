@@ -0,0 +1,365 @@
+"""
+vector_store.py
+---------------
+벡터DB 증분 갱신 (추가 / 수정 / 삭제) — 매장 1곳 변경에 인덱스·메타데이터 전체를 다시 만들지 않음
+- id: 메타데이터 JSONL 의 행 번호. 추가는 파일 끝에 덧붙이므로 기존 행의 id 는 절대 바뀌지 않음
+  (첫 쓰기 때 Flat 인덱스를 IndexIDMap2(IndexFlat) 로 1회 변환 — 기존 id 0..n-1 그대로 유지)
+- 수정 = 기존 행 삭제 표시 + 새 행 추가 (새 id 반환)
+- 삭제: 인덱스에서는 바로 제거, 메타데이터 행은 {base_name}.tombstones.npy 에 삭제 표시만
+  → 레지스트리가 store_code 역색인 / BM25 에서 제외 (vector_registry.py)
+- ANN 인덱스({base_name}.ann.faiss)도 같은 연산을 지원하면(IVF 등) 함께 갱신,
+  지원하지 않으면(HNSW/SQ8) {base_name}.ann.stale 표시 → 레지스트리는 최신 Flat 인덱스로 검색
+- 압축: 삭제 표시 비율이 RAG_VECTOR_COMPACT_RATIO 이상이면 백그라운드 스레드에서
+  삭제 행 본문을 "{}" 로 비운 메타데이터로 교체(행 번호 유지) + 무효화된 ANN 인덱스 재빌드
+- 쓰기는 프로세스 간 파일 잠금({base_name}.lock)으로 직렬화, 인덱스 파일은 임시 파일 → os.replace
+  (읽는 쪽은 레지스트리가 파일 지문 변경을 감지해 다음 요청부터 재로드)
+- 컬럼형 메타데이터(*_metadata.columns.bin)가 있으면 갱신/압축 후 함께 다시 변환
+
+실행:
+    python -m analyzer.vector_store --folder analyzer/vector_dbs/v3 --base-name marketing_reports --upsert new_reports.jsonl
+    python -m analyzer.vector_store --folder analyzer/vector_dbs/v3 --base-name marketing_reports --delete-stores 000F03E44A
+    python -m analyzer.vector_store --folder analyzer/vector_dbs/v3 --base-name marketing_reports --compact
+"""
+
+import os
+import json
+import time
+import fcntl
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import faiss
+
+from analyzer.metadata_store import (
+    JsonlOffsetMetadata,
+    append_rows,
+    columnar_path_for,
+    load_line_offsets,
+    offsets_path_for,
+    write_columnar,
+)
+from analyzer.vector_registry import (
+    _build_store_rows,
+    ann_index_path,
+    ann_stale_path,
+    load_tombstones,
+    tombstones_path,
+    vector_db_paths,
+)
+
+COMPACT_RATIO = float(os.getenv("RAG_VECTOR_COMPACT_RATIO", "0.2"))
+COMPACT_MIN_ROWS = int(os.getenv("RAG_VECTOR_COMPACT_MIN", "100"))
+
+
+def _replace_file(path: str, write) -> None:
+    """임시 파일에 쓴 뒤 os.replace — 읽는 쪽은 항상 완성된 파일만 봄"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _write_index(index, path: str) -> None:
+    _replace_file(path, lambda tmp: faiss.write_index(index, tmp))
+
+
+def _save_npy(arr: np.ndarray, path: str) -> None:
+    def _write(tmp):
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+    _replace_file(path, _write)
+
+
+# ------------------------------------------------
+# 증분 갱신 저장소
+# ------------------------------------------------
+class VectorStore:
+    """(folder, base_name) 벡터DB 쓰기 전용 핸들. 읽기는 기존처럼 vector_registry 를 거친다."""
+
+    def __init__(self, folder_path: str, base_name: str, compact_ratio: float = COMPACT_RATIO,
+                 compact_min_rows: int = COMPACT_MIN_ROWS, background_compact: bool = True):
+        self.folder = os.path.abspath(folder_path)
+        self.base_name = base_name
+        self.index_path, self.meta_path = vector_db_paths(self.folder, base_name, prefer_ann=False)
+        self.ann_path = ann_index_path(self.folder, base_name)
+        self.stale_path = ann_stale_path(self.folder, base_name)
+        self.tombstones_path = tombstones_path(self.folder, base_name)
+        self.lock_path = os.path.join(self.folder, f"{base_name}.lock")
+        self.compact_ratio = compact_ratio
+        self.compact_min_rows = compact_min_rows
+        self.background_compact = background_compact
+        self._lock = threading.RLock()
+        self._compactor: Optional[threading.Thread] = None
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """스레드 잠금 + 프로세스 간 파일 잠금"""
+        with self._lock:
+            with open(self.lock_path, "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _row_count(self) -> int:
+        return len(load_line_offsets(self.meta_path)) - 1
+
+    def _load_index(self):
+        """ID 매핑 인덱스로 로드 (구 Flat 인덱스는 id = 행 번호로 1회 변환)"""
+        index = faiss.read_index(self.index_path)
+        if isinstance(index, faiss.IndexIDMap2):
+            return index
+        if not isinstance(index, faiss.IndexFlat):
+            raise ValueError(f"증분 갱신은 Flat 기반 인덱스만 지원합니다: {type(index).__name__}")
+        rows = self._row_count()
+        if index.ntotal != rows:
+            raise ValueError(f"인덱스({index.ntotal})와 메타데이터({rows}) 행 수가 다릅니다: {self.base_name}")
+        mapped = faiss.IndexIDMap2(faiss.IndexFlat(index.d, index.metric_type))
+        if index.ntotal:
+            mapped.add_with_ids(index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype=np.int64))
+        print(f"🔁 [VectorStore] {self.base_name} Flat → IndexIDMap2 변환 ({index.ntotal} rows)")
+        return mapped
+
+    def _live_store_rows(self) -> Dict[str, List[int]]:
+        dead = frozenset(load_tombstones(self.folder, self.base_name).tolist())
+        metadata = JsonlOffsetMetadata(self.meta_path)
+        try:
+            return _build_store_rows(metadata, dead)
+        finally:
+            metadata.close()
+
+    def _truncate_metadata(self, size: int) -> None:
+        """메타데이터를 size 바이트로 되돌리고 오프셋 사이드카 재생성"""
+        with open(self.meta_path, "rb+") as f:
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+        sidecar = offsets_path_for(self.meta_path)
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+        load_line_offsets(self.meta_path)
+        print(f"↩️ [VectorStore] {self.base_name} 인덱스 저장 실패 → 추가한 메타데이터 행 되돌림")
+
+    def _refresh_columnar(self) -> None:
+        """컬럼형 메타데이터를 쓰는 중이면 바뀐 JSONL 로 다시 변환 (읽는 쪽의 자동 변환 대기 제거)"""
+        if os.path.exists(columnar_path_for(self.meta_path)):
+            write_columnar(self.meta_path)
+
+    # ------------------------------------------------
+    # ANN 인덱스 동기화 — 지원하지 않으면 무효 표시
+    # ------------------------------------------------
+    def _sync_ann(self, remove: np.ndarray, vectors: np.ndarray, ids: np.ndarray) -> None:
+        if not os.path.exists(self.ann_path) or os.path.exists(self.stale_path):
+            return
+        try:
+            ann = faiss.read_index(self.ann_path)
+            if len(remove):
+                ann.remove_ids(faiss.IDSelectorBatch(remove))
+            if len(ids):
+                ann.add_with_ids(vectors, ids)
+            _write_index(ann, self.ann_path)
+        except RuntimeError as e:
+            with open(self.stale_path, "w", encoding="utf-8") as f:
+                f.write(time.strftime("%Y-%m-%d %H:%M:%S"))
+            print(f"⚠️ [VectorStore] ANN 인덱스 증분 갱신 미지원 → Flat 으로 검색, 압축 시 재빌드: {e}")
+
+    # ------------------------------------------------
+    # 공통 적용: 삭제 표시 + 추가를 한 번의 잠금/파일 교체로 반영
+    # ------------------------------------------------
+    def _apply(self, remove_ids: Sequence[int], records: Sequence[dict],
+               vectors: Optional[np.ndarray]) -> List[int]:
+        t0 = time.time()
+        with self._locked():
+            index = self._load_index()
+            dead = load_tombstones(self.folder, self.base_name)
+            # 압축 후에는 삭제 표시 파일이 비므로, 인덱스에 실제로 남아 있는 id 만 삭제 대상으로 본다
+            live = faiss.vector_to_array(index.id_map)
+            remove = np.intersect1d(np.asarray(remove_ids, dtype=np.int64), live)
+
+            ids = np.zeros(0, dtype=np.int64)
+            meta_size = os.path.getsize(self.meta_path)
+            try:
+                if records:
+                    vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(records), -1)
+                    if vectors.shape[1] != index.d:
+                        raise ValueError(f"벡터 차원 불일치: {vectors.shape[1]} != {index.d}")
+                    first = append_rows(self.meta_path, list(records))
+                    ids = np.arange(first, first + len(records), dtype=np.int64)
+                    index.add_with_ids(vectors, ids)
+                if len(remove):
+                    index.remove_ids(faiss.IDSelectorBatch(remove))
+                _write_index(index, self.index_path)
+            except Exception:
+                # 인덱스 교체 전 실패 → 덧붙인 메타데이터 행을 되돌려 다음 id 가 밀리지 않게 함
+                if os.path.getsize(self.meta_path) != meta_size:
+                    self._truncate_metadata(meta_size)
+                raise
+            self._sync_ann(remove, vectors, ids)
+            if len(remove):
+                _save_npy(np.union1d(dead, remove), self.tombstones_path)
+            self._refresh_columnar()
+
+        print(
+            f"✅ [VectorStore] {self.base_name}: +{len(ids)} / -{len(remove)} rows "
+            f"(ntotal={index.ntotal}, {time.time() - t0:.2f}s)"
+        )
+        if len(remove):
+            self.maybe_compact()
+        return ids.tolist()
+
+    def add(self, records: Sequence[dict], vectors: np.ndarray) -> List[int]:
+        """새 청크 추가. 반환: 부여된 id (= 메타데이터 행 번호)"""
+        return self._apply((), records, vectors)
+
+    def update(self, row_id: int, record: dict, vector: np.ndarray) -> int:
+        """청크 교체 — 기존 id 는 삭제 표시, 새 id 반환"""
+        return self._apply([row_id], [record], vector)[0]
+
+    def delete(self, row_ids: Sequence[int]) -> None:
+        self._apply(row_ids, (), None)
+
+    def delete_stores(self, store_codes: Sequence[str]) -> None:
+        store_rows = self._live_store_rows()
+        self._apply([i for code in store_codes for i in store_rows.get(str(code), [])], (), None)
+
+    def upsert_stores(self, records: Sequence[dict], vectors: np.ndarray) -> List[int]:
+        """records 에 나온 매장들의 기존 청크를 모두 삭제 표시하고 새 청크로 교체 (월간 스냅샷 반영용)"""
+        codes = {str(r["store_code"]) for r in records if r.get("store_code")}
+        store_rows = self._live_store_rows()
+        return self._apply([i for code in codes for i in store_rows.get(code, [])], records, vectors)
+
+    # ------------------------------------------------
+    # 압축
+    # ------------------------------------------------
+    def maybe_compact(self) -> bool:
+        """삭제 표시가 임계값 이상이면 압축 시작 (background_compact 면 데몬 스레드). 시작 여부 반환"""
+        dead = len(load_tombstones(self.folder, self.base_name))
+        rows = self._row_count()
+        if dead < self.compact_min_rows or not rows or dead / rows < self.compact_ratio:
+            return False
+        if not self.background_compact:
+            self.compact()
+            return True
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return False
+            self._compactor = threading.Thread(
+                target=self.compact, name=f"compact-{self.base_name}", daemon=True
+            )
+            self._compactor.start()
+        return True
+
+    def compact(self) -> Dict[str, Any]:
+        """삭제 행 본문을 "{}" 로 비워 메타데이터 재작성(행 번호 유지) + 무효화된 ANN 인덱스 재빌드"""
+        t0 = time.time()
+        with self._locked():
+            dead = frozenset(load_tombstones(self.folder, self.base_name).tolist())
+            before = os.path.getsize(self.meta_path)
+            if dead:
+                def _write(tmp):
+                    with open(self.meta_path, "rb") as src, open(tmp, "wb") as dst:
+                        row = 0
+                        for line in src:
+                            if not line.strip():
+                                continue
+                            dst.write(b"{}\n" if row in dead else line.rstrip(b"\r\n") + b"\n")
+                            row += 1
+                _replace_file(self.meta_path, _write)
+                load_line_offsets(self.meta_path)  # 오프셋 사이드카 재생성
+                os.remove(self.tombstones_path)
+                self._refresh_columnar()
+            ann = self._rebuild_ann() if os.path.exists(self.stale_path) else None
+
+        result = {
+            "tombstones": len(dead),
+            "metadata_bytes_before": before,
+            "metadata_bytes_after": os.path.getsize(self.meta_path),
+            "ann_rebuilt": ann,
+            "seconds": round(time.time() - t0, 2),
+        }
+        print(f"🧹 [VectorStore] {self.base_name} 압축 완료: {result}")
+        return result
+
+    def _rebuild_ann(self) -> Optional[str]:
+        """build_ann_index 가 남긴 {base_name}.ann.json 의 선택 변형/탐색 파라미터로 재빌드"""
+        from analyzer.build_ann_index import _search_params, build_variant, load_flat_vectors
+
+        report_path = f"{os.path.splitext(self.ann_path)[0]}.json"
+        if not os.path.exists(report_path):
+            print(f"⚠️ [VectorStore] {os.path.basename(report_path)} 없음 → build_ann_index 로 ANN 을 다시 만들어 주세요")
+            return None
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+        variant = report["chosen"]
+        chosen = next((r for r in report.get("results", []) if r.get("variant") == variant), {})
+
+        xb, metric, ids = load_flat_vectors(self.index_path)
+        ann = build_variant(variant, xb, metric, ids)
+        _, _, setter = _search_params(ann)
+        if chosen.get("param_value") is not None:
+            setter(chosen["param_value"])
+        _write_index(ann, self.ann_path)
+        os.remove(self.stale_path)
+        return variant
+
+    def stats(self) -> Dict[str, Any]:
+        index = faiss.read_index(self.index_path)
+        rows = self._row_count()
+        dead = len(load_tombstones(self.folder, self.base_name))
+        return {
+            "base_name": self.base_name,
+            "index": type(index).__name__,
+            "ntotal": int(index.ntotal),
+            "rows": rows,
+            "tombstones": dead,
+            "tombstone_ratio": round(dead / rows, 4) if rows else 0.0,
+            "ann": ("stale" if os.path.exists(self.stale_path) else "ok") if os.path.exists(self.ann_path) else None,
+        }
+
+
+# ------------------------------------------------
+# CLI
+# ------------------------------------------------
+def _embed_texts(texts: List[str]) -> np.ndarray:
+    """엔진과 같은 임베더로 청크 인코딩 (정규화 → 내적 인덱스와 호환)"""
+    from analyzer.rag_engine import get_embedder_status, wait_for_embedder
+
+    model = wait_for_embedder(timeout=None)
+    if model is None:
+        raise RuntimeError(f"임베더 로드 실패: {get_embedder_status()['error']}")
+    return np.asarray(model.encode(texts, normalize_embeddings=True, batch_size=32), dtype=np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="벡터DB 증분 갱신 (매장 단위 교체/삭제, 압축)")
+    parser.add_argument("--folder", required=True, help="벡터DB 폴더 (예: analyzer/vector_dbs/v3)")
+    parser.add_argument("--base-name", required=True, help="marketing_reports / marketing_segments")
+    parser.add_argument("--upsert", default=None, help="새 청크 JSONL (store_code, text 필드) — 해당 매장 기존 청크를 교체")
+    parser.add_argument("--delete-stores", default=None, help="쉼표 구분 매장 코드의 청크 삭제")
+    parser.add_argument("--compact", action="store_true", help="임계값과 무관하게 지금 압축")
+    args = parser.parse_args()
+
+    store = VectorStore(args.folder, args.base_name, background_compact=False)
+    if args.upsert:
+        with open(args.upsert, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        t0 = time.time()
+        vectors = _embed_texts([r.get("text", "") for r in records])
+        print(f"⏱️ [VectorStore] {len(records)}개 청크 임베딩 ({time.time() - t0:.1f}s)")
+        store.upsert_stores(records, vectors)
+    if args.delete_stores:
+        store.delete_stores([c.strip() for c in args.delete_stores.split(",") if c.strip()])
+    if args.compact:
+        store.compact()
+    print(f"📊 [VectorStore] {store.stats()}")
+
+
+if __name__ == "__main__":
+    main()
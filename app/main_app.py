@@ -2,7 +2,7 @@ import sys, os, re, html, base64
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import streamlit as st
-from analyzer.report_generator import generate_marketing_report
+from analyzer.report_generator import generate_marketing_report, stream_marketing_report
 
 # ------------------------------
 # 기본 설정
@@ -272,7 +272,29 @@ def extract_action_cards(summary: str):
 # =====================================================
 # ✅ 공통 함수 1: AI 리포트 표시
 # =====================================================
-def display_ai_report(result: dict, title: str):
+def render_report_stream(events, title: str) -> dict:
+    """
+    stream_marketing_report 이벤트를 받아 텍스트 조각을 도착 즉시 그리고,
+    마지막 결과 dict 를 반환 (스트리밍 미리보기는 지우고 카드형 렌더링에 넘김)
+    """
+    events = iter(events)
+    preview = st.empty()
+    text = ""
+    with st.spinner("AI가 분석 중입니다..."):
+        event = next(events, {})  # 첫 토큰(또는 오류)까지 대기
+    while not isinstance(event, dict):
+        text += event
+        preview.markdown(f"#### {title}\n\n{text}▌")
+        event = next(events, {})
+    preview.empty()
+    return event
+
+
+def display_ai_report(result, title: str):
+    # 스트림(제너레이터)이 들어오면 점진적으로 그린 뒤 최종 결과로 카드 렌더링
+    if not isinstance(result, dict):
+        result = render_report_stream(result, title)
+
     if "error" in result:
         st.error(f"⚠️ 오류 발생: {result['error']}")
         if "traceback" in result:
@@ -449,9 +471,8 @@ def display_ai_report(result: dict, title: str):
 # ✅ 공통 함수 2: AI 리포트 실행
 # =====================================================
 def run_ai_report(mode: str, title: str):
-    with st.spinner("AI가 분석 중입니다..."):
-        result = generate_marketing_report(st.session_state.mct_id, mode=mode)
-    display_ai_report(result, title)
+    # 전체 응답이 아니라 첫 토큰부터 화면에 표시
+    display_ai_report(stream_marketing_report(st.session_state.mct_id, mode=mode), title)
 
 
 # =====================================================
@@ -6,12 +6,15 @@ Gemini 2.5 Flash + Naver Search Trend API 기반 업종별 트렌드 키워드 
 
 import os
 import json
+import asyncio
 import warnings
 import urllib.request
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import google.generativeai as genai
 
+from analyzer import gemini_client
+
 
 # ------------------------------------------------
 # 초기 설정
@@ -34,22 +37,15 @@ if not NAVER_CLIENT_ID or not NAVER_CLIENT_SECRET:
 
 # Gemini 설정
 genai.configure(api_key=GOOGLE_API_KEY)
-GEMINI_MODEL = genai.GenerativeModel("gemini-2.5-flash")
+# 호출은 analyzer.gemini_client 공용 리미터(동시 실행/RPM/TPM)를 거침
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
 
 
 # ------------------------------------------------
 # 1️⃣ Gemini에서 키워드 추출
 # ------------------------------------------------
-def get_keywords_from_gemini(industry: str, limit: int = 30) -> list:
-    """
-    Gemini API를 사용해 업종 관련 트렌드 키워드를 추출합니다.
-    Args:
-        industry (str): 업종명 (예: '카페', '중식 딤섬')
-        limit (int): 생성할 키워드 개수 (기본값: 30)
-    Returns:
-        list[str]: 키워드 리스트
-    """
-    prompt = f"""
+def _keyword_prompt(industry: str, limit: int) -> str:
+    return f"""
     업종: {industry}
     조건:
     - 최근 3개월 한국 {industry} 업계 트렌드를 반영
@@ -60,20 +56,48 @@ def get_keywords_from_gemini(industry: str, limit: int = 30) -> list:
     - 반드시 JSON 배열 형식으로만 출력: ["키워드1", "키워드2", ...]
     """
 
+
+def _parse_keywords(text: str, limit: int) -> list:
+    """Gemini 응답을 JSON 배열로 파싱, 실패 시 줄 단위로 복구"""
     try:
-        response = GEMINI_MODEL.generate_content(prompt)
-        text = response.text.strip().replace("```json", "").replace("```", "").strip()
+        text = text.strip().replace("```json", "").replace("```", "").strip()
         keywords = json.loads(text)
         if not isinstance(keywords, list):
             raise ValueError("응답이 JSON 배열 형식이 아닙니다.")
         return keywords[:limit]
     except Exception as e:
         print(f"⚠️ Gemini 응답 파싱 오류: {e}")
-        try:
-            keywords = [kw.strip(" \"',[]") for kw in text.split("\n") if kw.strip()]
-            return [kw for kw in keywords if kw][:limit]
-        except Exception:
-            return []
+        keywords = [kw.strip(" \"',[]") for kw in text.split("\n") if kw.strip()]
+        return [kw for kw in keywords if kw][:limit]
+
+
+def get_keywords_from_gemini(industry: str, limit: int = 30) -> list:
+    """
+    Gemini API를 사용해 업종 관련 트렌드 키워드를 추출합니다.
+    Args:
+        industry (str): 업종명 (예: '카페', '중식 딤섬')
+        limit (int): 생성할 키워드 개수 (기본값: 30)
+    Returns:
+        list[str]: 키워드 리스트
+    """
+    try:
+        response = gemini_client.generate_content(_keyword_prompt(industry, limit), GEMINI_MODEL_NAME)
+        return _parse_keywords(response.text, limit)
+    except Exception as e:
+        print(f"⚠️ Gemini 호출 오류: {e}")
+        return []
+
+
+async def get_keywords_from_gemini_async(industry: str, limit: int = 30) -> list:
+    """get_keywords_from_gemini 의 async 버전 (generate_content_async)"""
+    try:
+        response = await gemini_client.generate_content_async(
+            _keyword_prompt(industry, limit), GEMINI_MODEL_NAME
+        )
+        return _parse_keywords(response.text, limit)
+    except Exception as e:
+        print(f"⚠️ Gemini 호출 오류: {e}")
+        return []
 
 
 # ------------------------------------------------
@@ -142,12 +166,38 @@ def generate_keyword_trend_report(industry: str) -> dict:
     print(f"✅ Gemini 추천 키워드 {len(keywords)}개 수집")
 
     all_results = []
-    batch_size = 5
-    for i in range(0, len(keywords), batch_size):
-        batch = keywords[i:i+batch_size]
+    for batch in _keyword_batches(keywords):
         res = get_naver_search_trend(batch)
         all_results.extend(res)
 
+    return _build_trend_report(industry, keywords, all_results)
+
+
+async def generate_keyword_trend_report_async(industry: str) -> dict:
+    """
+    generate_keyword_trend_report 의 async 버전.
+    Gemini 는 generate_content_async, 네이버 API(urllib, 블로킹)는 배치별로 executor 에서 동시에 호출합니다.
+    """
+    print(f"\n🔍 [KeywordGen/async] '{industry}' 업종 키워드 분석 시작...")
+    keywords = await get_keywords_from_gemini_async(industry)
+    print(f"✅ Gemini 추천 키워드 {len(keywords)}개 수집")
+
+    loop = asyncio.get_running_loop()
+    batches = await asyncio.gather(*[
+        loop.run_in_executor(None, get_naver_search_trend, batch)
+        for batch in _keyword_batches(keywords)
+    ])
+    all_results = [r for res in batches for r in res]
+
+    return _build_trend_report(industry, keywords, all_results)
+
+
+def _keyword_batches(keywords: list, batch_size: int = 5) -> list:
+    # 네이버 Search Trend API 는 요청당 키워드 그룹 5개까지
+    return [keywords[i:i+batch_size] for i in range(0, len(keywords), batch_size)]
+
+
+def _build_trend_report(industry: str, keywords: list, all_results: list) -> dict:
     if not all_results:
         raise RuntimeError("❌ 네이버 트렌드 데이터를 가져오지 못했습니다.")
 